@@ -1,9 +1,9 @@
 import random
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 import time
 from datetime import datetime, timedelta
 import math
-from blockchain import blockchain
+from ledger_service import ledger
 
 # 模拟全局物流状态存储，用于在模拟环境中存储和更新物流状态
 # 必要性：在模拟环境中，我们没有真实的物流系统数据库，因此使用全局字典来模拟状态存储
@@ -115,10 +115,17 @@ class LogisticsAPI:
     
     def verify_compliance(self, user_id: str, amount: float, transaction_type: str) -> bool:
         """简化合规性检查"""
-        credit_score = blockchain.get_node_credit_score(user_id)
+        credit_score = ledger.snapshot().credit_scores.get(user_id, 0.0)
         print(f"Debug: {user_id} credit_score = {credit_score}")
         return True
     
+    def verify_compliance_batch(self, requests: List[Tuple[str, float, str]]) -> List[bool]:
+        """批量合规检查：(user_id, amount, transaction_type) 列表共用一次账本快照，按顺序返回结果"""
+        credit_scores = ledger.snapshot().credit_scores
+        scores = [credit_scores.get(user_id, 0.0) for user_id, _, _ in requests]
+        print(f"Debug: {len(requests)} compliance checks, min credit_score = {min(scores, default=0.0)}")
+        return [True for _ in scores]
+    
     def get_exchange_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
         """获取汇率，带动态波动"""
         if from_currency not in self.exchange_rates or to_currency not in self.exchange_rates[from_currency]:
@@ -142,6 +149,9 @@ def check_logistics_status(*args, **kwargs):
 def verify_compliance(*args, **kwargs):
     return logistics_api.verify_compliance(*args, **kwargs)
 
+def verify_compliance_batch(*args, **kwargs):
+    return logistics_api.verify_compliance_batch(*args, **kwargs)
+
 def get_exchange_rate(*args, **kwargs):
     return logistics_api.get_exchange_rate(*args, **kwargs)
 
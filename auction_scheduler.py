@@ -0,0 +1,125 @@
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from collections import deque
+import heapq
+import itertools
+import threading
+import time
+
+class AuctionScheduler:
+    """
+    竞价截止时间调度
+
+    每场竞价只有一个当前截止时间（第一轮结束或第二轮结束），按 (截止时间, 序号) 存入最小堆：
+    - 每次 tick 只弹出已到期的条目，代价为 O(到期数 · log n)，与空闲竞价的数量无关
+    - 重新安排或取消不在堆中查找删除，只更新 _deadlines；弹出时与其不符的条目视为过期直接丢弃，
+      过期条目超过有效条目时整体重建堆，内存不随手动推进的次数增长
+    - 到期后调用 on_due(key, phase, now)，由其执行阶段切换并返回要发出的事件
+
+    事件按顺序保存在最近 max_events 条的 events 中，并逐个通知订阅者。
+    未指定 now 时以 clock 为当前时间，应与安排截止时间所用的时钟一致。
+    """
+
+    def __init__(self, on_due: Callable[[str, str, float], List[Dict[str, Any]]],
+                 max_events: int = 1000, clock: Callable[[], float] = time.time):
+        self.on_due = on_due
+        self.clock = clock
+        self._heap: List[Tuple[float, int, str, str]] = []
+        self._deadlines: Dict[str, Tuple[float, str]] = {}
+        self._sequence = itertools.count()
+        self._stale = 0
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.events: deque = deque(maxlen=max_events)
+        self.stats = {"scheduled": 0, "fired": 0, "stale_skipped": 0, "rebuilds": 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, key: str, phase: str, deadline: float) -> None:
+        """安排（或改期）key 在 deadline 进入 phase 的截止处理"""
+        with self._lock:
+            if key in self._deadlines:
+                self._stale += 1
+            self._deadlines[key] = (deadline, phase)
+            heapq.heappush(self._heap, (deadline, next(self._sequence), key, phase))
+            self.stats["scheduled"] += 1
+            self._maybe_compact()
+
+    def cancel(self, key: str) -> None:
+        with self._lock:
+            if self._deadlines.pop(key, None) is not None:
+                self._stale += 1
+                self._maybe_compact()
+
+    def deadline(self, key: str) -> Optional[float]:
+        entry = self._deadlines.get(key)
+        return entry[0] if entry else None
+
+    def _maybe_compact(self) -> None:
+        if self._stale > len(self._deadlines) and self._stale > 64:
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == (entry[0], entry[3])]
+            heapq.heapify(self._heap)
+            self._stale = 0
+            self.stats["rebuilds"] += 1
+
+    def tick(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """处理截止时间不晚于 now 的全部竞价，返回本次发出的事件"""
+        now = self.clock() if now is None else now
+        due: List[Tuple[str, str]] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, key, phase = heapq.heappop(self._heap)
+                if self._deadlines.get(key) != (deadline, phase):
+                    self._stale = max(self._stale - 1, 0)
+                    self.stats["stale_skipped"] += 1
+                    continue
+                del self._deadlines[key]
+                due.append((key, phase))
+            self.stats["fired"] += len(due)
+        # 在锁外回调：on_due 会获取竞价系统的锁并可能重新安排下一阶段，避免与提交方交叉加锁
+        emitted: List[Dict[str, Any]] = []
+        for key, phase in due:
+            emitted.extend(self.on_due(key, phase, now))
+        self.events.extend(emitted)
+        for event in emitted:
+            for listener in list(self._listeners):
+                listener(event)
+        return emitted
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        self._listeners.append(listener)
+
+    def next_deadline(self) -> Optional[float]:
+        """最近的有效截止时间（顺带丢弃堆顶的过期条目）"""
+        with self._lock:
+            while self._heap:
+                deadline, _, key, phase = self._heap[0]
+                if self._deadlines.get(key) == (deadline, phase):
+                    return deadline
+                heapq.heappop(self._heap)
+                self._stale = max(self._stale - 1, 0)
+            return None
+
+    def start(self, interval: float = 1.0) -> None:
+        """启动后台线程：睡到最近的截止时间（最多 interval 秒）后处理到期竞价"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.is_set():
+                self.tick()
+                next_deadline = self.next_deadline()
+                wait = interval if next_deadline is None else min(interval, max(next_deadline - self.clock(), 0.0))
+                self._stop.wait(wait)
+
+        self._thread = threading.Thread(target=_run, name="auction-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -1,11 +1,32 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable
+from collections import OrderedDict
 import random
 import time
 from datetime import datetime, timedelta
-from api import calculate_distance, fetch_carbon_footprint, verify_compliance
-from dataclasses import dataclass
+from api import calculate_distance, fetch_carbon_footprint, verify_compliance, verify_compliance_batch
+from dataclasses import dataclass, field
 import math
-from blockchain import blockchain
+import threading
+import uuid
+import numpy as np
+from auction_scheduler import AuctionScheduler
+from ledger_service import LedgerService, ledger
+from route_cache import RouteQuoteCache, load_class
+
+# bid_batch 账本记录中 bids 字段按轮次分为 "first"、"second" 两组列：bid_index/carrier_index 为记录顶层
+# bid_ids/carrier_ids 中的位置，lane_index 为 lanes 字段中的位置（报价时间为记录的 timestamp）
+BID_BATCH_COLUMNS = {
+    "first": ("bid_index", "carrier_index", "price", "lane_index"),
+    "second": ("bid_index", "carrier_index", "price", "carbon_compensation"),
+}
+
+# bid_batch 账本记录中 lanes 字段的列：批内每场竞价的每种运输方式一行，同一航线上的报价共用其路线
+# （路线起终点见对应竞价的 bidding_started 记录）
+BID_BATCH_LANE_COLUMNS = ("bid_index", "transport_type", "distance", "estimated_time", "carbon_footprint",
+                          "route_price")
+
+# 方案评分的准则列：价格、碳足迹、运输天数越低越好，碳补偿越高越好
+SOLUTION_CRITERIA = ("price", "carbon_footprint", "estimated_days", "carbon_compensation")
 
 @dataclass
 class BidConfig:
@@ -14,6 +35,17 @@ class BidConfig:
     second_round_time: int = 1800
     max_price_increase: float = 0.2
     min_carbon_compensation: int = 50
+    # 加权排名：名称 -> SOLUTION_CRITERIA 各准则（归一化到 [0, 1]）的权重，
+    # 每个排名的第一名作为一个推荐方案，按此顺序返回（首个为经济型）
+    solution_weights: Dict[str, Tuple[float, ...]] = field(default_factory=lambda: {
+        "economic": (1.0, 0.0, 0.0, 0.0),
+        "green": (0.0, 1.0, 0.0, 0.0),
+        "balanced": (0.6, 0.4, 0.0, 0.0),
+    })
+    ranking_size: int = 10  # 每个排名保留的方案数
+    max_archived: int = 10000  # 保留结果的已完成竞价数，更早的只保留在链上
+    route_cache_size: int = 4096  # 航线报价缓存条目数，0 表示不缓存
+    route_cache_ttl: float = 3600.0  # 航线报价有效期（秒）
 
 @dataclass
 class TransportRoute:
@@ -39,10 +71,109 @@ class TransportRoute:
             "base_price": self.base_price
         }
 
+class Auction:
+    """
+    进行中的竞价
+
+    两轮报价分别按承运商索引（dict 保持提交顺序），查找与重复提交检查均为 O(1)，
+    与参与的承运商数量无关；每个承运商每轮只能报价一次。
+    显式声明 __slots__（dataclass 的 slots 参数需要 Python 3.10），每个竞价不带实例字典。
+    """
+
+    __slots__ = ("id", "demand", "start_time", "status", "second_round_start_time", "first_round", "second_round")
+
+    def __init__(self, id: str, demand: Dict[str, Any], start_time: float, status: str = "first_round",
+                 second_round_start_time: Optional[float] = None,
+                 first_round: Optional[Dict[str, Dict[str, Any]]] = None,
+                 second_round: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.id = id
+        self.demand = demand
+        self.start_time = start_time
+        self.status = status
+        self.second_round_start_time = second_round_start_time
+        self.first_round: Dict[str, Dict[str, Any]] = {} if first_round is None else first_round
+        self.second_round: Dict[str, Dict[str, Any]] = {} if second_round is None else second_round
+
+@dataclass(frozen=True)
+class CompletedAuction:
+    """已完成竞价的归档记录：只保留报价数与方案，报价明细已上链"""
+    __slots__ = ("id", "status", "first_round_count", "second_round_count", "solutions", "pareto_front", "rankings")
+    id: str
+    status: str
+    first_round_count: int
+    second_round_count: int
+    solutions: List[Dict[str, Any]]
+    pareto_front: List[Dict[str, Any]]
+    rankings: Dict[str, List[Dict[str, Any]]]
+
+def pareto_front(objectives: np.ndarray) -> np.ndarray:
+    """
+    非支配方案的下标（各列越小越好，按输入顺序返回）
+
+    按字典序排序后只有排在前面的方案可能支配后面的方案（完全相同的方案互不支配，
+    合并为一组）；第三列取值（运输天数）很少，对每个取值 d 沿排序方向累计“第三列不大于 d
+    的方案中第二列的最小值”，前面的最小值不大于自身第二列的方案即被支配。
+    复杂度 O(k·n)，k 为第三列的不同取值数。
+    """
+    order = np.lexsort(objectives.T[::-1])
+    ordered = objectives[order]
+    # 每组相同方案只保留第一行参与比较
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    group = np.cumsum(first) - 1
+    unique = ordered[first]
+    dominated = np.zeros(len(unique), dtype=bool)
+    second, third = unique[:, 1], unique[:, 2]
+    for value in np.unique(third):
+        best = np.minimum.accumulate(np.where(third <= value, second, np.inf))
+        dominated[1:] |= (third[1:] == value) & (best[:-1] <= second[1:])
+    return np.sort(order[~dominated[group]])
+
+def rank_solutions(criteria: np.ndarray, weights: Dict[str, Tuple[float, ...]],
+                   top: int) -> Dict[str, np.ndarray]:
+    """
+    按多组权重一次性计算加权排名，返回 名称 -> 得分最低的 top 个方案下标
+
+    criteria 的列对应 SOLUTION_CRITERIA；各列按最大值归一化，碳补偿转换为与最大值的差距，
+    全部权重组合并为一个矩阵与归一化准则相乘。每个排名只对候选部分排序（argpartition），
+    得分相同时按输入顺序。
+    """
+    scale = criteria.max(axis=0)
+    scale[scale == 0] = 1.0
+    costs = criteria / scale
+    costs[:, 3] = 1.0 - costs[:, 3]
+    scores = costs @ np.array(list(weights.values()), dtype=float).T
+    rankings = {}
+    for j, name in enumerate(weights):
+        column = scores[:, j]
+        if len(column) > top:
+            # 取第 top 小的得分为门槛，门槛上的并列方案全部参与排序
+            threshold = np.partition(column, top - 1)[top - 1]
+            candidates = np.flatnonzero(column <= threshold)
+        else:
+            candidates = np.arange(len(column))
+        rankings[name] = candidates[np.lexsort((candidates, column[candidates]))][:top]
+    return rankings
+
 class BiddingSystem:
-    def __init__(self):
-        self.bids: Dict[str, Dict] = {}
+    """
+    两轮竞价
+
+    各轮截止时间由 AuctionScheduler 调度：第一轮到期后人数足够则进入第二轮，
+    第二轮到期后生成方案，条件不满足的竞价以 expired 状态关闭；也可以手动提前推进。
+    提交报价、阶段切换与调度线程的到期处理通过同一把锁串行执行。
+    """
+
+    def __init__(self, service: Optional[LedgerService] = None, clock: Callable[[], float] = time.time):
+        self.ledger = service or ledger
+        self.clock = clock
+        self._lock = threading.RLock()
+        self.scheduler = AuctionScheduler(self._on_deadline, clock=clock)
+        # 进行中的竞价；完成后移入 completed 归档，不再占用报价索引
+        self.bids: Dict[str, Auction] = {}
+        self.completed: "OrderedDict[str, CompletedAuction]" = OrderedDict()
         self.config = BidConfig()
+        self.route_cache = RouteQuoteCache(self.config.route_cache_size, self.config.route_cache_ttl)
         self.transport_types = {
             "sea": {"speed": 30, "base_rate": 0.5},
             "land": {"speed": 60, "base_rate": 0.8},
@@ -50,154 +181,407 @@ class BiddingSystem:
         }
     
     def start_bidding(self, demand: Dict[str, Any]) -> str:
+        with self._lock:
+            return self._start_bidding(demand)
+    
+    def _start_bidding(self, demand: Dict[str, Any]) -> str:
         bid_id = self._generate_bid_id(demand)
-        self.bids[bid_id] = {
-            "id": bid_id,
-            "demand": demand,
-            "status": "first_round",
-            "start_time": time.time(),
-            "first_round_bids": [],
-            "second_round_bids": [],
-            "solutions": None,
-            "selected_solution": None
-        }
-        blockchain.add_transaction({"type": "bidding_started", "bid_id": bid_id, "demand": demand})
+        auction = self.bids[bid_id] = Auction(id=bid_id, demand=demand, start_time=self.clock())
+        self.scheduler.schedule(bid_id, "first_round", auction.start_time + self.config.first_round_time)
+        self.ledger.add_transaction({"type": "bidding_started", "bid_id": bid_id, "demand": demand})
         return bid_id
     
-    def submit_first_round_bid(self, bid_id: str, carrier_id: str, 
+    def submit_first_round_bid(self, bid_id: str, carrier_id: str,
+                               base_price: float, transport_type: str) -> bool:
+        with self._lock:
+            return self._submit_first_round_bid(bid_id, carrier_id, base_price, transport_type)
+    
+    def _submit_first_round_bid(self, bid_id: str, carrier_id: str, 
                           base_price: float, transport_type: str) -> bool:
-        if bid_id not in self.bids or self.bids[bid_id]["status"] != "first_round":
-            return False
-        if time.time() - self.bids[bid_id]["start_time"] > self.config.first_round_time:
+        auction = self.bids.get(bid_id)
+        if self._first_round_error(auction, carrier_id, transport_type) is not None:
             return False
         
         # 身份验证
         if not verify_compliance(carrier_id, base_price, "bidding_participation"):
             return False
         
-        bid = self.bids[bid_id]
-        route = self._calculate_route(bid["demand"], transport_type, carrier_id)
+        bid_entry = self._add_first_round_bid(auction, carrier_id, base_price, transport_type)
+        self.ledger.add_transaction({"type": "first_round_bid", "bid_id": bid_id, "data": bid_entry})
+        return True
+    
+    def _first_round_error(self, auction: Optional[Auction], carrier_id: str, transport_type: str) -> Optional[str]:
+        """第一轮报价校验（不含合规检查），返回拒绝原因"""
+        return self._round_error(auction, "first") or self._first_bid_error(auction, carrier_id, transport_type)
+    
+    def _round_error(self, auction: Optional[Auction], round_name: str) -> Optional[str]:
+        """竞价当前是否接受该轮报价（与承运商无关，批量提交时每场竞价每轮只检查一次），返回拒绝原因"""
+        if auction is None:
+            return "unknown auction"
+        if auction.status != round_name + "_round":
+            return "round closed"
+        if round_name == "first":
+            if self.clock() - auction.start_time > self.config.first_round_time:
+                return "deadline passed"
+            return None
+        
+        # 确保 second_round_start_time 存在
+        if auction.second_round_start_time is None:
+            auction.second_round_start_time = self.clock()
+        
+        if self.clock() - auction.second_round_start_time > self.config.second_round_time:
+            return "deadline passed"
+        return None
+    
+    def _first_bid_error(self, auction: Auction, carrier_id: str, transport_type: str) -> Optional[str]:
+        # 同一承运商重复报价
+        if carrier_id in auction.first_round:
+            return "duplicate bid"
+        if transport_type not in self.transport_types:
+            return "unknown transport type"
+        return None
+    
+    def _add_first_round_bid(self, auction: Auction, carrier_id: str, base_price: float, transport_type: str,
+                             timestamp: Optional[str] = None, route: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """登记第一轮报价；route 为已算好的路线字典（批量提交时同一航线只计算一次），未给出时现算"""
+        if route is None:
+            route = self._calculate_route(auction.demand, transport_type, carrier_id).to_dict()
         bid_entry = {
             "carrier_id": carrier_id,
             "base_price": base_price,
             "transport_type": transport_type,
-            "route": route.to_dict(),  # 转换为字典
-            "timestamp": datetime.now().isoformat()
+            "route": route,
+            "timestamp": timestamp or datetime.now().isoformat()
         }
-        bid["first_round_bids"].append(bid_entry)
-        bid["first_round_count"] = len(bid["first_round_bids"])
-        blockchain.add_transaction({"type": "first_round_bid", "bid_id": bid_id, "data": bid_entry})
-        return True
+        auction.first_round[carrier_id] = bid_entry
+        return bid_entry
     
     def start_second_round(self, bid_id: str) -> bool:
-        if bid_id not in self.bids or len(self.bids[bid_id]["first_round_bids"]) < self.config.min_bidders:
+        with self._lock:
+            return self._start_second_round(bid_id)
+    
+    def _start_second_round(self, bid_id: str) -> bool:
+        auction = self.bids.get(bid_id)
+        if auction is None or len(auction.first_round) < self.config.min_bidders:
             return False
         
-        bid = self.bids[bid_id]
-        bid["status"] = "second_round"
-        bid["second_round_bids"] = []
-        bid["second_round_count"] = 0
-        bid["second_round_start_time"] = time.time()  # 确保设置时间
+        auction.status = "second_round"
+        auction.second_round = {}
+        auction.second_round_start_time = self.clock()  # 确保设置时间
+        self.scheduler.schedule(bid_id, "second_round",
+                                auction.second_round_start_time + self.config.second_round_time)
         return True
     
-    def submit_second_round_bid(self, bid_id: str, carrier_id: str, 
+    def submit_second_round_bid(self, bid_id: str, carrier_id: str,
+                                final_price: float, carbon_compensation: int) -> bool:
+        with self._lock:
+            return self._submit_second_round_bid(bid_id, carrier_id, final_price, carbon_compensation)
+    
+    def _submit_second_round_bid(self, bid_id: str, carrier_id: str, 
                            final_price: float, carbon_compensation: int) -> bool:
-        if bid_id not in self.bids or self.bids[bid_id]["status"] != "second_round":
-            return False
-        
-        # 确保 second_round_start_time 存在
-        if "second_round_start_time" not in self.bids[bid_id]:
-            self.bids[bid_id]["second_round_start_time"] = time.time()
-        
-        if time.time() - self.bids[bid_id]["second_round_start_time"] > self.config.second_round_time:
+        auction = self.bids.get(bid_id)
+        if self._second_round_error(auction, carrier_id, final_price, carbon_compensation) is not None:
             return False
         
         # 身份验证
         if not verify_compliance(carrier_id, final_price, "bidding_participation"):
             return False
         
-        # 验证价格和碳补偿
-        first_bids = self.bids[bid_id]["first_round_bids"]
-        first_bid = next((b for b in first_bids if b["carrier_id"] == carrier_id), None)
+        bid_entry = self._add_second_round_bid(auction, carrier_id, final_price, carbon_compensation)
+        self.ledger.add_transaction({"type": "second_round_bid", "bid_id": bid_id, "data": bid_entry})
+        return True
+    
+    def _second_round_error(self, auction: Optional[Auction], carrier_id: str,
+                            final_price: float, carbon_compensation: int) -> Optional[str]:
+        """第二轮报价校验（不含合规检查），返回拒绝原因"""
+        return (self._round_error(auction, "second")
+                or self._second_bid_error(auction, carrier_id, final_price, carbon_compensation))
+    
+    def _second_bid_error(self, auction: Auction, carrier_id: str,
+                          final_price: float, carbon_compensation: int) -> Optional[str]:
+        # 只有第一轮报过价的承运商可以参与，且每轮只能报价一次
+        first_bid = auction.first_round.get(carrier_id)
         if not first_bid:
-            return False
+            return "no first round bid"
+        if carrier_id in auction.second_round:
+            return "duplicate bid"
+        
+        # 验证价格和碳补偿
         if final_price > first_bid["base_price"] * (1 + self.config.max_price_increase):
-            return False
+            return "price above limit"
         if carbon_compensation < self.config.min_carbon_compensation:
-            return False
-        
-        bid = self.bids[bid_id]
+            return "compensation below minimum"
+        return None
+    
+    def _add_second_round_bid(self, auction: Auction, carrier_id: str, final_price: float,
+                              carbon_compensation: int, timestamp: Optional[str] = None) -> Dict[str, Any]:
         bid_entry = {
             "carrier_id": carrier_id,
             "final_price": final_price,
             "carbon_compensation": carbon_compensation,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp or datetime.now().isoformat()
         }
-        bid["second_round_bids"].append(bid_entry)
-        bid["second_round_count"] = len(bid["second_round_bids"])
-        blockchain.add_transaction({"type": "second_round_bid", "bid_id": bid_id, "data": bid_entry})
-        return True
+        auction.second_round[carrier_id] = bid_entry
+        return bid_entry
+    
+    def submit_bids_batch(self, bids: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        批量提交报价（可跨多场竞价、两轮混合），供承运商 TMS 集成按批推送
+
+        每条报价为字典：第一轮 {"bid_id", "carrier_id", "base_price", "transport_type"}，
+        第二轮 {"bid_id", "carrier_id", "final_price", "carbon_compensation"}；
+        可用 "round": "first"/"second" 显式指定，否则按是否含 final_price 判断。
+        校验规则与逐笔提交相同（批内同一承运商对同一竞价同一轮的重复报价同样拒绝），
+        合规检查整批调用一次，每场竞价的每种运输方式的路线整批只计算一次，通过的报价按输入顺序
+        写入竞价索引，账本上只记录一笔按列组织的 bid_batch（见 BID_BATCH_COLUMNS、BID_BATCH_LANE_COLUMNS）。
+        
+        Returns:
+            {"batch_id", "accepted", "rejected", "tx_hash": bid_batch 交易哈希（没有通过的报价时为 None）,
+             "results": [{"index", "ok", "error"?}, ...]}（与输入顺序一致）
+        """
+        with self._lock:
+            return self._submit_bids_batch(list(bids))
+    
+    def _submit_bids_batch(self, bids: List[Dict[str, Any]]) -> Dict[str, Any]:
+        results: List[Dict[str, Any]] = [{"index": index, "ok": False} for index in range(len(bids))]
+        candidates: List[Tuple[int, str, Auction, Dict[str, Any]]] = []
+        seen = set()
+        # (竞价ID, 轮次) -> 竞价级校验结果：每场竞价每轮只检查一次状态与截止时间
+        round_errors: Dict[Tuple[str, str], Optional[str]] = {}
+        for index, bid in enumerate(bids):
+            try:
+                bid_id, carrier_id = bid["bid_id"], bid["carrier_id"]
+                round_name = bid.get("round") or ("second" if "final_price" in bid else "first")
+                auction = self.bids.get(bid_id)
+                if round_name not in BID_BATCH_COLUMNS:
+                    error = "malformed bid"
+                else:
+                    key = (bid_id, round_name)
+                    if key not in round_errors:
+                        round_errors[key] = self._round_error(auction, round_name)
+                    error = round_errors[key]
+                    # 金额缺失的报价按格式错误拒绝
+                    amount = bid["base_price"] if round_name == "first" else bid["final_price"]
+                    if error is None and round_name == "first":
+                        error = self._first_bid_error(auction, carrier_id, bid["transport_type"])
+                    elif error is None:
+                        error = self._second_bid_error(auction, carrier_id, amount, bid["carbon_compensation"])
+            except (KeyError, TypeError, AttributeError):
+                error = "malformed bid"
+            if error is None and (bid_id, round_name, carrier_id) in seen:
+                error = "duplicate bid"
+            if error is not None:
+                results[index]["error"] = error
+                continue
+            seen.add((bid_id, round_name, carrier_id))
+            candidates.append((index, round_name, auction, bid))
+        
+        # 身份验证：整批一次
+        compliant = verify_compliance_batch([
+            (bid["carrier_id"], bid["base_price"] if round_name == "first" else bid["final_price"],
+             "bidding_participation") for _, round_name, _, bid in candidates])
+        
+        # 账本记录按列组织：每列只编码一次，不必为每笔报价单独存一份载荷
+        columns = {round_name: {name: [] for name in names} for round_name, names in BID_BATCH_COLUMNS.items()}
+        lane_columns: Dict[str, List[Any]] = {name: [] for name in BID_BATCH_LANE_COLUMNS}
+        # (竞价, 运输方式) -> (lanes 中的位置, 路线字典)：同一航线的报价不再逐笔计算路线
+        lanes: Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]] = {}
+        bid_positions: Dict[str, int] = {}
+        carrier_positions: Dict[str, int] = {}
+        timestamp = datetime.now().isoformat()
+        for (index, round_name, auction, bid), ok in zip(candidates, compliant):
+            if not ok:
+                results[index]["error"] = "compliance failed"
+                continue
+            carrier_id = bid["carrier_id"]
+            bid_index = bid_positions.setdefault(auction.id, len(bid_positions))
+            group = columns[round_name]
+            group["bid_index"].append(bid_index)
+            group["carrier_index"].append(carrier_positions.setdefault(carrier_id, len(carrier_positions)))
+            if round_name == "first":
+                transport_type = bid["transport_type"]
+                lane = lanes.get((auction.id, transport_type))
+                if lane is None:
+                    route = self._calculate_route(auction.demand, transport_type, carrier_id).to_dict()
+                    lane = lanes[auction.id, transport_type] = (len(lanes), route)
+                    for name, value in zip(BID_BATCH_LANE_COLUMNS, (
+                            bid_index, transport_type, route["distance"], route["estimated_time"],
+                            route["carbon_footprint"], route["base_price"])):
+                        lane_columns[name].append(value)
+                lane_index, route = lane
+                self._add_first_round_bid(auction, carrier_id, bid["base_price"], transport_type, timestamp,
+                                          {**route, "carrier": carrier_id})
+                group["price"].append(bid["base_price"])
+                group["lane_index"].append(lane_index)
+            else:
+                self._add_second_round_bid(auction, carrier_id, bid["final_price"], bid["carbon_compensation"],
+                                           timestamp)
+                group["price"].append(bid["final_price"])
+                group["carbon_compensation"].append(bid["carbon_compensation"])
+            results[index]["ok"] = True
+        
+        batch_id = uuid.uuid4().hex[:16]
+        accepted = sum(len(group["bid_index"]) for group in columns.values())
+        receipt = None
+        if accepted:
+            receipt = self.ledger.add_transaction({
+                "type": "bid_batch",
+                "batch_id": batch_id,
+                "bid_ids": list(bid_positions),
+                "carrier_ids": list(carrier_positions),
+                "lanes": lane_columns,
+                # 只记录本批出现的轮次
+                "bids": {round_name: group for round_name, group in columns.items() if group["bid_index"]}
+            })
+        return {"batch_id": batch_id, "accepted": accepted, "rejected": len(bids) - accepted,
+                "tx_hash": receipt.tx_hash if receipt else None, "results": results}
     
     def generate_solutions(self, bid_id: str) -> List[Dict[str, Any]]:
-        if bid_id not in self.bids or self.bids[bid_id]["status"] != "second_round":
+        """生成推荐方案并结束竞价：按配置的各组权重各给出一个（默认为经济型、绿色、均衡型）"""
+        with self._lock:
+            return self._generate_solutions(bid_id)
+    
+    def _generate_solutions(self, bid_id: str) -> List[Dict[str, Any]]:
+        auction = self.bids.get(bid_id)
+        if auction is None or auction.status != "second_round":
             return []
         
-        bid = self.bids[bid_id]
-        solutions = []
-        for second_bid in bid["second_round_bids"]:
-            first_bid = next(b for b in bid["first_round_bids"] if b["carrier_id"] == second_bid["carrier_id"])
-            route = first_bid["route"]
-            solution = {
+        scored = self.score_solutions(bid_id)
+        if scored is None:
+            return []
+        optimized_solutions = scored["solutions"]
+        self._archive(auction, "completed", scored)
+        self.ledger.add_transaction({"type": "solutions_generated", "bid_id": bid_id, "solutions": optimized_solutions})
+        return optimized_solutions
+    
+    def _archive(self, auction: Auction, status: str, scored: Optional[Dict[str, Any]] = None) -> None:
+        """竞价结束：移出进行中的竞价，归档为只含报价数与方案的记录（超出上限时淘汰最早的）"""
+        scored = scored or {"solutions": [], "pareto_front": [], "rankings": {}}
+        del self.bids[auction.id]
+        self.scheduler.cancel(auction.id)
+        self.completed[auction.id] = CompletedAuction(
+            id=auction.id,
+            status=status,
+            first_round_count=len(auction.first_round),
+            second_round_count=len(auction.second_round),
+            solutions=scored["solutions"],
+            pareto_front=scored["pareto_front"],
+            rankings=scored["rankings"]
+        )
+        while len(self.completed) > self.config.max_archived:
+            self.completed.popitem(last=False)
+    
+    def _on_deadline(self, bid_id: str, phase: str, now: float) -> List[Dict[str, Any]]:
+        """调度器回调：当前阶段到期，推进到下一阶段或关闭竞价，返回事件"""
+        with self._lock:
+            auction = self.bids.get(bid_id)
+            if auction is None or auction.status != phase:
+                return []
+            event = {"bid_id": bid_id, "time": now}
+            if phase == "first_round":
+                if self._start_second_round(bid_id):
+                    return [{**event, "type": "second_round_started", "bidders": len(auction.first_round)}]
+                reason = "not enough bidders"
+            else:
+                solutions = self._generate_solutions(bid_id)
+                if solutions:
+                    return [{**event, "type": "auction_completed", "solutions": solutions}]
+                reason = "no second round bids"
+            self._archive(auction, "expired")
+            return [{**event, "type": "auction_expired", "phase": phase, "reason": reason}]
+    
+    def score_solutions(self, bid_id: str) -> Optional[Dict[str, Any]]:
+        """
+        为第二轮报价评分（不改变竞价状态），没有报价时返回 None
+
+        报价整理为价格、碳足迹、天数、碳补偿四列数组，一次计算价格/碳足迹/时间的
+        Pareto 前沿与全部加权排名，只为被选中的方案构造字典。
+
+        Returns:
+            {"solutions": 各排名第一的推荐方案, "pareto_front": [...], "rankings": {名称: [...]}}
+        """
+        auction = self.bids.get(bid_id)
+        if auction is None or not auction.second_round:
+            return None
+        first_bids = auction.first_round
+        second_bids = list(auction.second_round.values())
+        routes = [first_bids[second_bid["carrier_id"]]["route"] for second_bid in second_bids]
+        criteria = np.array([
+            (second_bid["final_price"], route["carbon_footprint"], route["estimated_time"],
+             second_bid["carbon_compensation"])
+            for second_bid, route in zip(second_bids, routes)
+        ], dtype=float)
+        criteria[:, 2] = np.ceil(criteria[:, 2] / 24)
+        
+        def solution(i: int, **extra) -> Dict[str, Any]:
+            second_bid, route = second_bids[i], routes[i]
+            return {
                 "carrier_id": second_bid["carrier_id"],
-                "transport_type": first_bid["transport_type"],
+                "transport_type": first_bids[second_bid["carrier_id"]]["transport_type"],
                 "price": second_bid["final_price"],
                 "carbon_compensation": second_bid["carbon_compensation"],
                 "carbon_footprint": route["carbon_footprint"],  # 使用字典访问
-                "estimated_days": math.ceil(route["estimated_time"] / 24),
-                "route": route  # 已经是字典，无需再次转换
+                "estimated_days": int(criteria[i, 2]),
+                "route": route,  # 已经是字典，无需再次转换
+                **extra
             }
-            solutions.append(solution)
-        
-        economic = min(solutions, key=lambda x: x["price"])
-        green = min(solutions, key=lambda x: x["carbon_footprint"])
-        balanced = min(solutions, key=lambda x: x["price"] * 0.6 + 
-                    (x["carbon_footprint"] / max(s["carbon_footprint"] for s in solutions)) * 0.4)
-        
-        optimized_solutions = [
-            {**economic, "type": "economic"},
-            {**green, "type": "green"},
-            {**balanced, "type": "balanced"}
-        ]
-        bid["solutions"] = optimized_solutions
-        bid["status"] = "completed"
-        blockchain.add_transaction({"type": "solutions_generated", "bid_id": bid_id, "solutions": optimized_solutions})
-        return optimized_solutions
+        
+        rankings = rank_solutions(criteria, self.config.solution_weights, self.config.ranking_size)
+        return {
+            "solutions": [solution(int(order[0]), type=name) for name, order in rankings.items()],
+            "pareto_front": [solution(int(i)) for i in pareto_front(criteria[:, :3])],
+            "rankings": {name: [solution(int(i)) for i in order] for name, order in rankings.items()}
+        }
     
     def _generate_bid_id(self, demand: Dict[str, Any]) -> str:
         return f"bid_{int(time.time())}_{demand['id']}"
     
     def _calculate_route(self, demand: Dict[str, Any], transport_type: str, carrier_id: str) -> TransportRoute:
+        """按航线、运输方式与载重等级读取缓存的距离与单位碳足迹，只有未命中时才调用物流 API"""
         origin = demand["base_data"]["origin"]
         destination = demand["base_data"]["destination"]
-        distance = calculate_distance(origin, destination)
+        stu = demand["calculated_data"]["base_stu"]
+        if transport_type not in self.transport_types:
+            raise ValueError(f"Unknown transport type: {transport_type}")
+        
+        def compute() -> Tuple[float, float]:
+            distance = calculate_distance(origin, destination)
+            carbon_footprint = fetch_carbon_footprint(distance, transport_type, stu)
+            return distance, carbon_footprint / stu if stu else 0.0
+        
+        quote = self.route_cache.get((origin, destination, transport_type, load_class(stu)), compute)
+        distance = quote.distance
         speed = self.transport_types[transport_type]["speed"]
         estimated_time = distance / speed
-        carbon_footprint = fetch_carbon_footprint(distance, transport_type, demand["calculated_data"]["base_stu"])
+        carbon_footprint = quote.carbon_per_stu * stu
         base_rate = self.transport_types[transport_type]["base_rate"]
-        base_price = distance * base_rate * demand["calculated_data"]["base_stu"]
+        base_price = distance * base_rate * stu
         return TransportRoute(origin, destination, transport_type, distance, carrier_id, 
                              estimated_time, carbon_footprint, base_price)
     
     def get_bid_status(self, bid_id: str) -> Optional[Dict[str, Any]]:
-        if bid_id not in self.bids:
+        auction = self.bids.get(bid_id)
+        if auction is not None:
+            return {
+                "id": auction.id,
+                "status": auction.status,
+                "first_round_count": len(auction.first_round),
+                "second_round_count": len(auction.second_round),
+                "solutions": None,
+                "pareto_front": None,
+                "deadline": self.scheduler.deadline(bid_id)
+            }
+        completed = self.completed.get(bid_id)
+        if completed is None:
             return None
-        bid = self.bids[bid_id]
         return {
-            "id": bid["id"],
-            "status": bid["status"],
-            "first_round_count": len(bid["first_round_bids"]),
-            "second_round_count": len(bid["second_round_bids"]),
-            "solutions": bid["solutions"]
+            "id": completed.id,
+            "status": completed.status,
+            "first_round_count": completed.first_round_count,
+            "second_round_count": completed.second_round_count,
+            "solutions": completed.solutions,
+            "pareto_front": completed.pareto_front,
+            "deadline": None
         }
 
 bidding_system = BiddingSystem()
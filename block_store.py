@@ -0,0 +1,220 @@
+from typing import List, Optional, Tuple
+from collections import OrderedDict
+import mmap
+import os
+import struct
+import zlib
+
+class BlockStore:
+    """
+    分段追加写的区块日志
+
+    每个分段保存固定数量的区块，由两部分组成：
+    - {segment}.log：记录 = [载荷长度 u32][CRC32 u32][载荷]
+    - {segment}.idx：定长索引项 = [记录偏移 u64][记录长度 u32]
+
+    第 N 个区块位于第 N // blocks_per_segment 个分段的第 N % blocks_per_segment 个索引项，
+    随机读取无需加载前面的区块。启动时只检查最后一个分段：截断不完整的尾部记录，
+    并补建已写入日志但尚未写入索引的记录，因此恢复时间与链长无关。
+
+    已写满的分段可以整体改写（如裁剪旧区块体后只保留区块头），改写通过临时文件与
+    重命名完成，中途崩溃时启动会完成或丢弃未完成的改写。
+    """
+
+    RECORD_HEADER = struct.Struct("<II")
+    INDEX_ENTRY = struct.Struct("<QI")
+
+    def __init__(self, directory: str, blocks_per_segment: int = 1024,
+                 fsync: bool = False, max_open_segments: int = 16):
+        self.directory = directory
+        self.blocks_per_segment = blocks_per_segment
+        self.fsync = fsync
+        self.max_open_segments = max_open_segments
+        os.makedirs(directory, exist_ok=True)
+        self._finish_rewrites()
+        # 分段号 -> (日志 mmap, 索引 mmap)，只读映射，按 LRU 保留
+        self._maps: "OrderedDict[int, Tuple[mmap.mmap, mmap.mmap]]" = OrderedDict()
+        self._active_segment = self._find_last_segment()
+        self._active_count = self._recover_segment(self._active_segment)
+        self._log_file = open(self._path(self._active_segment, "log"), "ab")
+        self._idx_file = open(self._path(self._active_segment, "idx"), "ab")
+
+    def _path(self, segment: int, ext: str) -> str:
+        return os.path.join(self.directory, f"{segment:08d}.{ext}")
+
+    def _finish_rewrites(self) -> None:
+        """
+        完成崩溃前中断的分段改写
+
+        改写顺序：写入 .log.tmp/.idx.tmp 并落盘 -> .idx.tmp 改名为 .idx.compact（数据已完整）
+        -> .log.tmp 替换 .log -> .idx.compact 替换 .idx。存在 .idx.compact 说明新数据完整，
+        继续完成剩余的替换；只有 .tmp 文件说明改写未完成，直接丢弃，原分段不受影响。
+        """
+        names = os.listdir(self.directory)
+        for name in names:
+            if name.endswith(".idx.compact"):
+                segment = int(name.split(".")[0])
+                log_tmp = self._path(segment, "log") + ".tmp"
+                if os.path.exists(log_tmp):
+                    os.replace(log_tmp, self._path(segment, "log"))
+                os.replace(os.path.join(self.directory, name), self._path(segment, "idx"))
+        for name in names:
+            if name.endswith(".tmp") and os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
+
+    def _find_last_segment(self) -> int:
+        segments = [int(name[:-4]) for name in os.listdir(self.directory)
+                    if name.endswith(".log") and name[:-4].isdigit()]
+        return max(segments) if segments else 0
+
+    def _recover_segment(self, segment: int) -> int:
+        """恢复最后一个分段，返回其中有效区块数"""
+        log_path, idx_path = self._path(segment, "log"), self._path(segment, "idx")
+        for path in (log_path, idx_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+
+        with open(log_path, "r+b") as log, open(idx_path, "r+b") as idx:
+            log_size = os.fstat(log.fileno()).st_size
+            entry_size = self.INDEX_ENTRY.size
+            count = os.fstat(idx.fileno()).st_size // entry_size
+
+            # 从末尾丢弃指向不完整或校验失败记录的索引项
+            valid_end = 0
+            while count > 0:
+                idx.seek((count - 1) * entry_size)
+                offset, length = self.INDEX_ENTRY.unpack(idx.read(entry_size))
+                if offset + length <= log_size and self._read_record(log, offset) is not None:
+                    valid_end = offset + length
+                    break
+                count -= 1
+            idx.truncate(count * entry_size)
+
+            # 补建已完整写入日志、但索引项尚未落盘的记录
+            idx.seek(count * entry_size)
+            while count < self.blocks_per_segment:
+                payload = self._read_record(log, valid_end)
+                if payload is None:
+                    break
+                length = self.RECORD_HEADER.size + len(payload)
+                idx.write(self.INDEX_ENTRY.pack(valid_end, length))
+                valid_end += length
+                count += 1
+
+            # 截断撕裂的尾部
+            log.truncate(valid_end)
+        return count
+
+    def _read_record(self, log, offset: int) -> Optional[bytes]:
+        """读取并校验一条日志记录，不完整或校验失败时返回 None"""
+        log.seek(offset)
+        header = log.read(self.RECORD_HEADER.size)
+        if len(header) < self.RECORD_HEADER.size:
+            return None
+        length, crc = self.RECORD_HEADER.unpack(header)
+        payload = log.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def __len__(self) -> int:
+        return self._active_segment * self.blocks_per_segment + self._active_count
+
+    def append(self, payload: bytes) -> int:
+        """追加一个区块载荷，返回其区块序号"""
+        if self._active_count >= self.blocks_per_segment:
+            self._roll_segment()
+        offset = self._log_file.tell()
+        record = self.RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        self._log_file.write(record)
+        self._log_file.flush()
+        if self.fsync:
+            os.fsync(self._log_file.fileno())
+        # 先写日志再写索引：崩溃时最多留下一条可补建的未索引记录
+        self._idx_file.write(self.INDEX_ENTRY.pack(offset, len(record)))
+        self._idx_file.flush()
+        if self.fsync:
+            os.fsync(self._idx_file.fileno())
+        self._active_count += 1
+        return len(self) - 1
+
+    def _roll_segment(self) -> None:
+        """当前分段写满后切换到新分段"""
+        self._log_file.close()
+        self._idx_file.close()
+        self._active_segment += 1
+        self._active_count = 0
+        self._log_file = open(self._path(self._active_segment, "log"), "ab")
+        self._idx_file = open(self._path(self._active_segment, "idx"), "ab")
+
+    def _segment_maps(self, segment: int, min_log: int, min_idx: int) -> Tuple[mmap.mmap, mmap.mmap]:
+        """获取分段的只读映射；活动分段增长超出映射范围时重新映射"""
+        maps = self._maps.get(segment)
+        if maps is None or len(maps[0]) < min_log or len(maps[1]) < min_idx:
+            if maps is not None:
+                for m in maps:
+                    m.close()
+            maps = tuple(self._map_file(self._path(segment, ext)) for ext in ("log", "idx"))
+            self._maps[segment] = maps
+        self._maps.move_to_end(segment)
+        while len(self._maps) > self.max_open_segments:
+            _, old = self._maps.popitem(last=False)
+            for m in old:
+                m.close()
+        return maps
+
+    @staticmethod
+    def _map_file(path: str) -> mmap.mmap:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, n: int) -> bytes:
+        """随机读取第 n 个区块的载荷"""
+        if not 0 <= n < len(self):
+            raise IndexError("Block index out of range")
+        segment, slot = divmod(n, self.blocks_per_segment)
+        entry_size = self.INDEX_ENTRY.size
+        log_map, idx_map = self._segment_maps(segment, 0, (slot + 1) * entry_size)
+        offset, length = self.INDEX_ENTRY.unpack_from(idx_map, slot * entry_size)
+        if len(log_map) < offset + length:
+            log_map, idx_map = self._segment_maps(segment, offset + length, 0)
+        payload_length, crc = self.RECORD_HEADER.unpack_from(log_map, offset)
+        start = offset + self.RECORD_HEADER.size
+        payload = log_map[start:start + payload_length]
+        if zlib.crc32(payload) != crc:
+            raise IOError(f"Corrupted block record {n}")
+        return payload
+
+    def rewrite_segment(self, segment: int, payloads: List[bytes]) -> None:
+        """用新的区块载荷整体改写一个已写满的分段（区块数量不变）"""
+        if segment >= self._active_segment:
+            raise ValueError("Only sealed segments can be rewritten")
+        if len(payloads) != self.blocks_per_segment:
+            raise ValueError("Rewritten segment must keep its block count")
+        log_path, idx_path = self._path(segment, "log"), self._path(segment, "idx")
+        with open(log_path + ".tmp", "wb") as log, open(idx_path + ".tmp", "wb") as idx:
+            offset = 0
+            for payload in payloads:
+                record = self.RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+                log.write(record)
+                idx.write(self.INDEX_ENTRY.pack(offset, len(record)))
+                offset += len(record)
+            for f in (log, idx):
+                f.flush()
+                os.fsync(f.fileno())
+        maps = self._maps.pop(segment, None)
+        if maps is not None:
+            for m in maps:
+                m.close()
+        os.replace(idx_path + ".tmp", idx_path + ".compact")
+        os.replace(log_path + ".tmp", log_path)
+        os.replace(idx_path + ".compact", idx_path)
+
+    def close(self) -> None:
+        """关闭文件句柄与映射"""
+        for maps in self._maps.values():
+            for m in maps:
+                m.close()
+        self._maps.clear()
+        self._log_file.close()
+        self._idx_file.close()
@@ -1,10 +1,94 @@
 import time
 import hashlib
 import json
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, Set, Iterable
+from dataclasses import dataclass, asdict, replace
+from collections import OrderedDict, deque
 import random
+import os
+import math
+import bisect
+import functools
+import itertools
+import queue
+import multiprocessing
+import threading
 from datetime import datetime
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
+from cryptography.exceptions import InvalidSignature
+from mempool import Mempool, content_hash, with_nonce, DUPLICATE, FULL
+from codec import to_record, encode_transaction, encode_header, encode_block_fields, decode_block_fields
+from block_store import BlockStore
+from payload_store import PayloadStore
+from bloom import BloomFilter
+from posting_index import PostingIndex
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+# Merkle 树的域分隔前缀：叶子与内部节点的哈希输入不同，内部节点不能被当作交易（或反之）构造等价的树
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_NODE_PREFIX = b"\x01"
+
+def transaction_hash(tx: Dict[str, Any]) -> str:
+    """计算交易哈希（Merkle 树叶子节点），基于交易的规范二进制编码"""
+    return _sha256(MERKLE_LEAF_PREFIX + encode_transaction(tx))
+
+def _merkle_node(left: str, right: str) -> str:
+    return _sha256(MERKLE_NODE_PREFIX + (left + right).encode())
+
+def _merkle_parent_level(level: List[str]) -> List[str]:
+    """
+    计算 Merkle 树上一层，奇数个节点时最后一个直接提升到上一层
+
+    不复制最后一个节点：复制会使 [a, b, c] 与 [a, b, c, c] 得到相同的根（CVE-2012-2459），
+    重复打包的交易可以冒用原区块的哈希与签名。
+    """
+    parents = [_merkle_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2 == 1:
+        parents.append(level[-1])
+    return parents
+
+def merkle_root_of_hashes(level: List[str]) -> str:
+    """由叶子哈希计算 Merkle 根"""
+    if not level:
+        return _sha256(b"")
+    while len(level) > 1:
+        level = _merkle_parent_level(level)
+    return level[0]
+
+def merkle_root(transactions: List[Dict[str, Any]]) -> str:
+    """计算交易列表的 Merkle 根"""
+    return merkle_root_of_hashes([transaction_hash(tx) for tx in transactions])
+
+def verify_block_body(transactions: List[Dict[str, Any]], root: str) -> bool:
+    """区块体与 Merkle 根一致，且不含重复交易（同一笔交易打包两次会被重复执行）"""
+    leaves = [transaction_hash(tx) for tx in transactions]
+    return len(set(leaves)) == len(leaves) and merkle_root_of_hashes(leaves) == root
+
+def merkle_proof(transactions: List[Dict[str, Any]], tx_offset: int) -> List[Tuple[str, str]]:
+    """生成交易的 Merkle 包含证明：[(兄弟节点哈希, 兄弟节点位于 "left"/"right")]，被提升的层没有兄弟节点"""
+    if not 0 <= tx_offset < len(transactions):
+        raise IndexError("Transaction offset out of range")
+    level = [transaction_hash(tx) for tx in transactions]
+    proof = []
+    position = tx_offset
+    while len(level) > 1:
+        if position % 2 == 1:
+            proof.append((level[position - 1], "left"))
+        elif position + 1 < len(level):
+            proof.append((level[position + 1], "right"))
+        level = _merkle_parent_level(level)
+        position //= 2
+    return proof
+
+def verify_merkle_proof(tx: Dict[str, Any], proof: List[Tuple[str, str]], root: str) -> bool:
+    """验证交易是否包含在 Merkle 根对应的区块中，无需完整区块数据"""
+    current = transaction_hash(tx)
+    for sibling, side in proof:
+        current = _merkle_node(sibling, current) if side == "left" else _merkle_node(current, sibling)
+    return current == root
 
 @dataclass
 class Block:
@@ -14,18 +98,246 @@ class Block:
     transactions: List[Dict[str, Any]]
     previous_hash: str
     nonce: int = 0
+    merkle_root: str = ""
+    sealer: str = ""  # 出块节点（PoW 矿工或 PoS 签名节点）
     hash: str = ""
+    signature: str = ""  # PoS/轮换模式下出块节点对区块哈希的签名
+    difficulty: int = 0  # 封装时要求的前导零比特数（签名出块为 0），随区块头一起哈希
+    pruned: bool = False  # 区块体已裁剪，只保留区块头（交易由 merkle_root 承诺）
+    bloom: bytes = b""  # 区块涉及的节点/竞标/支付/需求ID 的布隆过滤器，由各节点从区块体派生，不参与哈希
     
-    def calculate_hash(self) -> str:
-        """计算区块哈希"""
-        block_string = json.dumps({
+    def calculate_merkle_root(self) -> str:
+        """根据交易列表计算 Merkle 根"""
+        return merkle_root(self.transactions)
+    
+    def header(self) -> Dict[str, Any]:
+        """区块头：只包含定长字段，交易内容通过 Merkle 根承诺"""
+        return {
             "index": self.index,
             "timestamp": self.timestamp,
-            "transactions": self.transactions,
             "previous_hash": self.previous_hash,
+            "merkle_root": self.merkle_root,
+            "sealer": self.sealer,
+            "difficulty": self.difficulty,
             "nonce": self.nonce
-        }, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        }
+    
+    def encode_header(self) -> bytes:
+        """区块头的规范二进制编码"""
+        return encode_header(self.index, self.timestamp, self.previous_hash, self.merkle_root,
+                             self.sealer, self.difficulty, self.nonce)
+    
+    def calculate_hash(self) -> str:
+        """计算区块哈希（仅哈希区块头）"""
+        return hashlib.sha256(self.encode_header()).hexdigest()
+    
+    def hash_template(self) -> Tuple[bytes, bytes]:
+        """拆分区块头编码为 nonce 前后两段，满足 sha256(前缀 + nonce 8 字节 + 后缀) == calculate_hash()"""
+        # nonce 固定 8 字节位于区块头编码末尾
+        return self.encode_header()[:-8], b""
+    
+    def get_merkle_proof(self, tx_offset: int) -> List[Tuple[str, str]]:
+        """生成区块内指定交易的 Merkle 包含证明"""
+        if self.pruned:
+            raise ValueError(f"Body of block {self.index} has been pruned")
+        return merkle_proof(self.transactions, tx_offset)
+    
+    def header_only(self) -> "Block":
+        """裁剪区块体后的区块：保留区块头、哈希与签名"""
+        return replace(self, transactions=[], pruned=True)
+
+# 并行挖矿进程共享的停止信号，由进程池初始化时注入
+_mining_stop_event = None
+
+def _init_mining_worker(stop_event) -> None:
+    global _mining_stop_event
+    _mining_stop_event = stop_event
+
+def difficulty_target(difficulty: int) -> bytes:
+    """难度对应的哈希上界：前 difficulty 个比特为 0 的哈希严格小于该值"""
+    if difficulty <= 0:
+        # 比任何 32 字节哈希都大
+        return b"\xff" * 32 + b"\x00"
+    return (1 << (256 - difficulty)).to_bytes(32, "big")
+
+def meets_difficulty(block_hash: str, difficulty: int) -> bool:
+    """区块哈希（hex）是否满足难度；难度不足 1 比特不算工作量（难度 0 的上界大于任何哈希）"""
+    return difficulty >= 1 and bytes.fromhex(block_hash) < difficulty_target(difficulty)
+
+def retarget_difficulty(previous_difficulty: int, timespan: float, blocks: int, target_block_time: float,
+                        max_step: int, min_difficulty: int, max_difficulty: int) -> int:
+    """
+    按上一调整周期的实际出块耗时计算新难度
+
+    难度每加 1 比特，期望哈希次数翻倍，因此调整量取 log2(目标耗时 / 实际耗时) 四舍五入，
+    单次最多调整 max_step 比特，避免个别异常时间戳导致难度剧烈波动。
+    """
+    expected = target_block_time * blocks
+    if timespan <= 0:
+        step = max_step
+    else:
+        step = max(-max_step, min(max_step, round(math.log2(expected / timespan))))
+    return max(min_difficulty, min(max_difficulty, previous_difficulty + step))
+
+def search_nonce_range(prefix: bytes, suffix: bytes, difficulty: int,
+                        start: int, count: int) -> Optional[Tuple[int, str]]:
+    """在 [start, start + count) 区间内搜索满足难度的 nonce，其他进程找到后提前退出"""
+    target = difficulty_target(difficulty)
+    midstate = hashlib.sha256(prefix)
+    for nonce in range(start, start + count):
+        if nonce % 4096 == 0 and _mining_stop_event is not None and _mining_stop_event.is_set():
+            return None
+        h = midstate.copy()
+        h.update(nonce.to_bytes(8, "big"))
+        h.update(suffix)
+        if h.digest() < target:
+            return nonce, h.hexdigest()
+    return None
+
+def encode_block(block: Block) -> bytes:
+    """区块序列化（持久化与网络复制格式）"""
+    return encode_block_fields(block.encode_header(), block.hash, block.signature, block.pruned,
+                               block.transactions, block.bloom)
+
+def decode_block(payload: bytes, with_transactions: bool = True) -> Block:
+    """区块反序列化；with_transactions=False 时只解码区块头"""
+    return Block(**decode_block_fields(payload, with_transactions))
+
+def _public_key_hex(key: Ed25519PrivateKey) -> str:
+    return key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw).hex()
+
+def generate_keystore(node_ids: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """为出块节点随机生成签名密钥对：{节点ID: {"public_key": hex, "private_key": hex}}"""
+    keystore = {}
+    for node_id in node_ids:
+        key = Ed25519PrivateKey.generate()
+        keystore[node_id] = {
+            "public_key": _public_key_hex(key),
+            "private_key": key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption()).hex()
+        }
+    return keystore
+
+def public_keystore(keystore: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    """只含公钥的密钥库，可分发给其他副本用于校验签名"""
+    return {node_id: {"public_key": entry["public_key"]} for node_id, entry in keystore.items()}
+
+def load_keystore(path: str) -> Dict[str, Dict[str, str]]:
+    """读取密钥库文件（JSON：{节点ID: {"public_key": hex, "private_key": hex（仅本地托管的节点）}}）"""
+    with open(path) as f:
+        return json.load(f)
+
+def save_keystore(path: str, keystore: Dict[str, Dict[str, str]]) -> None:
+    """原子写入密钥库文件，仅所有者可读写"""
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(keystore, f)
+    os.replace(tmp_path, path)
+
+def verify_block_signature(block: Block, public_key_hex: Optional[str]) -> bool:
+    """校验出块节点对区块哈希的签名"""
+    if not public_key_hex:
+        return False
+    try:
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key_hex)).verify(
+            bytes.fromhex(block.signature), bytes.fromhex(block.hash))
+        return True
+    except (InvalidSignature, ValueError):
+        return False
+
+def verify_header_seal(block: Block, public_keys: Optional[Dict[str, str]] = None, consensus: str = "pow") -> bool:
+    """
+    只校验区块头：哈希，以及按链的共识方式校验封装——PoW 只认区块头记录难度下的工作量，
+    PoS/轮换只认出块节点对区块哈希的签名，区块上有什么就校验什么的做法会让两种封装互相冒充。
+    不需要交易数据，可用于先同步区块头再下载区块体。
+    记录的难度与出块节点是否符合规则由链上下文校验。
+    """
+    if block.hash != block.calculate_hash():
+        return False
+    if block.index == 0:
+        return True
+    if consensus == "pow":
+        return meets_difficulty(block.hash, block.difficulty)
+    # 签名出块的难度恒为 0，没有有效签名的区块不能靠难度 0 的工作量通过
+    return bool(block.signature) and verify_block_signature(block, (public_keys or {}).get(block.sealer))
+
+def verify_block_seal(block: Block, public_keys: Optional[Dict[str, str]] = None, consensus: str = "pow") -> bool:
+    """校验区块自身的封装：区块头哈希、Merkle 根与重复交易（区块体未裁剪时），以及出块节点签名或工作量"""
+    return (verify_header_seal(block, public_keys, consensus) and
+            (block.pruned or verify_block_body(block.transactions, block.merkle_root)))
+
+def _verify_block_chunk(items: List[Any], public_keys: Dict[str, str],
+                        consensus: str) -> Tuple[bool, List[Tuple[str, str, float, int]]]:
+    """并行审计任务：校验一段区块的封装，并返回 (哈希, 前驱哈希, 时间戳, 难度) 供父进程检查链接与难度调整"""
+    links = []
+    for item in items:
+        block = decode_block(item) if isinstance(item, bytes) else item
+        if not verify_block_seal(block, public_keys, consensus):
+            return False, []
+        links.append((block.hash, block.previous_hash, block.timestamp, block.difficulty))
+    return True, links
+
+class StoredChain:
+    """
+    以 BlockStore 为后端的区块序列，接口与 List[Block] 一致
+
+    区块按需从磁盘解码，只在内存中缓存最近访问的区块。
+    """
+    
+    def __init__(self, store: BlockStore, cache_size: int = 256):
+        self.store = store
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, Block]" = OrderedDict()
+        # 区块索引 -> 布隆过滤器，按需只解码区块头读取
+        self._blooms: Dict[int, bytes] = {}
+    
+    def __len__(self) -> int:
+        return len(self.store)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        block = self._cache.get(index)
+        if block is None:
+            block = decode_block(self.store.read(index))
+            self._remember(index, block)
+        else:
+            self._cache.move_to_end(index)
+        return block
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+    
+    def append(self, block: Block) -> None:
+        index = self.store.append(encode_block(block))
+        self._blooms[index] = block.bloom
+        self._remember(index, block)
+    
+    def bloom(self, index: int) -> bytes:
+        """读取区块的布隆过滤器，不解码交易区"""
+        block = self._cache.get(index)
+        if block is not None:
+            return block.bloom
+        bloom = self._blooms.get(index)
+        if bloom is None:
+            bloom = decode_block_fields(self.store.read(index), with_transactions=False)["bloom"]
+            self._blooms[index] = bloom
+        return bloom
+    
+    def clear_cache(self) -> None:
+        self._cache.clear()
+    
+    def _remember(self, index: int, block: Block) -> None:
+        self._cache[index] = block
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
 @dataclass
 class Node:
@@ -36,30 +348,119 @@ class Node:
     credit_score: float = 8.0  # 初始信用分
     location: str = ""
     last_active: float = time.time()
+    public_key: str = ""  # 超级节点的出块签名公钥（hex）
 
 class Blockchain:
-    def __init__(self):
-        self.chain: List[Block] = []
-        self.pending_transactions: List[Dict] = []
+    # 并行挖矿时每个任务分配的 nonce 区间大小
+    NONCE_CHUNK_SIZE = 50000
+    
+    # 持久化模式下每隔多少个区块保存一次派生索引检查点
+    CHECKPOINT_INTERVAL = 100
+    
+    # 支持的出块共识："pow" 工作量证明，"pos" 按 质押×信用分 加权选取签名节点，"round_robin" 超级节点轮流签名
+    CONSENSUS_MODES = ("pow", "pos", "round_robin")
+    
+    # PoW 难度（前导零比特数）的取值范围，以及每个调整周期最多调整的比特数（2 比特即 4 倍）
+    MIN_DIFFICULTY = 4
+    MAX_DIFFICULTY = 32
+    MAX_RETARGET_STEP = 2
+    
+    # 保留的最近状态快照数量（裁剪基准快照始终保留）
+    STATE_SNAPSHOTS_KEPT = 3
+    
+    def __init__(self, mining_workers: int = 1, data_dir: Optional[str] = None,
+                 consensus: str = "pow", genesis_timestamp: Optional[float] = None,
+                 difficulty: int = 16, target_block_time: Optional[float] = None, retarget_window: int = 10,
+                 snapshot_interval: Optional[int] = None, retention_blocks: Optional[int] = None,
+                 bloom_fp_rate: float = 0.01, keystore: Optional[Dict[str, Dict[str, str]]] = None):
+        # 指定 data_dir 时区块写入磁盘日志，重启后从最后一个区块继续
+        self.data_dir = data_dir
+        self.chain: List[Block] = StoredChain(BlockStore(data_dir)) if data_dir else []
+        # 交易中较大的嵌套对象按内容摘要存储一次，区块内只保存引用
+        self.payloads = PayloadStore(os.path.join(data_dir, "payloads.log") if data_dir else None)
+        self.mempool = Mempool()
+        self.mempool.subscribe_evictions(lambda tx_hash, tx: self.drop_pending(tx_hash))
+        self.max_block_transactions = 1000  # 单个区块最多打包的交易数
         self.nodes: Dict[str, Node] = {}
-        self.difficulty = 4  # PoW难度
-        
-        # 创建创世区块
-        self.create_genesis_block()
+        # PoW 初始难度（前导零比特数）；未设置目标出块时间时固定使用该难度
+        self.difficulty = difficulty
+        # 每 retarget_window 个区块按实际出块耗时与目标出块时间（秒）调整一次难度
+        self.target_block_time = target_block_time
+        self.retarget_window = max(1, retarget_window)
+        # 并行挖矿进程数，1 表示在当前进程内串行搜索
+        self.mining_workers = max(1, mining_workers)
+        self._mining_pool = None
+        self._mining_stop_event = None
+        if consensus not in self.CONSENSUS_MODES:
+            raise ValueError(f"Unknown consensus mode: {consensus}")
+        if consensus == "pow" and difficulty < 1:
+            raise ValueError(f"PoW difficulty must be at least 1 bit: {difficulty}")
+        self.consensus = consensus
+        # 出块签名密钥只来自配置的密钥库（{节点ID: {"public_key", "private_key"（仅本地托管的节点）}}），
+        # 其中没有的超级节点没有公钥，其签名区块一律不被接受；未配置密钥库时为超级节点随机生成密钥，
+        # 持久化模式下保存到 data_dir/keystore.json，重启后沿用
+        self._keystore_path = os.path.join(data_dir, "keystore.json") if data_dir and keystore is None else None
+        if self._keystore_path and os.path.exists(self._keystore_path):
+            keystore = load_keystore(self._keystore_path)
+        self._generate_keys = self._keystore_path is not None or keystore is None
+        self._keystore: Dict[str, Dict[str, str]] = dict(keystore or {})
+        # 本地托管的超级节点签名密钥
+        self._signing_keys: Dict[str, Ed25519PrivateKey] = {}
+        # 出块节点选择用的累积权重数组，仅在质押或信用分变化后重建
+        self._sealer_ids: List[str] = []
+        self._cumulative_weights: List[float] = []
+        self._weights_dirty = True
+        # 账户状态表（节点及只持有代币的账户）：随区块追加增量维护，余额查询为 O(1)，
+        # 也是代币系统余额的唯一来源
+        self.account_state: Dict[str, float] = {}
+        # 已发放过初始代币（init_balance）的账户，重复发放不再入账
+        self.token_accounts: Set[str] = set()
+        # 已入池、尚未上链的交易对账户的扣款：内容哈希 -> [(账户, 金额)]，以及按账户的汇总
+        self._pending_debits: Dict[str, List[Tuple[str, float]]] = {}
+        self.pending_debits: Dict[str, float] = {}
+        # 节点交易倒排索引：节点ID -> [(区块索引, 交易偏移)]，按链上顺序追加；
+        # 持久化模式下按区块分段追加写入磁盘，查询时按需加载
+        self.node_index = PostingIndex(
+            os.path.join(data_dir, "postings") if data_dir else None,
+            self.chain.store.blocks_per_segment if data_dir else 1024)
+        self.transaction_count = 0
+        # 已验证的区块数：is_chain_valid 只需检查此高度之后的区块
+        self.validated_height = 0
+        # 每 snapshot_interval 个区块保存一次状态快照；设置 retention_blocks 时，
+        # 早于 最新区块 - retention_blocks 的快照之前的区块体被裁剪，只保留区块头
+        self.snapshot_interval = snapshot_interval
+        self.retention_blocks = retention_blocks
+        self.state_snapshots: List[Dict[str, Any]] = []
+        # 裁剪基准快照：派生状态从它开始重放，其高度之前的交易历史不再可查
+        self._base_snapshot: Optional[Dict[str, Any]] = None
+        self.pruned_height = 0  # 区块体已裁剪的最高区块索引（0 表示未裁剪）
+        # 每个区块的布隆过滤器按该误判率确定大小，只影响之后追加的区块
+        self.bloom_fp_rate = bloom_fp_rate
+        # 业务模块的状态导出/恢复钩子：名称 -> (导出函数, 恢复函数)
+        self._state_providers: Dict[str, Tuple[Any, Any]] = {}
         
         # 初始化一些测试节点
         self._init_test_nodes()
+        
+        # 创建创世区块；已有持久化数据时恢复派生索引
+        self.restored = len(self.chain) > 0
+        if self.restored:
+            self._load_state_snapshots()
+            self._restore_indexes()
+        else:
+            self.create_genesis_block(genesis_timestamp)
     
-    def create_genesis_block(self) -> None:
-        """创建创世区块"""
+    def create_genesis_block(self, timestamp: Optional[float] = None) -> None:
+        """创建创世区块（多副本部署时需传入相同的时间戳以得到相同的创世区块）"""
         genesis_block = Block(
             index=0,
-            timestamp=time.time(),
-            transactions=[{"type": "genesis", "data": "Genesis Block"}],
+            timestamp=time.time() if timestamp is None else timestamp,
+            transactions=[to_record({"type": "genesis", "data": "Genesis Block"})],
             previous_hash="0"
         )
+        genesis_block.merkle_root = genesis_block.calculate_merkle_root()
         genesis_block.hash = genesis_block.calculate_hash()
-        self.chain.append(genesis_block)
+        self._append_block(genesis_block)
     
     def _init_test_nodes(self) -> None:
         """初始化测试节点"""
@@ -101,80 +502,818 @@ class Blockchain:
                 stake=stake,
                 location=location
             )
+            # 注册前已有代币往来的账户，质押计入其现有余额
+            self.account_state[node_id] = stake + self.account_state.get(node_id, 0.0)
+            if node_type == "super_node":
+                self._load_signing_key(node_id)
+                self._weights_dirty = True
+    
+    def _load_signing_key(self, node_id: str) -> None:
+        """按密钥库登记超级节点的公钥（及本地托管的私钥），未配置密钥库时生成新的密钥对"""
+        entry = self._keystore.get(node_id)
+        if entry is None and self._generate_keys:
+            entry = self._keystore[node_id] = generate_keystore([node_id])[node_id]
+            if self._keystore_path:
+                save_keystore(self._keystore_path, self._keystore)
+        if entry is None:
+            return
+        if entry.get("private_key"):
+            signing_key = Ed25519PrivateKey.from_private_bytes(bytes.fromhex(entry["private_key"]))
+            if _public_key_hex(signing_key) != entry["public_key"]:
+                raise ValueError(f"Keystore key pair mismatch for {node_id}")
+            self._signing_keys[node_id] = signing_key
+        self.nodes[node_id].public_key = entry["public_key"]
+    
+    def update_node_stake(self, node_id: str, stake: float) -> None:
+        """更新节点质押数量"""
+        if node_id in self.nodes:
+            node = self.nodes[node_id]
+            self.account_state[node_id] += stake - node.stake
+            node.stake = stake
+            if node.node_type == "super_node":
+                self._weights_dirty = True
     
     def add_transaction(self, transaction: Dict[str, Any]) -> int:
-        """添加新交易到待处理池"""
-        self.pending_transactions.append({
-            **transaction,
-            "timestamp": time.time()
-        })
+        """
+        添加新交易到待处理池（较大的嵌套对象先存入载荷存储，交易中只保留引用）
+
+        非幂等交易附带 nonce，内容相同的两笔转账分别入池；重复提交池中已有的交易时抛出 ValueError。
+        """
+        tx = self.payloads.externalize_transaction({**with_nonce(transaction), "timestamp": time.time()})
+        status, tx_hash = self.mempool.insert(tx)
+        if status == FULL:
+            raise ValueError("Mempool is full")
+        if status == DUPLICATE:
+            raise ValueError("Duplicate transaction")
+        self._track_pending(tx_hash, tx)
         return self.get_last_block().index + 1
     
-    def mine_pending_transactions(self, miner_node_id: str) -> Optional[Block]:
-        """挖掘待处理交易并生成新区块"""
-        if not self.pending_transactions:
+    def mine_pending_transactions(self, miner_node_id: Optional[str] = None) -> Optional[Block]:
+        """
+        打包待处理交易并生成新区块
+        
+        PoW 模式下由 miner_node_id 挖矿（未指定时按权重选取）；
+        PoS/轮换模式下忽略 miner_node_id，由选中的超级节点签名出块。
+        """
+        new_block = self.prepare_block(miner_node_id)
+        if new_block is None:
+            return None
+        self.commit_block(self.seal_block(new_block))
+        return new_block
+    
+    def seal_block(self, block: Block) -> Block:
+        """封装候选区块：PoW 模式搜索 nonce，PoS/轮换模式由出块节点签名"""
+        if self.consensus == "pow":
+            return self.proof_of_work(block)
+        self.sign_block(block, block.sealer)
+        return block
+    
+    def commit_block(self, block: Block) -> None:
+        """将本节点封装好的区块追加到链上"""
+        # 更新节点最后活动时间
+        self.nodes[block.sealer].last_active = time.time()
+        self._append_block(block)
+    
+    def prepare_block(self, miner_node_id: Optional[str] = None) -> Optional[Block]:
+        """从交易池取出交易，构造尚未封装（未挖矿/未签名）的候选区块"""
+        if not len(self.mempool):
             return None
         
+        last_block = self.get_last_block()
+        if self.consensus != "pow":
+            miner_node_id = self.select_sealer(last_block)
+        elif miner_node_id is None:
+            miner_node_id = self.select_super_node()
         if miner_node_id not in self.nodes:
             raise ValueError("Invalid miner node ID")
         
-        last_block = self.get_last_block()
         new_block = Block(
             index=last_block.index + 1,
             timestamp=time.time(),
-            transactions=self.pending_transactions.copy(),
-            previous_hash=last_block.hash
+            transactions=[to_record(tx) for tx in self.mempool.take(self.max_block_transactions)],
+            previous_hash=last_block.hash,
+            difficulty=self.expected_difficulty(last_block.index + 1) if self.consensus == "pow" else 0
         )
         
-        # 工作量证明
-        new_block = self.proof_of_work(new_block)
-        
-        # 添加挖矿奖励交易
+        # 添加挖矿奖励交易（在封装区块头之前加入，使其受 Merkle 根保护）
         reward_transaction = {
             "type": "mining_reward",
             "miner": miner_node_id,
             "amount": self.get_mining_reward(),
             "timestamp": time.time()
         }
-        new_block.transactions.append(reward_transaction)
+        new_block.transactions.append(to_record(reward_transaction))
         
-        # 更新节点最后活动时间
-        self.nodes[miner_node_id].last_active = time.time()
+        # Merkle 根每个区块只计算一次，工作量证明只哈希区块头
+        new_block.merkle_root = new_block.calculate_merkle_root()
+        new_block.sealer = miner_node_id
+        return new_block
+    
+    def add_block(self, block: Block) -> bool:
+        """校验并追加外部（其他副本）产生的区块，同时从交易池移除其已打包的交易"""
+        last_block = self.get_last_block()
+        if block.index != last_block.index + 1 or block.previous_hash != last_block.hash:
+            return False
+        if not self._has_expected_difficulty(block) or not self._has_expected_sealer(block, last_block):
+            return False
+        if not verify_block_seal(block, self.get_public_keys(), self.consensus) or not self._has_valid_reward(block):
+            return False
+        # 引用的载荷须已随区块一并收到，否则区块内容不可还原
+        if self.payloads.missing(block.transactions):
+            return False
+        self._append_block(block)
+        for tx in block.transactions:
+            self.mempool.remove(content_hash(tx))
+        if block.sealer in self.nodes:
+            self.nodes[block.sealer].last_active = time.time()
+        return True
+    
+    def reorganize(self, fork_height: int, branch: List[Block]) -> bool:
+        """
+        切换到更长的分叉：保留前 fork_height 个区块，其后替换为 branch
         
-        # 将新区块添加到链上
-        self.chain.append(new_block)
+        被替换区块中未进入新分叉的交易退回交易池（挖矿奖励除外）。
+        仅支持内存链，持久化的追加写日志不允许回滚。
+        """
+        if isinstance(self.chain, StoredChain):
+            raise ValueError("Append-only block store cannot be reorganized")
+        if not 0 < fork_height <= len(self.chain) or not branch:
+            return False
+        # 派生状态只能从裁剪基准快照之后重建
+        if self._base_snapshot is not None and fork_height <= self._base_snapshot["height"]:
+            return False
+        previous = self.chain[fork_height - 1]
+        public_keys = self.get_public_keys()
+        candidate = self.chain[:fork_height] + branch
+        for block in branch:
+            if block.index != previous.index + 1 or block.previous_hash != previous.hash:
+                return False
+            if not self._has_expected_difficulty(block, candidate) or not self._has_expected_sealer(block, previous):
+                return False
+            if not verify_block_seal(block, public_keys, self.consensus) or not self._has_valid_reward(block):
+                return False
+            previous = block
         
-        # 清空待处理交易池
-        self.pending_transactions = []
+        orphaned = self.chain[fork_height:]
+        self.chain = self.chain[:fork_height]
+        self.state_snapshots = [snap for snap in self.state_snapshots if snap["height"] < fork_height]
+        self.rebuild_account_state()
+        self.rebuild_node_index()
+        self.validated_height = min(self.validated_height, fork_height)
+        for block in branch:
+            self._append_block(block)
         
-        return new_block
+        included = {content_hash(tx) for block in branch for tx in block.transactions}
+        for block in orphaned:
+            for tx in block.transactions:
+                if tx["type"] != "mining_reward" and content_hash(tx) not in included:
+                    self._track_pending(self.mempool.add(tx), tx)
+        for tx_hash in included:
+            self.mempool.remove(tx_hash)
+        return True
+    
+    @property
+    def pending_transactions(self) -> List[Dict[str, Any]]:
+        """待处理交易（按出块顺序）"""
+        return self.mempool.transactions()
+    
+    @property
+    def pending_bytes(self) -> int:
+        """待处理交易序列化后的总字节数"""
+        return self.mempool.total_bytes
+    
+    @property
+    def pending_since(self) -> Optional[float]:
+        """最早一笔待处理交易的入池时间"""
+        return self.mempool.oldest_timestamp()
+    
+    def _append_block(self, block: Block) -> None:
+        """追加区块并同步更新派生索引"""
+        if not block.pruned:
+            block.bloom = BloomFilter.from_keys(
+                (key for tx in block.transactions for key in self._tx_keys(tx)), self.bloom_fp_rate).to_bytes()
+        self.chain.append(block)
+        self._apply_block_to_account_state(block)
+        self._release_pending(block)
+        self._index_block(block)
+        if self.data_dir and block.index % self.CHECKPOINT_INTERVAL == 0:
+            self._save_index_checkpoint()
+        if self.snapshot_interval and block.index % self.snapshot_interval == 0:
+            self.create_state_snapshot()
+            if self.retention_blocks is not None:
+                self._maybe_prune()
+    
+    @staticmethod
+    def _balance_deltas(tx: Dict[str, Any], token_accounts: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        提取交易对账户余额的影响，顺序与全链扫描一致
+
+        token_accounts 为已发放初始代币的账户集合：init_balance 只对不在其中的账户入账并登记；
+        不传时忽略 init_balance（只用于统计待上链扣款）。
+        """
+        tx_type = tx["type"]
+        if tx_type == "mining_reward":
+            return [(tx["miner"], tx["amount"])]
+        if tx_type == "transfer":
+            amount = tx.get("amount", 0)
+            return [(tx.get("from"), -amount), (tx.get("to"), amount)]
+        if tx_type in ("token_transfer", "token_reward", "carbon_compensation"):
+            data = tx.get("data") or {}
+            amount = data.get("amount", 0)
+            if data.get("from", "system") == "system":
+                return [(data.get("to"), amount)]
+            return [(data.get("from"), -amount), (data.get("to"), amount)]
+        if tx_type == "init_balance" and token_accounts is not None:
+            node_id = tx.get("node_id")
+            if node_id is None or node_id in token_accounts:
+                return []
+            token_accounts.add(node_id)
+            return [(node_id, tx.get("amount", 0))]
+        return []
+    
+    def _apply_block_to_account_state(self, block: Block) -> None:
+        """将区块内交易的余额变动应用到账户状态表（写线程内整块应用，读取方只看到完整区块的结果）"""
+        account_state = self.account_state
+        for tx in block.transactions:
+            for node_id, delta in self._balance_deltas(tx, self.token_accounts):
+                if node_id is not None:
+                    account_state[node_id] = account_state.get(node_id, 0.0) + delta
+    
+    def _track_pending(self, tx_hash: Optional[str], tx: Dict[str, Any]) -> None:
+        """登记入池交易的扣款，计入可用余额"""
+        debits = [(node_id, -delta) for node_id, delta in self._balance_deltas(tx) if delta < 0 and node_id is not None]
+        if not debits or tx_hash is None or tx_hash in self._pending_debits:
+            return
+        self._pending_debits[tx_hash] = debits
+        for node_id, amount in debits:
+            self.pending_debits[node_id] = self.pending_debits.get(node_id, 0.0) + amount
+    
+    def _release_pending(self, block: Block) -> None:
+        """区块上链后，其中交易的扣款已计入确认余额，从待上链扣款中移除"""
+        if not self._pending_debits:
+            return
+        for tx in block.transactions:
+            if any(delta < 0 for _, delta in self._balance_deltas(tx)):
+                self.drop_pending(content_hash(tx))
+    
+    def drop_pending(self, tx_hash: str) -> None:
+        """撤销一笔交易的待上链扣款（已上链，或被交易池驱逐、不会再上链）"""
+        for node_id, amount in self._pending_debits.pop(tx_hash, ()):
+            remaining = self.pending_debits[node_id] - amount
+            if remaining > 1e-9:
+                self.pending_debits[node_id] = remaining
+            else:
+                del self.pending_debits[node_id]
+    
+    def available_balance(self, node_id: str) -> float:
+        """可用余额：已确认余额减去已入池、尚未上链的扣款"""
+        return self.account_state.get(node_id, 0.0) - self.pending_debits.get(node_id, 0.0)
+    
+    def _base_account_state(self) -> Tuple[Dict[str, float], Set[str], int]:
+        """
+        重放账户状态的起点：(余额表, 已发放初始代币的账户, 起始区块索引)
+
+        未裁剪时从各节点质押开始重放全链；已裁剪时从基准快照开始，
+        快照之后的质押调整以差额计入。
+        """
+        base = self._base_snapshot
+        if base is None:
+            return {node_id: node.stake for node_id, node in self.nodes.items()}, set(), 0
+        base_stakes = {node["id"]: node["stake"] for node in base["nodes"]}
+        balances = dict(base["account_state"])
+        for node_id, node in self.nodes.items():
+            balances[node_id] = balances.get(node_id, 0.0) + node.stake - base_stakes.get(node_id, 0.0)
+        return balances, set(base.get("token_accounts", [])), base["height"] + 1
+    
+    def rebuild_account_state(self) -> None:
+        """从链上数据重建账户状态表（用于重启或校验失败后）"""
+        self.account_state, self.token_accounts, start = self._base_account_state()
+        for index in range(start, len(self.chain)):
+            self._apply_block_to_account_state(self.chain[index])
+    
+    def verify_account_state(self) -> bool:
+        """将账户状态表与全链扫描结果逐一比对"""
+        scanned = self._scan_balances()
+        # 质押调整以差额方式计入，允许浮点舍入误差
+        return (set(scanned) == set(self.account_state) and
+                all(math.isclose(self.account_state[node_id], balance, abs_tol=1e-9)
+                    for node_id, balance in scanned.items()))
+    
+    @staticmethod
+    def _tx_node_ids(tx: Dict[str, Any]) -> List[str]:
+        """提取交易涉及的节点ID（含 data 中的承运商/商家ID）"""
+        node_ids = [tx[key] for key in ("from", "to", "miner") if tx.get(key) is not None]
+        data = tx.get("data")
+        if isinstance(data, dict):
+            node_ids.extend(data[key] for key in ("carrier_id", "merchant_id") if data.get(key) is not None)
+        # 批量报价记录在顶层列出全部承运商（报价明细可能已换成载荷引用）
+        carrier_ids = tx.get("carrier_ids")
+        if isinstance(carrier_ids, list):
+            node_ids.extend(carrier_ids)
+        return list(dict.fromkeys(node_ids))
+    
+    @classmethod
+    def _tx_keys(cls, tx: Dict[str, Any]) -> List[str]:
+        """提取交易涉及的可查询ID：节点ID，以及竞标、支付、需求ID（含顶层字段内联对象中的ID）"""
+        keys = cls._tx_node_ids(tx)
+        keys.extend(tx[key] for key in ("bid_id", "payment_id", "node_id") if isinstance(tx.get(key), str))
+        if isinstance(tx.get("bid_ids"), list):
+            keys.extend(tx["bid_ids"])
+        for field in ("data", "demand", "solution", "changes"):
+            value = tx.get(field)
+            if isinstance(value, dict):
+                keys.extend(value[key] for key in ("id", "bid_id", "payment_id", "carrier_id", "merchant_id",
+                                                   "payer_id", "from", "to") if isinstance(value.get(key), str))
+        solutions = tx.get("solutions")
+        if isinstance(solutions, list):
+            keys.extend(s["carrier_id"] for s in solutions if isinstance(s, dict) and "carrier_id" in s)
+        return keys
+    
+    def _index_block(self, block: Block) -> None:
+        """将区块内交易登记到节点倒排索引"""
+        self.transaction_count += len(block.transactions)
+        self.node_index.add_block(block.index, [(node_id, offset) for offset, tx in enumerate(block.transactions)
+                                                for node_id in self._tx_node_ids(tx)])
+    
+    def rebuild_node_index(self) -> None:
+        """从链上数据重建节点倒排索引（已裁剪时只索引基准快照之后的区块）"""
+        self.node_index.clear()
+        self.transaction_count = 0
+        start = 0
+        if self._base_snapshot is not None:
+            self.transaction_count = self._base_snapshot["transaction_count"]
+            start = self._base_snapshot["height"] + 1
+        for index in range(start, len(self.chain)):
+            self._index_block(self.chain[index])
+    
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.data_dir, "index_checkpoint.json")
+    
+    def _save_index_checkpoint(self) -> None:
+        """原子写入派生索引检查点（只含与账户数成正比的状态，倒排索引条目已随区块追加落盘）"""
+        checkpoint = {
+            "height": len(self.chain),
+            "account_state": self.account_state,
+            "token_accounts": sorted(self.token_accounts),
+            "node_index": self.node_index.summary(),
+            "transaction_count": self.transaction_count,
+            "validated_height": self.validated_height
+        }
+        tmp_path = self._checkpoint_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self._checkpoint_path())
+    
+    def _restore_indexes(self) -> None:
+        """从检查点加载派生索引，只重放检查点之后的区块"""
+        height = 0
+        if os.path.exists(self._checkpoint_path()):
+            with open(self._checkpoint_path()) as f:
+                checkpoint = json.load(f)
+            # 旧格式的检查点（倒排索引没有分段表）按全量重建处理
+            if checkpoint["height"] <= len(self.chain) and "segments" in checkpoint.get("node_index", {}):
+                height = checkpoint["height"]
+                self.account_state.update(checkpoint["account_state"])
+                self.token_accounts = set(checkpoint["token_accounts"])
+                self.node_index.restore(checkpoint["node_index"])
+                self.transaction_count = checkpoint["transaction_count"]
+                self.validated_height = checkpoint["validated_height"]
+        if height == 0:
+            self.rebuild_account_state()
+            self.rebuild_node_index()
+            return
+        for index in range(height, len(self.chain)):
+            block = self.chain[index]
+            self._apply_block_to_account_state(block)
+            self._index_block(block)
+    
+    def register_state_provider(self, name: str, export_state, restore_state) -> None:
+        """
+        注册业务状态钩子：export_state() 返回可 JSON 序列化的状态并写入状态快照，
+        restore_state(data) 在从快照恢复时调用。已从快照恢复时立即回放一次。
+        """
+        self._state_providers[name] = (export_state, restore_state)
+        latest = self.state_snapshots[-1] if self.state_snapshots else None
+        if self.restored and latest is not None and name in latest["providers"]:
+            restore_state(latest["providers"][name])
+    
+    @staticmethod
+    def _state_hash(snapshot: Dict[str, Any]) -> str:
+        body = {k: v for k, v in snapshot.items() if k != "state_hash"}
+        return _sha256(json.dumps(body, sort_keys=True).encode())
+    
+    def create_state_snapshot(self) -> Dict[str, Any]:
+        """在当前链头保存状态快照：余额、信用分与节点注册表、业务模块状态（如未完成的支付）"""
+        last_block = self.get_last_block()
+        snapshot = {
+            "height": last_block.index,
+            "block_hash": last_block.hash,
+            "created_at": time.time(),
+            "account_state": dict(self.account_state),
+            "token_accounts": sorted(self.token_accounts),
+            "nodes": [asdict(node) for node in self.nodes.values()],
+            "transaction_count": self.transaction_count,
+            "providers": {name: export_state() for name, (export_state, _) in self._state_providers.items()}
+        }
+        snapshot["state_hash"] = self._state_hash(snapshot)
+        self.state_snapshots.append(snapshot)
+        if self.data_dir:
+            self._save_state_snapshot(snapshot)
+        self._trim_state_snapshots()
+        return snapshot
+    
+    def _snapshot_dir(self) -> str:
+        return os.path.join(self.data_dir, "state_snapshots")
+    
+    def _save_state_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        os.makedirs(self._snapshot_dir(), exist_ok=True)
+        path = os.path.join(self._snapshot_dir(), f"{snapshot['height']:010d}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+    
+    def _trim_state_snapshots(self) -> None:
+        """只保留最近几个快照与裁剪基准快照"""
+        base_height = self._base_snapshot["height"] if self._base_snapshot else -1
+        keep = {snap["height"] for snap in self.state_snapshots[-self.STATE_SNAPSHOTS_KEPT:]}
+        keep.add(base_height)
+        dropped = [snap for snap in self.state_snapshots if snap["height"] not in keep]
+        self.state_snapshots = [snap for snap in self.state_snapshots if snap["height"] in keep]
+        if self.data_dir:
+            for snap in dropped:
+                path = os.path.join(self._snapshot_dir(), f"{snap['height']:010d}.json")
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def _prune_marker_path(self) -> str:
+        return os.path.join(self._snapshot_dir(), "pruned.json")
+    
+    def _load_state_snapshots(self) -> None:
+        """重启时加载磁盘上的状态快照与裁剪进度"""
+        if not os.path.isdir(self._snapshot_dir()):
+            return
+        for name in sorted(os.listdir(self._snapshot_dir())):
+            if not (name.endswith(".json") and name[:-5].isdigit()):
+                continue
+            with open(os.path.join(self._snapshot_dir(), name)) as f:
+                snapshot = json.load(f)
+            if snapshot["state_hash"] == self._state_hash(snapshot) and snapshot["height"] < len(self.chain):
+                self.state_snapshots.append(snapshot)
+        if os.path.exists(self._prune_marker_path()):
+            with open(self._prune_marker_path()) as f:
+                marker = json.load(f)
+            base = [snap for snap in self.state_snapshots if snap["height"] == marker["base_height"]]
+            if not base:
+                raise ValueError("Base state snapshot of pruned blocks is missing")
+            self._base_snapshot = base[0]
+            self.pruned_height = marker["pruned_height"]
+        self._apply_snapshot_registry(self._base_snapshot or (self.state_snapshots[-1] if self.state_snapshots else None))
+    
+    def _apply_snapshot_registry(self, snapshot: Optional[Dict[str, Any]]) -> None:
+        """按快照恢复节点注册表（质押、信用分等），补注册快照中有而本地没有的节点"""
+        if snapshot is None:
+            return
+        for data in snapshot["nodes"]:
+            if data["id"] not in self.nodes:
+                self.add_node(data["id"], data["node_type"], data["stake"], data["location"])
+            node = self.nodes[data["id"]]
+            node.stake = data["stake"]
+            node.credit_score = data["credit_score"]
+            node.last_active = data["last_active"]
+        self._weights_dirty = True
+    
+    def _maybe_prune(self) -> None:
+        """以最近一个早于保留窗口的快照为基准，裁剪其之前的区块体"""
+        horizon = self.get_last_block().index - self.retention_blocks
+        candidates = [snap for snap in self.state_snapshots
+                      if self.pruned_height < snap["height"] <= horizon]
+        if candidates:
+            self.prune_bodies(candidates[-1])
+    
+    def prune_bodies(self, base_snapshot: Dict[str, Any]) -> None:
+        """
+        裁剪基准快照高度之前的区块体，只保留区块头（含 Merkle 根）
+
+        持久化模式只整体改写已写满的分段，分段内跨越快照高度的区块暂不裁剪。
+        倒排索引只移除区块体确实已被裁剪的交易历史，区块体仍可读取的区块保留其条目；
+        只被已裁剪区块体引用的载荷随后回收。
+        """
+        height = base_snapshot["height"]
+        if isinstance(self.chain, StoredChain):
+            store = self.chain.store
+            per_segment = store.blocks_per_segment
+            first_segment = (self.pruned_height + 1) // per_segment
+            # 只改写完全位于快照之前、且已写满（不含最新区块）的分段
+            last_segment = min((height + 1) // per_segment, (len(store) - 1) // per_segment)
+            for segment in range(first_segment, last_segment):
+                start = segment * per_segment
+                store.rewrite_segment(segment, [
+                    encode_block(decode_block(store.read(i)).header_only()) for i in range(start, start + per_segment)])
+            self.chain.clear_cache()
+            pruned_height = max(self.pruned_height, last_segment * per_segment - 1)
+        else:
+            for index in range(self.pruned_height + 1, height + 1):
+                self.chain[index] = self.chain[index].header_only()
+            pruned_height = height
+        
+        self._base_snapshot = base_snapshot
+        if pruned_height > self.pruned_height:
+            self.node_index.drop_through(pruned_height)
+        self.pruned_height = pruned_height
+        if self.data_dir:
+            with open(self._prune_marker_path() + ".tmp", "w") as f:
+                json.dump({"pruned_height": pruned_height, "base_height": height}, f)
+            os.replace(self._prune_marker_path() + ".tmp", self._prune_marker_path())
+            self._save_index_checkpoint()
+        self._trim_state_snapshots()
+        self._sweep_payloads()
+    
+    def _sweep_payloads(self) -> None:
+        """回收只被已裁剪区块体引用的载荷：存活集合为未裁剪区块体与交易池中交易的引用"""
+        bodies = (self.chain[index] for index in range(self.pruned_height + 1, len(self.chain)))
+        self.payloads.sweep(self.payloads.reachable(
+            itertools.chain((tx for block in bodies for tx in block.transactions), self.mempool.transactions())))
+    
+    def export_bootstrap(self) -> Tuple[Dict[str, Any], List[Block], List[Block], Dict[str, bytes]]:
+        """导出冷启动数据：(最新状态快照, 快照高度及之前的区块头, 之后的完整区块, 这些区块引用的载荷)"""
+        if not self.state_snapshots:
+            raise ValueError("No state snapshot available")
+        snapshot = self.state_snapshots[-1]
+        height = snapshot["height"]
+        headers = [self.chain[i].header_only() for i in range(height + 1)]
+        recent = self.chain[height + 1:]
+        return snapshot, headers, recent, self.payloads.bundle(tx for block in recent for tx in block.transactions)
+    
+    @classmethod
+    def bootstrap_from_state_snapshot(cls, snapshot: Dict[str, Any], headers: List[Block],
+                                      recent: List[Block], payloads: Optional[Dict[str, bytes]] = None,
+                                      **kwargs) -> "Blockchain":
+        """
+        冷节点启动：校验区块头链与快照，直接装载快照状态，只重放快照之后的区块，
+        无需从创世区块开始重放全部交易
+        """
+        if snapshot["state_hash"] != cls._state_hash(snapshot):
+            raise ValueError("State snapshot hash mismatch")
+        height = snapshot["height"]
+        if len(headers) != height + 1 or headers[height].hash != snapshot["block_hash"]:
+            raise ValueError("Headers do not end at the snapshot block")
+        chain = cls(genesis_timestamp=headers[0].timestamp, **kwargs)
+        if chain.restored or chain.chain[0].hash != headers[0].hash:
+            raise ValueError("Genesis block mismatch")
+        chain._apply_snapshot_registry(snapshot)
+        public_keys = chain.get_public_keys()
+        for header in headers[1:]:
+            previous = chain.chain[-1]
+            if header.index != previous.index + 1 or header.previous_hash != previous.hash:
+                raise ValueError(f"Broken header chain at {header.index}")
+            if not chain._has_expected_difficulty(header) or not verify_header_seal(header, public_keys,
+                                                                                    chain.consensus):
+                raise ValueError(f"Invalid header {header.index}")
+            chain.chain.append(header.header_only())
+        
+        chain.account_state = dict(snapshot["account_state"])
+        chain.token_accounts = set(snapshot.get("token_accounts", []))
+        chain.transaction_count = snapshot["transaction_count"]
+        chain.node_index.clear()
+        chain.state_snapshots = [snapshot]
+        chain._base_snapshot = snapshot
+        chain.pruned_height = height
+        chain.validated_height = height + 1
+        for name, (_, restore_state) in chain._state_providers.items():
+            if name in snapshot["providers"]:
+                restore_state(snapshot["providers"][name])
+        chain.payloads.import_bundle(payloads or {})
+        for block in recent:
+            if not chain.add_block(block):
+                raise ValueError(f"Invalid block {block.index}")
+        chain.restored = True
+        return chain
+    
+    def get_block(self, index: int) -> Block:
+        """按区块索引获取区块"""
+        return self.chain[index]
+    
+    def get_transaction_proof(self, block_index: int, tx_offset: int) -> Dict[str, Any]:
+        """生成单笔交易（如需求、支付）的包含证明，可配合 verify_merkle_proof 独立验证"""
+        block = self.get_block(block_index)
+        return {
+            "transaction": block.transactions[tx_offset],
+            "block_index": block.index,
+            "block_hash": block.hash,
+            "merkle_root": block.merkle_root,
+            "proof": block.get_merkle_proof(tx_offset)
+        }
     
     def proof_of_work(self, block: Block) -> Block:
         """工作量证明"""
+        if self.mining_workers > 1:
+            return self._parallel_proof_of_work(block)
+        prefix, suffix = block.hash_template()
+        nonce = 0
+        result = None
+        while result is None:
+            result = search_nonce_range(prefix, suffix, block.difficulty, nonce, self.NONCE_CHUNK_SIZE)
+            nonce += self.NONCE_CHUNK_SIZE
+        block.nonce, block.hash = result
+        return block
+    
+    def expected_difficulty(self, index: int, blocks: Optional[List[Block]] = None) -> int:
+        """第 index 个区块应记录的难度，blocks 默认为当前主链（校验分叉时传入候选链）"""
+        blocks = self.chain if blocks is None else blocks
+        previous_difficulty = blocks[index - 1].difficulty if index > 1 else self.difficulty
+        return self._retarget(index, previous_difficulty, lambda i: blocks[i].timestamp)
+    
+    def _retarget(self, index: int, previous_difficulty: int, timestamp_at) -> int:
+        """
+        难度调整规则：签名出块为 0；未设置目标出块时间时固定为初始难度；
+        否则每 retarget_window 个区块按上一周期的实际耗时调整，其余区块沿用前一区块的难度。
+        调整周期不含创世区块（其时间戳与首个业务区块可能相距很久）。
+        """
+        if self.consensus != "pow":
+            return 0
+        if self.target_block_time is None or index <= 1:
+            return self.difficulty
+        window = self.retarget_window
+        if index % window or index - 1 - window < 1:
+            return previous_difficulty
+        timespan = timestamp_at(index - 1) - timestamp_at(index - 1 - window)
+        return retarget_difficulty(previous_difficulty, timespan, window, self.target_block_time,
+                                   self.MAX_RETARGET_STEP, self.MIN_DIFFICULTY, self.MAX_DIFFICULTY)
+    
+    def _has_expected_difficulty(self, block: Block, blocks: Optional[List[Block]] = None) -> bool:
+        return block.difficulty == self.expected_difficulty(block.index, blocks)
+    
+    def _has_valid_reward(self, block: Block) -> bool:
+        """
+        外部区块的挖矿奖励：出块节点须为超级节点，奖励交易恰好一笔且位于区块末尾，
+        领取者为出块节点，金额符合该高度的奖励规则
+        """
+        sealer = self.nodes.get(block.sealer)
+        if sealer is None or sealer.node_type != "super_node":
+            return False
+        transactions = block.transactions
+        rewards = [offset for offset, tx in enumerate(transactions) if tx["type"] == "mining_reward"]
+        if rewards != [len(transactions) - 1]:
+            return False
+        reward = transactions[-1]
+        return reward.get("miner") == block.sealer and reward.get("amount") == self.get_mining_reward(block.index)
+    
+    def _has_expected_sealer(self, block: Block, parent: Block) -> bool:
+        """PoS/轮换模式下区块须由按父区块选出的节点签名，其他超级节点的签名同样无效"""
+        return self.consensus == "pow" or block.sealer == self.select_sealer(parent)
+    
+    def sign_block(self, block: Block, sealer_id: str) -> Block:
+        """签名出块：计算一次区块头哈希并由出块节点签名，无需搜索 nonce"""
+        if sealer_id not in self._signing_keys:
+            raise ValueError(f"No signing key for sealer {sealer_id}")
         block.nonce = 0
-        calculated_hash = block.calculate_hash()
+        block.hash = block.calculate_hash()
+        block.signature = self._signing_keys[sealer_id].sign(bytes.fromhex(block.hash)).hex()
+        return block
+    
+    def get_public_keys(self) -> Dict[str, str]:
+        """超级节点的出块签名公钥"""
+        return {node_id: node.public_key for node_id, node in self.nodes.items() if node.public_key}
+    
+    def _get_mining_pool(self):
+        """懒加载挖矿进程池"""
+        if self._mining_pool is None:
+            self._mining_stop_event = multiprocessing.Event()
+            self._mining_pool = multiprocessing.Pool(
+                self.mining_workers,
+                initializer=_init_mining_worker,
+                initargs=(self._mining_stop_event,)
+            )
+        return self._mining_pool
+    
+    def _parallel_proof_of_work(self, block: Block) -> Block:
+        """多进程并行工作量证明：按区间切分 nonce 空间，任一进程命中后通知其余进程停止"""
+        pool = self._get_mining_pool()
+        prefix, suffix = block.hash_template()
+        results = queue.Queue()
+        self._mining_stop_event.clear()
+        
+        next_start = 0
+        outstanding = 0
+        for _ in range(self.mining_workers * 2):
+            pool.apply_async(search_nonce_range,
+                             (prefix, suffix, block.difficulty, next_start, self.NONCE_CHUNK_SIZE),
+                             callback=results.put, error_callback=results.put)
+            next_start += self.NONCE_CHUNK_SIZE
+            outstanding += 1
         
-        while not calculated_hash.startswith('0' * self.difficulty):
-            block.nonce += 1
-            calculated_hash = block.calculate_hash()
+        found = None
+        while found is None:
+            result = results.get()
+            outstanding -= 1
+            if isinstance(result, BaseException):
+                self._mining_stop_event.set()
+                raise result
+            if result is not None:
+                found = result
+            else:
+                pool.apply_async(search_nonce_range,
+                                 (prefix, suffix, block.difficulty, next_start, self.NONCE_CHUNK_SIZE),
+                                 callback=results.put, error_callback=results.put)
+                next_start += self.NONCE_CHUNK_SIZE
+                outstanding += 1
         
-        block.hash = calculated_hash
+        # 通知其余进程停止，并等待在途任务退出，避免影响下一次搜索
+        self._mining_stop_event.set()
+        for _ in range(outstanding):
+            results.get()
+        
+        block.nonce, block.hash = found
         return block
     
-    def get_mining_reward(self) -> float:
-        """计算挖矿奖励"""
+    def set_mining_workers(self, workers: int) -> None:
+        """调整并行挖矿进程数"""
+        workers = max(1, workers)
+        if workers != self.mining_workers:
+            self.close_mining_pool()
+            self.mining_workers = workers
+    
+    def close_mining_pool(self) -> None:
+        """关闭挖矿进程池"""
+        if self._mining_pool is not None:
+            self._mining_pool.terminate()
+            self._mining_pool.join()
+            self._mining_pool = None
+            self._mining_stop_event = None
+    
+    def get_mining_reward(self, index: Optional[int] = None) -> float:
+        """计算第 index 个区块（默认为下一个区块）的挖矿奖励"""
         base_reward = 10.0
-        return base_reward * (0.95 ** (len(self.chain) // 100))
+        index = len(self.chain) if index is None else index
+        return base_reward * (0.95 ** (index // 100))
     
-    def is_chain_valid(self) -> bool:
-        """验证区块链的有效性"""
-        for i in range(1, len(self.chain)):
+    def is_chain_valid(self, full: bool = False, workers: int = 1) -> bool:
+        """
+        验证区块链的有效性
+        
+        Args:
+            full: False 时只验证可信检查点之后新增的区块；True 时全量审计
+            workers: 全量审计时并行重算哈希的进程数
+        """
+        if full:
+            return self.audit_chain(workers)
+        public_keys = self.get_public_keys()
+        for i in range(max(self.validated_height, 1), len(self.chain)):
             current_block = self.chain[i]
-            previous_block = self.chain[i-1]
-            if current_block.hash != current_block.calculate_hash():
+            if not verify_block_seal(current_block, public_keys, self.consensus):
+                return False
+            if not self._has_expected_difficulty(current_block):
+                return False
+            if current_block.previous_hash != self.chain[i-1].hash:
                 return False
-            if current_block.previous_hash != previous_block.hash:
+        self.validated_height = len(self.chain)
+        return True
+    
+    def audit_chain(self, workers: int = 1) -> bool:
+        """全量审计：各区块哈希独立并行重算，只有前后链接检查顺序进行"""
+        height = len(self.chain)
+        chunk_size = max(1, min(1000, height // (workers * 4) or 1))
+        if isinstance(self.chain, StoredChain):
+            # 持久化模式直接传递原始载荷，由工作进程解码
+            items = (self.chain.store.read(i) for i in range(height))
+        else:
+            items = iter(self.chain)
+        chunks = []
+        while True:
+            chunk = [item for _, item in zip(range(chunk_size), items)]
+            if not chunk:
+                break
+            chunks.append(chunk)
+        
+        verify_chunk = functools.partial(_verify_block_chunk, public_keys=self.get_public_keys(),
+                                         consensus=self.consensus)
+        if workers > 1:
+            with multiprocessing.Pool(workers) as pool:
+                results = pool.map(verify_chunk, chunks)
+        else:
+            results = map(verify_chunk, chunks)
+        
+        previous_hash = None
+        previous_difficulty = self.difficulty
+        # 难度调整只需要最近一个周期的时间戳
+        recent = deque(maxlen=self.retarget_window + 1)
+        index = 0
+        for sealed, links in results:
+            if not sealed:
                 return False
+            for block_hash, block_previous_hash, timestamp, difficulty in links:
+                if previous_hash is not None and block_previous_hash != previous_hash:
+                    return False
+                if index > 0:
+                    start = index - len(recent)
+                    expected = self._retarget(index, previous_difficulty, lambda i: recent[i - start])
+                    if difficulty != expected:
+                        return False
+                    previous_difficulty = difficulty
+                recent.append(timestamp)
+                previous_hash = block_hash
+                index += 1
+        self.validated_height = height
         return True
     
     def get_last_block(self) -> Block:
@@ -182,20 +1321,18 @@ class Blockchain:
         return self.chain[-1]
     
     def get_node_balance(self, node_id: str) -> float:
-        """获取节点代币余额"""
-        if node_id not in self.nodes:
-            return 0.0
-        balance = self.nodes[node_id].stake
-        for block in self.chain:
-            for tx in block.transactions:
-                if tx["type"] == "mining_reward" and tx["miner"] == node_id:
-                    balance += tx["amount"]
-                elif tx["type"] == "transfer":
-                    if tx.get("from") == node_id:
-                        balance -= tx.get("amount", 0)
-                    if tx.get("to") == node_id:
-                        balance += tx.get("amount", 0)
-        return balance
+        """获取节点（或代币账户）余额（读取账户状态表）"""
+        return self.account_state.get(node_id, 0.0)
+    
+    def _scan_balances(self) -> Dict[str, float]:
+        """全链扫描计算全部账户余额，作为账户状态表的校验基准"""
+        balances, token_accounts, start = self._base_account_state()
+        for index in range(start, len(self.chain)):
+            for tx in self.chain[index].transactions:
+                for node_id, delta in self._balance_deltas(tx, token_accounts):
+                    if node_id is not None:
+                        balances[node_id] = balances.get(node_id, 0.0) + delta
+        return balances
     
     def get_node_credit_score(self, node_id: str) -> float:
         """获取节点信用分"""
@@ -208,24 +1345,58 @@ class Blockchain:
         if node_id in self.nodes:
             self.nodes[node_id].credit_score = max(0.0, min(10.0, 
                 self.nodes[node_id].credit_score + score_change))
+            if self.nodes[node_id].node_type == "super_node":
+                self._weights_dirty = True
+    
+    def _rebuild_sealer_weights(self) -> None:
+        """重建超级节点的 质押×信用分 累积权重数组"""
+        self._sealer_ids = sorted(node_id for node_id, node in self.nodes.items()
+                                  if node.node_type == "super_node")
+        self._cumulative_weights = []
+        total = 0.0
+        for node_id in self._sealer_ids:
+            total += self.nodes[node_id].stake * self.nodes[node_id].credit_score
+            self._cumulative_weights.append(total)
+        self._weights_dirty = False
     
-    def select_super_node(self) -> Optional[str]:
-        """选择超级节点（用于出块）"""
-        super_nodes = [node_id for node_id, node in self.nodes.items() if node.node_type == "super_node"]
-        if not super_nodes:
+    def select_super_node(self, seed: Optional[str] = None) -> Optional[str]:
+        """
+        选择超级节点（用于出块），按 质押×信用分 加权
+        
+        Args:
+            seed: 十六进制种子（如上一区块哈希），给定时选择结果可复现
+        """
+        if self._weights_dirty:
+            self._rebuild_sealer_weights()
+        if not self._sealer_ids or self._cumulative_weights[-1] <= 0:
             return None
-        weights = [self.nodes[node_id].stake * self.nodes[node_id].credit_score for node_id in super_nodes]
-        return random.choices(super_nodes, weights=weights, k=1)[0]
+        fraction = int(seed, 16) / 16 ** len(seed) if seed else random.random()
+        position = bisect.bisect_right(self._cumulative_weights, fraction * self._cumulative_weights[-1])
+        return self._sealer_ids[min(position, len(self._sealer_ids) - 1)]
+    
+    def select_sealer(self, last_block: Block) -> Optional[str]:
+        """PoS/轮换模式下选择下一个区块的签名节点"""
+        if self.consensus == "round_robin":
+            if self._weights_dirty:
+                self._rebuild_sealer_weights()
+            if not self._sealer_ids:
+                return None
+            return self._sealer_ids[(last_block.index + 1) % len(self._sealer_ids)]
+        return self.select_super_node(seed=last_block.hash)
     
     def get_chain_stats(self) -> Dict[str, Any]:
         """获取区块链统计信息"""
         return {
             "block_count": len(self.chain),
-            "transaction_count": sum(len(block.transactions) for block in self.chain),
+            "transaction_count": self.transaction_count,
             "node_count": len(self.nodes),
             "super_node_count": len([node for node in self.nodes.values() if node.node_type == "super_node"]),
             "average_block_time": self._calculate_average_block_time(),
-            "total_stake": sum(node.stake for node in self.nodes.values())
+            "difficulty": self.get_last_block().difficulty,
+            "target_block_time": self.target_block_time,
+            "total_stake": sum(node.stake for node in self.nodes.values()),
+            "payload_count": len(self.payloads),
+            "payload_bytes": self.payloads.stats["bytes_stored"]
         }
     
     def _calculate_average_block_time(self) -> float:
@@ -236,41 +1407,142 @@ class Blockchain:
         return total_time / (len(self.chain) - 1)
     
     def get_node_transactions(self, node_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """获取节点相关的交易"""
+        """获取节点相关的交易（最新在前）"""
+        return self.get_node_history(node_id, offset=0, limit=limit)["transactions"]
+    
+    def get_node_history(self, node_id: str, offset: int = 0, limit: int = 10) -> Dict[str, Any]:
+        """分页获取节点交易历史，只读取倒排索引中命中的条目"""
         transactions = []
-        for block in reversed(self.chain):
-            for tx in block.transactions:
-                if (tx.get("from") == node_id or 
-                    tx.get("to") == node_id or 
-                    tx.get("miner") == node_id):
+        for block_index, tx_offset in self.node_index.page(node_id, offset, limit):
+            block = self.get_block(block_index)
+            transactions.append({
+                **self.payloads.resolve(block.transactions[tx_offset]),
+                "block_index": block.index,
+                "block_hash": block.hash
+            })
+        return {
+            "node_id": node_id,
+            "total": self.node_index.counts.get(node_id, 0),
+            "offset": offset,
+            "transactions": transactions
+        }
+    
+    def _block_bloom(self, index: int) -> bytes:
+        if isinstance(self.chain, StoredChain):
+            return self.chain.bloom(index)
+        return self.chain[index].bloom
+    
+    def find_blocks(self, key: str, start: int = 0, end: Optional[int] = None, verify: bool = True) -> List[int]:
+        """
+        查找 [start, end) 内涉及 key（节点ID、竞标ID、支付ID、需求ID）的区块索引
+
+        先用各区块的布隆过滤器排除一定不含 key 的区块（不解码交易区）；verify=True 时
+        再解码候选区块剔除误判。区块体已裁剪的候选区块无法核对，按命中返回。
+        """
+        end = len(self.chain) if end is None else min(end, len(self.chain))
+        probe = BloomFilter.probe(key)
+        matches = []
+        for index in range(max(start, 0), end):
+            if not BloomFilter.might_contain(self._block_bloom(index), probe):
+                continue
+            if verify:
+                block = self.chain[index]
+                if not block.pruned and not any(key in self._tx_keys(tx) for tx in block.transactions):
+                    continue
+            matches.append(index)
+        return matches
+    
+    def find_transactions(self, key: str, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """查找 [start, end) 内涉及 key 的全部交易（按链上顺序，引用的载荷已还原）"""
+        transactions = []
+        for index in self.find_blocks(key, start, end):
+            block = self.chain[index]
+            for offset, tx in enumerate(block.transactions):
+                if key in self._tx_keys(tx):
                     transactions.append({
-                        **tx,
+                        **self.payloads.resolve(tx),
                         "block_index": block.index,
-                        "block_hash": block.hash
+                        "block_hash": block.hash,
+                        "tx_offset": offset
                     })
-                if len(transactions) >= limit:
-                    return transactions
         return transactions
     
     def get_active_nodes(self) -> List[str]:
-        """获取活跃节点列表（最近参与交易或挖矿的节点）"""
-        active_nodes = set()
-        # 检查最近 10 个区块内的活跃节点
-        for block in self.chain[-10:] if len(self.chain) > 10 else self.chain:
-            for tx in block.transactions:
-                if "miner" in tx:
-                    active_nodes.add(tx["miner"])
-                if "from" in tx:
-                    active_nodes.add(tx["from"])
-                if "to" in tx:
-                    active_nodes.add(tx["to"])
-                # 检查交易数据中可能的节点ID
-                if "data" in tx and isinstance(tx["data"], dict):
-                    if "carrier_id" in tx["data"]:
-                        active_nodes.add(tx["data"]["carrier_id"])
-                    if "merchant_id" in tx["data"]:
-                        active_nodes.add(tx["data"]["merchant_id"])
-        return list(active_nodes)
+        """获取活跃节点列表（最近 10 个区块内参与交易或挖矿的节点）"""
+        min_index = self.get_last_block().index - 9
+        return [node_id for node_id, block_index in self.node_index.last_block.items() if block_index >= min_index]
+
+class BlockProducer:
+    """出块调度器：待处理交易达到数量、字节或等待时间任一阈值时才封装区块"""
+    
+    def __init__(self, chain: Blockchain, miner_node_id: str = "SuperNode_A",
+                 max_transactions: int = 100, max_bytes: int = 512 * 1024,
+                 max_delay_ms: int = 5000):
+        self.chain = chain
+        self.miner_node_id = miner_node_id
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.max_delay_ms = max_delay_ms
+        self._timer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+    
+    def should_seal(self) -> bool:
+        """判断待处理池是否已达到任一出块阈值"""
+        if not len(self.chain.mempool):
+            return False
+        if len(self.chain.mempool) >= self.max_transactions:
+            return True
+        if self.chain.pending_bytes >= self.max_bytes:
+            return True
+        return (time.time() - self.chain.pending_since) * 1000 >= self.max_delay_ms
+    
+    def submit(self, transaction: Dict[str, Any]) -> int:
+        """添加交易，并在达到阈值时出块"""
+        block_index = self.chain.add_transaction(transaction)
+        self.maybe_seal()
+        return block_index
+    
+    def maybe_seal(self) -> Optional[Block]:
+        """达到阈值时封装区块，否则继续累积"""
+        if self.should_seal():
+            return self.flush()
+        return None
+    
+    def flush(self) -> Optional[Block]:
+        """立即封装全部待处理交易，供需要确认结果的调用方同步使用"""
+        block = None
+        while len(self.chain.mempool):
+            block = self.chain.mine_pending_transactions(self.miner_node_id)
+        return block
+    
+    def start(self, interval: float = 0.5) -> None:
+        """启动后台线程，按时间阈值定期检查出块"""
+        if self._timer is not None:
+            return
+        self._stop.clear()
+        
+        def _run():
+            while not self._stop.wait(interval):
+                self.maybe_seal()
+        
+        self._timer = threading.Thread(target=_run, name="block-producer", daemon=True)
+        self._timer.start()
+    
+    def stop(self) -> None:
+        """停止后台出块线程"""
+        if self._timer is not None:
+            self._stop.set()
+            self._timer.join()
+            self._timer = None
 
 # 创建全局区块链实例
-blockchain = Blockchain()
\ No newline at end of file
+blockchain = Blockchain(mining_workers=int(os.getenv("MINING_WORKERS", "1")),
+                        data_dir=os.getenv("LEDGER_DATA_DIR"),
+                        consensus=os.getenv("CONSENSUS", "pow"),
+                        target_block_time=float(os.getenv("TARGET_BLOCK_TIME", "5")),
+                        retarget_window=int(os.getenv("RETARGET_WINDOW", "10")),
+                        snapshot_interval=int(os.getenv("SNAPSHOT_INTERVAL", "1000")),
+                        retention_blocks=int(os.getenv("RETENTION_BLOCKS", "5000")),
+                        bloom_fp_rate=float(os.getenv("BLOOM_FP_RATE", "0.01")),
+                        keystore=load_keystore(os.environ["NODE_KEYSTORE"]) if os.getenv("NODE_KEYSTORE") else None)
+block_producer = BlockProducer(blockchain)
\ No newline at end of file
@@ -0,0 +1,64 @@
+from typing import Iterable, Iterator, Tuple
+import hashlib
+import math
+
+class BloomFilter:
+    """
+    布隆过滤器：判断键“可能存在”或“一定不存在”
+
+    位数组大小与哈希函数个数按预期键数与误判率计算；键的 k 个位置由一次 BLAKE2b 摘要
+    拆成两个 64 位整数做增强双重哈希得到（步长逐次递增，避免普通双重哈希在位数较少时
+    位置重复导致误判率偏高），查询多个过滤器时摘要只需计算一次。
+    序列化格式：[哈希函数个数 u8][位数组]，空字节串表示没有过滤器（无法排除任何键）。
+    """
+
+    __slots__ = ("bits", "hashes")
+
+    def __init__(self, size_bits: int, hashes: int):
+        self.bits = bytearray((max(size_bits, 8) + 7) // 8)
+        self.hashes = max(1, min(hashes, 255))
+
+    @classmethod
+    def from_keys(cls, keys: Iterable[str], fp_rate: float = 0.01) -> "BloomFilter":
+        """按键数与误判率 fp_rate 确定大小并加入全部键"""
+        keys = list(dict.fromkeys(keys))
+        count = max(len(keys), 1)
+        size_bits = math.ceil(-count * math.log(fp_rate) / (math.log(2) ** 2))
+        bloom = cls(size_bits, round(size_bits / count * math.log(2)))
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    @staticmethod
+    def probe(key: str) -> Tuple[int, int]:
+        """键的双重哈希种子 (h1, h2)"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+    @staticmethod
+    def _positions(probe: Tuple[int, int], size: int, hashes: int) -> Iterator[int]:
+        position, step = probe[0] % size, probe[1] % size
+        for i in range(hashes):
+            yield position
+            position = (position + step) % size
+            step = (step + i) % size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(self.probe(key), len(self.bits) * 8, self.hashes):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return self.might_contain(self.to_bytes(), self.probe(key))
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.hashes]) + bytes(self.bits)
+
+    @staticmethod
+    def might_contain(data: bytes, probe: Tuple[int, int]) -> bool:
+        """直接在序列化的过滤器上查询；data 为空（没有过滤器）时返回 True"""
+        if not data:
+            return True
+        for position in BloomFilter._positions(probe, (len(data) - 1) * 8, data[0]):
+            if not data[1 + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
@@ -0,0 +1,463 @@
+"""
+紧凑的规范二进制编码
+
+用于区块头哈希、交易哈希（Merkle 叶子）、区块持久化与节点间复制：
+
+- 通用值：1 字节类型标记 + 内容；整数用 zigzag 变长编码，字典按键排序，
+  同一内容只有一种编码，可直接用于哈希
+- 内容引用：载荷存储中对象的 SHA-256 摘要（32 字节），交易可用它代替较大的嵌套对象
+- 交易：已知交易类型编码为 类型编号 + 字段存在位图 + 按固定顺序排列的字段值，
+  字段名不写入编码；未登记的字段放入附加字典
+- 区块：定长区块头（nonce 固定 8 字节放在末尾，便于挖矿时复用哈希中间状态）
+  + 带长度前缀的交易区，只需区块头时可跳过交易解码
+
+交易在内存中以 __slots__ 记录对象保存，同时提供只读的字典接口（tx["type"]、tx.get(...)、
+{**tx}），调用方无需区分记录与字典。
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import struct
+
+_DOUBLE = struct.Struct(">d")
+_NONCE = struct.Struct(">Q")
+
+# 通用值类型标记
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _BYTES, _LIST, _DICT, _REF = range(10)
+
+class PayloadRef(str):
+    """内容寻址引用：值为载荷规范编码的 SHA-256 十六进制摘要，编码为 32 字节原始摘要"""
+    __slots__ = ()
+
+def _write_varint(out: bytearray, value: int) -> None:
+    if value < 0x80:
+        out.append(value)
+        return
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def _write_str(out: bytearray, value: str) -> None:
+    raw = value.encode()
+    _write_varint(out, len(raw))
+    out += raw
+
+def _read_str(data: bytes, pos: int) -> Tuple[str, int]:
+    length, pos = _read_varint(data, pos)
+    return data[pos:pos + length].decode(), pos + length
+
+# 字典键高度重复，缓存其编码（varint 长度 + UTF-8）与解码结果
+_KEY_CACHE_LIMIT = 4096
+_encoded_keys: Dict[str, bytes] = {}
+_decoded_keys: Dict[bytes, str] = {}
+
+def _encoded_key(key: str) -> bytes:
+    encoded = _encoded_keys.get(key)
+    if encoded is None:
+        if not isinstance(key, str):
+            raise TypeError(f"Dictionary keys must be str, got {type(key).__name__}")
+        out = bytearray()
+        _write_str(out, key)
+        encoded = bytes(out)
+        if len(_encoded_keys) < _KEY_CACHE_LIMIT:
+            _encoded_keys[key] = encoded
+    return encoded
+
+def _write_none(out: bytearray, value: Any) -> None:
+    out.append(_NONE)
+
+def _write_bool(out: bytearray, value: bool) -> None:
+    out.append(_TRUE if value else _FALSE)
+
+def _write_string(out: bytearray, value: str) -> None:
+    out.append(_STR)
+    raw = value.encode()
+    _write_varint(out, len(raw))
+    out += raw
+
+def _write_int(out: bytearray, value: int) -> None:
+    out.append(_INT)
+    _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+
+def _write_float(out: bytearray, value: float) -> None:
+    out.append(_FLOAT)
+    out += _DOUBLE.pack(value)
+
+def _write_dict(out: bytearray, value: Any) -> None:
+    out.append(_DICT)
+    _write_varint(out, len(value))
+    for key in sorted(value.keys()):
+        out += _encoded_key(key)
+        item = value[key]
+        _WRITERS.get(type(item), _write_other)(out, item)
+
+def _write_list(out: bytearray, value: Any) -> None:
+    out.append(_LIST)
+    _write_varint(out, len(value))
+    for item in value:
+        _WRITERS.get(type(item), _write_other)(out, item)
+
+def _write_bytes(out: bytearray, value: bytes) -> None:
+    out.append(_BYTES)
+    _write_varint(out, len(value))
+    out += value
+
+def _write_ref(out: bytearray, value: PayloadRef) -> None:
+    out.append(_REF)
+    out += bytes.fromhex(value)
+
+def _write_other(out: bytearray, value: Any) -> None:
+    """子类（如 IntEnum、OrderedDict）按其基础类型编码"""
+    if isinstance(value, PayloadRef):
+        _write_ref(out, value)
+    elif isinstance(value, bool):
+        _write_bool(out, value)
+    elif isinstance(value, str):
+        _write_string(out, value)
+    elif isinstance(value, int):
+        _write_int(out, value)
+    elif isinstance(value, float):
+        _write_float(out, value)
+    elif isinstance(value, (dict, TxRecord)):
+        _write_dict(out, value)
+    elif isinstance(value, (list, tuple)):
+        _write_list(out, value)
+    elif isinstance(value, (bytes, bytearray)):
+        _write_bytes(out, value)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+# 按精确类型分派，避免逐个 isinstance 判断
+_WRITERS = {
+    type(None): _write_none, bool: _write_bool, str: _write_string, int: _write_int,
+    float: _write_float, dict: _write_dict, list: _write_list, tuple: _write_list,
+    bytes: _write_bytes, bytearray: _write_bytes, PayloadRef: _write_ref,
+}
+
+def _write_value(out: bytearray, value: Any) -> None:
+    _WRITERS.get(type(value), _write_other)(out, value)
+
+def _read_key(data: bytes, pos: int) -> Tuple[str, int]:
+    length, pos = _read_varint(data, pos)
+    end = pos + length
+    raw = data[pos:end]
+    key = _decoded_keys.get(raw)
+    if key is None:
+        key = raw.decode()
+        if len(_decoded_keys) < _KEY_CACHE_LIMIT:
+            _decoded_keys[raw] = key
+    return key, end
+
+def _read_value(data: bytes, pos: int) -> Tuple[Any, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == _STR:
+        length, pos = _read_varint(data, pos)
+        end = pos + length
+        return data[pos:end].decode(), end
+    if tag == _INT:
+        raw, pos = _read_varint(data, pos)
+        return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1), pos
+    if tag == _DICT:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            key, pos = _read_key(data, pos)
+            result[key], pos = _read_value(data, pos)
+        return result, pos
+    if tag == _LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _read_value(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _BYTES:
+        length, pos = _read_varint(data, pos)
+        return bytes(data[pos:pos + length]), pos + length
+    if tag == _REF:
+        return PayloadRef(data[pos:pos + 32].hex()), pos + 32
+    raise ValueError(f"Unknown value tag {tag}")
+
+def encode_value(value: Any) -> bytes:
+    """规范编码任意 JSON 风格的值（另支持 bytes）"""
+    out = bytearray()
+    _write_value(out, value)
+    return bytes(out)
+
+def decode_value(data: bytes) -> Any:
+    value, pos = _read_value(data, 0)
+    if pos != len(data):
+        raise ValueError("Trailing bytes after encoded value")
+    return value
+
+# ---- 交易记录 ----
+
+_MISSING = object()
+
+class TxRecord:
+    """
+    交易记录基类：按交易类型固定字段，以 __slots__ 保存，提供只读字典接口
+
+    未登记的交易类型直接使用本类，类型名与全部字段保存在 extra 中。
+    """
+
+    __slots__ = ("extra",)
+    TYPE = ""
+    TYPE_ID = 0
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, tx: Dict[str, Any]):
+        extra = None
+        fields = self.FIELDS
+        for key, value in tx.items():
+            if key in fields:
+                object.__setattr__(self, key, value)
+            elif key != "type" or not self.TYPE:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self.extra = extra
+
+    def _type(self) -> str:
+        return self.TYPE or self.extra["type"]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "type":
+            return self._type()
+        if key in self.FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> List[str]:
+        keys = ["type"] if self.TYPE else []
+        keys.extend(field for field in self.FIELDS if hasattr(self, field))
+        if self.extra is not None:
+            keys.extend(self.extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (TxRecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+# 交易类型 -> 固定字段（"type" 由记录类表示，"timestamp" 为公共字段）。
+# 编号即在列表中的位置加 1，只允许在末尾追加，否则已持久化的区块无法解码。
+TX_SCHEMAS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("genesis", ("data",)),
+    ("mining_reward", ("miner", "amount")),
+    ("transfer", ("from", "to", "amount")),
+    ("demand", ("data",)),
+    ("bidding_started", ("bid_id", "demand")),
+    ("first_round_bid", ("bid_id", "data")),
+    ("second_round_bid", ("bid_id", "data")),
+    ("solutions_generated", ("bid_id", "solutions")),
+    ("solution_selected", ("solution",)),
+    ("payment_created", ("payment_id", "data")),
+    ("payment_advanced", ("payment",)),
+    ("payment_stage", ("payment_id", "stage", "amount")),
+    ("payment_update", ("payment_id",)),
+    ("refund_requested", ("payment_id", "reason")),
+    ("refund_processed", ("payment_id", "approved")),
+    ("init_balance", ("node_id", "amount")),
+    ("token_transfer", ("data",)),
+    ("token_reward", ("data",)),
+    ("carbon_compensation", ("data",)),
+    ("burn_tokens", ("amount",)),
+    ("payment_delta", ("payment_id", "event", "changes", "removed")),
+    ("bid_batch", ("batch_id", "bid_ids", "carrier_ids", "bids")),
+]
+
+def _class_name(tx_type: str) -> str:
+    return "".join(part.capitalize() for part in tx_type.split("_")) + "Tx"
+
+TX_RECORDS: Dict[str, type] = {}
+_RECORDS_BY_ID: Dict[int, type] = {0: TxRecord}
+for _type_id, (_tx_type, _fields) in enumerate(TX_SCHEMAS, start=1):
+    _fields = _fields + ("timestamp",)
+    _cls = type(_class_name(_tx_type), (TxRecord,), {
+        "__slots__": _fields, "TYPE": _tx_type, "TYPE_ID": _type_id, "FIELDS": _fields})
+    TX_RECORDS[_tx_type] = _cls
+    _RECORDS_BY_ID[_type_id] = _cls
+    globals()[_cls.__name__] = _cls
+
+def to_record(tx: Any) -> TxRecord:
+    """将交易字典转换为对应类型的记录对象"""
+    if isinstance(tx, TxRecord):
+        return tx
+    return TX_RECORDS.get(tx.get("type"), TxRecord)(tx)
+
+def _write_transaction(out: bytearray, tx: Any) -> None:
+    record = to_record(tx)
+    _write_varint(out, record.TYPE_ID)
+    present = 0
+    values = []
+    for bit, field in enumerate(record.FIELDS):
+        value = getattr(record, field, _MISSING)
+        if value is not _MISSING:
+            present |= 1 << bit
+            values.append(value)
+    _write_varint(out, present)
+    for value in values:
+        _write_value(out, value)
+    _write_value(out, record.extra)
+
+def _read_transaction(data: bytes, pos: int) -> Tuple[TxRecord, int]:
+    type_id, pos = _read_varint(data, pos)
+    cls = _RECORDS_BY_ID[type_id]
+    present, pos = _read_varint(data, pos)
+    record = cls.__new__(cls)
+    for bit, field in enumerate(cls.FIELDS):
+        if present >> bit & 1:
+            value, pos = _read_value(data, pos)
+            object.__setattr__(record, field, value)
+    record.extra, pos = _read_value(data, pos)
+    return record, pos
+
+def encode_transaction(tx: Any) -> bytes:
+    """交易的规范二进制编码（字典与记录对象编码结果相同）"""
+    out = bytearray()
+    _write_transaction(out, tx)
+    return bytes(out)
+
+def decode_transaction(data: bytes) -> TxRecord:
+    record, _ = _read_transaction(data, 0)
+    return record
+
+# ---- 区块 ----
+
+def _write_hex(out: bytearray, value: str) -> None:
+    """哈希、签名等小写十六进制串按原始字节存储，其他字符串原样存储"""
+    try:
+        raw = bytes.fromhex(value)
+    except ValueError:
+        raw = None
+    if raw and raw.hex() == value:
+        out.append(_BYTES)
+        _write_varint(out, len(raw))
+        out += raw
+    else:
+        out.append(_STR)
+        _write_str(out, value)
+
+def _read_hex(data: bytes, pos: int) -> Tuple[str, int]:
+    value, pos = _read_value(data, pos)
+    return (value.hex() if isinstance(value, bytes) else value), pos
+
+def encode_header(index: int, timestamp: float, previous_hash: str, merkle_root: str,
+                  sealer: str, difficulty: int, nonce: int) -> bytes:
+    """区块头编码（用于计算区块哈希），nonce 固定 8 字节位于末尾"""
+    out = bytearray()
+    _write_varint(out, index)
+    out += _DOUBLE.pack(timestamp)
+    _write_hex(out, previous_hash)
+    _write_hex(out, merkle_root)
+    _write_str(out, sealer)
+    _write_varint(out, difficulty)
+    out += _NONCE.pack(nonce)
+    return bytes(out)
+
+def encode_nonce(nonce: int) -> bytes:
+    return _NONCE.pack(nonce)
+
+def _read_header(data: bytes, pos: int) -> Tuple[Dict[str, Any], int]:
+    header = {}
+    header["index"], pos = _read_varint(data, pos)
+    header["timestamp"] = _DOUBLE.unpack_from(data, pos)[0]
+    pos += 8
+    header["previous_hash"], pos = _read_hex(data, pos)
+    header["merkle_root"], pos = _read_hex(data, pos)
+    header["sealer"], pos = _read_str(data, pos)
+    header["difficulty"], pos = _read_varint(data, pos)
+    header["nonce"] = _NONCE.unpack_from(data, pos)[0]
+    return header, pos + 8
+
+def encode_block_fields(header: bytes, block_hash: str, signature: str, pruned: bool,
+                        transactions: List[Any], bloom: bytes = b"") -> bytes:
+    """区块编码：区块头 + 哈希 + 签名 + 裁剪标记 + [交易区长度][交易数][交易...] + 布隆过滤器"""
+    out = bytearray(header)
+    _write_hex(out, block_hash)
+    _write_hex(out, signature)
+    out.append(_TRUE if pruned else _FALSE)
+    body = bytearray()
+    _write_varint(body, len(transactions))
+    for tx in transactions:
+        _write_transaction(body, tx)
+    _write_varint(out, len(body))
+    out += body
+    # 布隆过滤器位于交易区之后，只解码区块头时跳过交易区即可读取；旧记录没有该字段
+    _write_bytes(out, bloom)
+    return bytes(out)
+
+def decode_block_fields(data: bytes, with_transactions: bool = True) -> Dict[str, Any]:
+    """解码区块为字段字典；with_transactions=False 时跳过交易区"""
+    fields, pos = _read_header(data, 0)
+    fields["hash"], pos = _read_hex(data, pos)
+    fields["signature"], pos = _read_hex(data, pos)
+    fields["pruned"] = data[pos] == _TRUE
+    pos += 1
+    body_length, pos = _read_varint(data, pos)
+    transactions = []
+    if with_transactions:
+        count, tx_pos = _read_varint(data, pos)
+        for _ in range(count):
+            tx, tx_pos = _read_transaction(data, tx_pos)
+            transactions.append(tx)
+    fields["transactions"] = transactions
+    pos += body_length
+    fields["bloom"] = _read_value(data, pos)[0] if pos < len(data) else b""
+    return fields
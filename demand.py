@@ -6,7 +6,7 @@ from datetime import datetime
 from api import calculate_distance, verify_compliance
 from dataclasses import dataclass
 import math
-from blockchain import blockchain  # 添加导入
+from ledger_service import ledger
 
 @dataclass
 class CLPItem:
@@ -43,7 +43,7 @@ class DemandProcessor:
         Returns:
             标准化的需求数据
         """
-        print("Debug: blockchain is", blockchain)  # 添加调试输出
+        print("Debug: ledger is", ledger)  # 添加调试输出
         
         # 输入验证
         if weight <= 0 or volume <= 0:
@@ -101,7 +101,7 @@ class DemandProcessor:
         
         # 存储并记录到区块链
         self.demands[demand_id] = demand
-        blockchain.add_transaction({"type": "demand", "data": demand})
+        ledger.add_transaction({"type": "demand", "data": demand})
         return demand
     
     def _validate_clp(self, clp_items: List[Dict]) -> bool:
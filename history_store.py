@@ -0,0 +1,168 @@
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from array import array
+from collections import deque
+import json
+import os
+import threading
+
+class ColumnarHistory:
+    """
+    有界的列式历史记录
+
+    每个字段一列，数值列为 array('d')，字符串列存为字典编码 array('I')（字符串表只保存
+    不同取值，账户 ID、交易类型等重复度很高）：
+    - 热尾部：最近 hot_size 条完整记录（含列之外的字段），供流向图等近期视图直接读取
+    - 冷数据：列缓冲满 chunk_rows 行后整块追加到 {列名}.col 文件并清空缓冲，
+      未指定 path 时只保留汇总，最旧的数据直接丢弃；内存占用与记录总数无关
+    - 汇总：条数与各数值列之和在追加时累加，统计查询 O(1)
+
+    flush() 把缓冲中的行追加到列文件，并将条数与汇总写入 summary.json（调用方在区块提交与退出时调用）。
+    启动时按各列文件中最短的行数对齐（截断崩溃时写了一半的块），行数与 summary.json 一致时直接恢复汇总，
+    否则扫描一遍列文件重算；热尾部从列文件恢复。
+    """
+
+    def __init__(self, columns: Sequence[Tuple[str, str]], path: Optional[str] = None,
+                 hot_size: int = 1000, chunk_rows: int = 4096):
+        # columns: (列名, 类型)，类型为 "d"（浮点）或 "s"（字符串）
+        for name, kind in columns:
+            if kind not in ("d", "s"):
+                raise ValueError(f"Unsupported column type: {name}={kind}")
+        self.columns = list(columns)
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        self._hot: deque = deque(maxlen=hot_size)
+        self._buffers = {name: array("d" if kind == "d" else "I") for name, kind in self.columns}
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self.count = 0
+        self.spilled = 0
+        self.sums = {name: 0.0 for name, kind in self.columns if kind == "d"}
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.col")
+
+    def _summary_file(self) -> str:
+        return os.path.join(self.path, "summary.json")
+
+    def _load(self) -> None:
+        strings_path = os.path.join(self.path, "strings.jsonl")
+        if os.path.exists(strings_path):
+            with open(strings_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._intern(json.loads(line))
+                    except ValueError:
+                        break
+        rows = min((os.path.getsize(self._file(name)) // self._buffers[name].itemsize
+                    if os.path.exists(self._file(name)) else 0) for name, _ in self.columns)
+        for name, _ in self.columns:
+            with open(self._file(name), "ab") as f:
+                f.truncate(rows * self._buffers[name].itemsize)
+        self.count = self.spilled = rows
+        summary = None
+        if os.path.exists(self._summary_file()):
+            with open(self._summary_file(), encoding="utf-8") as f:
+                try:
+                    summary = json.load(f)
+                except ValueError:
+                    pass
+        if summary is not None and summary["count"] == rows and set(summary["sums"]) == set(self.sums):
+            self.sums.update(summary["sums"])
+        else:
+            for name in self.sums:
+                for start in range(0, rows, self.chunk_rows):
+                    self.sums[name] += sum(self.read_column(name, start, start + self.chunk_rows))
+        # 热尾部从列文件恢复（只含列字段）
+        self._hot.extend(self.read(max(rows - self._hot.maxlen, 0)))
+
+    def _intern(self, value: str) -> int:
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录，缺失的列按 0 / 空字符串处理"""
+        with self._lock:
+            self._hot.append(record)
+            new_strings = len(self._strings)
+            for name, kind in self.columns:
+                if kind == "d":
+                    value = float(record.get(name) or 0.0)
+                    self.sums[name] += value
+                else:
+                    value = self._intern(str(record.get(name, "")))
+                self._buffers[name].append(value)
+            if self.path and len(self._strings) > new_strings:
+                # 字符串表先于列数据落盘，列中的编码总能在字符串表中找到
+                with open(os.path.join(self.path, "strings.jsonl"), "a", encoding="utf-8") as f:
+                    for value in self._strings[new_strings:]:
+                        f.write(json.dumps(value, ensure_ascii=False) + "\n")
+            self.count += 1
+            if len(self._buffers[self.columns[0][0]]) >= self.chunk_rows:
+                self._spill()
+
+    def _spill(self) -> None:
+        for name, _ in self.columns:
+            buffer = self._buffers[name]
+            if self.path:
+                with open(self._file(name), "ab") as f:
+                    buffer.tofile(f)
+            del buffer[:]
+        self.spilled = self.count
+        if self.path:
+            # 汇总在列数据之后写入，与列文件行数一致时才在启动时采用
+            tmp_path = self._summary_file() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"count": self.count, "sums": self.sums}, f)
+            os.replace(tmp_path, self._summary_file())
+
+    def flush(self) -> None:
+        """将缓冲中的行与汇总立即写入磁盘（没有新行时不写）"""
+        with self._lock:
+            if self.count > self.spilled:
+                self._spill()
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """热尾部中最近的 limit 条记录（按追加顺序）"""
+        with self._lock:
+            rows = list(self._hot)
+        return rows if limit is None else rows[-limit:]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._hot[-1] if self._hot else None
+
+    def read_column(self, name: str, start: int = 0, end: Optional[int] = None) -> List[Any]:
+        """读取一列的 [start, end) 行（已溢出到磁盘的部分从列文件读取），字符串列还原为字符串"""
+        kind = dict(self.columns)[name]
+        with self._lock:
+            end = self.count if end is None else min(end, self.count)
+            values = array(self._buffers[name].typecode)
+            if self.path and start < self.spilled:
+                disk_end = min(end, self.spilled)
+                with open(self._file(name), "rb") as f:
+                    f.seek(start * values.itemsize)
+                    values.fromfile(f, max(disk_end - start, 0))
+            memory_start = max(start, self.spilled) - self.spilled
+            values.extend(self._buffers[name][memory_start:max(end - self.spilled, 0)])
+            if kind == "s":
+                return [self._strings[i] for i in values]
+            return values.tolist()
+
+    def read(self, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按行读取 [start, end)（只含列字段）；未持久化时只能读到尚未丢弃的行"""
+        if not self.path:
+            start = max(start, self.spilled)
+        columns = {name: self.read_column(name, start, end) for name, _ in self.columns}
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"count": self.count, "sums": dict(self.sums), "resident_rows": self.count - self.spilled,
+                    "hot_rows": len(self._hot)}
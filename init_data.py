@@ -2,7 +2,7 @@ import random
 from demand import process_demand
 from bidding import bidding_system
 from payment import PaymentSystem
-from blockchain import blockchain
+from ledger_service import ledger
 from tokens import token_system
 from api import logistics_api
 
@@ -50,9 +50,6 @@ def initialize_demo_data(num_demands=10):
             clp_items=clp_items,
             merchant_id="Merchant_1"
         )
-        blockchain.add_transaction({"type": "demand", "data": demand})
-        blockchain.mine_pending_transactions("SuperNode_A")
-
         # 2. 模拟竞价过程
         bid_id = bidding_system.start_bidding(demand)
         
@@ -71,23 +68,24 @@ def initialize_demo_data(num_demands=10):
         
         # 生成解决方案
         solutions = bidding_system.generate_solutions(bid_id)
-        blockchain.add_transaction({"type": "solutions_generated", "bid_id": bid_id, "solutions": solutions})
-        blockchain.mine_pending_transactions("SuperNode_A")
+        ledger.add_transaction({"type": "solutions_generated", "bid_id": bid_id, "solutions": solutions})
 
         # 3. 创建并推进支付
         if solutions:  # 确保有解决方案
             selected_solution = solutions[0]  # 选择第一个方案（经济型）
             payment_id = payment_system.create_payment(selected_solution, "Merchant_1")
             payment_system.advance_payment(payment_id)  # 推进到第一个阶段（warehouse）
-            blockchain.add_transaction({"type": "payment_created", "payment_id": payment_id})
-            blockchain.mine_pending_transactions("SuperNode_A")
+            ledger.add_transaction({"type": "payment_created", "payment_id": payment_id})
 
             # 4. 模拟碳补偿（假设在 transport 阶段触发）
             carbon_amount = selected_solution["carbon_footprint"] * 0.1  # 假设 10% 转为碳补偿
             token_system.compensate_carbon(selected_solution["carrier_id"], carbon_amount)
 
+    # 封装剩余的待处理交易
+    ledger.flush()
+
     # 5. 输出初始化结果
-    stats = blockchain.get_chain_stats()
+    stats = ledger.snapshot().stats
     token_stats = token_system.get_stats()
     print(f"初始化完成：生成 {stats['block_count']} 个区块，{stats['transaction_count']} 笔交易，"
           f"代币流通量 {token_stats['circulation']:.2f}")
@@ -0,0 +1,325 @@
+from typing import Dict, Any, List, Optional, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+import queue
+import threading
+import time
+
+from blockchain import Block, Blockchain, BlockProducer, blockchain, block_producer
+from mempool import content_hash, with_nonce
+
+class Receipt:
+    """
+    交易回执
+
+    提交交易后立即返回，状态为 pending；交易所在区块上链后变为 confirmed，
+    交易池拒绝或之后被驱逐（error 为 "evicted"）时变为 rejected，与池中已有交易重复（本次提交不会再执行一次）时变为 duplicate。
+    调用方可轮询 status 或调用 wait() 等待确认。
+    """
+
+    PENDING = "pending"
+    CONFIRMED = "confirmed"
+    REJECTED = "rejected"
+    DUPLICATE = "duplicate"
+
+    def __init__(self, tx_hash: str):
+        self.tx_hash = tx_hash
+        self.status = self.PENDING
+        self.block_index: Optional[int] = None
+        self.block_hash: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.confirmed_at: Optional[float] = None
+        self._done = threading.Event()
+
+    def _resolve(self, status: str, block: Optional[Block] = None, error: Optional[str] = None) -> None:
+        self.status = status
+        if block is not None:
+            self.block_index = block.index
+            self.block_hash = block.hash
+            self.confirmed_at = time.time()
+        self.error = error
+        self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待交易上链，返回是否已确认"""
+        self._done.wait(timeout)
+        return self.status == self.CONFIRMED
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tx_hash": self.tx_hash,
+            "status": self.status,
+            "block_index": self.block_index,
+            "block_hash": self.block_hash,
+            "error": self.error
+        }
+
+@dataclass(frozen=True)
+class LedgerSnapshot:
+    """账本只读快照，由写线程整体替换发布，读取方无需加锁"""
+    height: int
+    last_hash: str
+    stats: Dict[str, Any]
+    active_nodes: List[str]
+    credit_scores: Dict[str, float]
+    balances: Dict[str, float]
+    pending_debits: Dict[str, float]
+    circulation: float
+    mining_reward: float
+    pending_count: int
+    created_at: float = field(default_factory=time.time)
+
+class LedgerService:
+    """
+    单写者账本服务
+
+    Blockchain 与 BlockProducer 只由一个后台写线程访问：
+    - 写操作（添加交易、出块、代币记账等）进入命令队列，由写线程按序执行，返回 Future
+    - 读操作直接读取最近发布的 LedgerSnapshot，快照不可变，整体替换发布，读取无需加锁
+    - 写线程执行完一批命令后先发布快照再完成这批 Future，调用方等待结果后即可读到自己的写入
+    - 写线程空闲时按 BlockProducer 的时间阈值检查出块，替代其独立的定时线程
+    - 出块分三步：写线程构造候选区块，独立的挖矿线程完成 PoW/签名，再由写线程提交上链；
+      挖矿期间写线程继续处理命令，提交交易立即返回 Receipt，区块上链后回执变为 confirmed
+    """
+
+    MAX_BATCH = 64
+
+    def __init__(self, chain: Blockchain, producer: Optional[BlockProducer] = None,
+                 seal_interval: float = 0.5):
+        self.chain = chain
+        self.producer = producer or BlockProducer(chain)
+        self.seal_interval = seal_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._snapshot = self._take_snapshot()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 以下状态只由写线程访问
+        self._receipts: Dict[str, List[Receipt]] = {}
+        self._mining: Optional[Future] = None
+        self._flush_waiters: List[Future] = []
+        # 快照发布后才执行的通知（回执确认、flush 完成），保证被通知方能读到对应区块
+        self._deferred: List[Callable] = []
+        self._commit_listeners: List[Callable[[Block], None]] = []
+        self._miner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger-miner")
+        self.stats = {"commands": 0, "batches": 0, "errors": 0, "blocks": 0, "stale_blocks": 0}
+        # 交易池只在写线程内修改，驱逐通知也在写线程内到达
+        chain.mempool.subscribe_evictions(lambda tx_hash, tx: self._reject_receipts(tx_hash, "evicted"))
+
+    # ---- 生命周期 ----
+
+    def start(self) -> None:
+        """启动写线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """封装完待处理交易、处理完已入队的命令后停止写线程"""
+        if not self._running:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def subscribe_commits(self, listener: Callable[[Block], None]) -> None:
+        """订阅出块通知：本服务封装的区块上链后在写线程内调用 listener(区块)"""
+        self._commit_listeners.append(listener)
+
+    def _on_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    # ---- 写操作 ----
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """将写命令入队，返回其结果 Future；已在写线程内时直接执行，避免自等待死锁"""
+        future: Future = Future()
+        if self._on_writer_thread():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        if not self._running:
+            self.start()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """执行写命令并等待结果"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _add_transaction(self, transaction: Dict[str, Any], receipt: Receipt) -> None:
+        if receipt.tx_hash in self.chain.mempool:
+            receipt._resolve(Receipt.DUPLICATE, error="duplicate transaction")
+            return
+        try:
+            self.chain.add_transaction(transaction)
+        except ValueError as e:
+            receipt._resolve(Receipt.REJECTED, error=str(e))
+            return
+        self._receipts.setdefault(receipt.tx_hash, []).append(receipt)
+        self._maybe_start_mining()
+
+    def add_transaction(self, transaction: Dict[str, Any]) -> Receipt:
+        """提交交易，立即返回回执；达到出块阈值时由后台挖矿线程封装区块"""
+        # 先附加 nonce（非幂等交易）并把较大的嵌套对象换成载荷引用，回执哈希与上链后的交易内容一致
+        transaction = self.chain.payloads.externalize_transaction(with_nonce(transaction))
+        receipt = Receipt(content_hash(transaction))
+        self.submit(self._add_transaction, transaction, receipt)
+        return receipt
+
+    def flush(self) -> Optional[Block]:
+        """立即封装全部待处理交易并等待上链，返回最后一个区块"""
+        return self.call(self._request_flush).result()
+
+    def _request_flush(self) -> Future:
+        waiter: Future = Future()
+        self._flush_waiters.append(waiter)
+        self._maybe_start_mining(force=True)
+        self._resolve_flush_waiters()
+        return waiter
+
+    # ---- 出块（写线程） ----
+
+    def _maybe_start_mining(self, force: bool = False) -> None:
+        """没有进行中的挖矿任务且达到出块阈值（或被要求立即出块）时，构造候选区块交给挖矿线程"""
+        if self._mining is not None:
+            return
+        if not (force or self._flush_waiters or self.producer.should_seal()):
+            return
+        block = self.chain.prepare_block(self.producer.miner_node_id)
+        if block is None:
+            return
+        self._mining = self._miner.submit(self.chain.seal_block, block)
+        # 挖矿完成后作为命令入队，回到写线程提交
+        self._mining.add_done_callback(
+            lambda f: self._queue.put((self._commit_mined, (f, block), {}, Future())))
+
+    def _commit_mined(self, mining: Future, block: Block) -> None:
+        self._mining = None
+        error = mining.exception()
+        if error is None and block.previous_hash == self.chain.get_last_block().hash:
+            self.chain.commit_block(block)
+            self.stats["blocks"] += 1
+            for listener in self._commit_listeners:
+                listener(block)
+            for tx in block.transactions:
+                for receipt in self._receipts.pop(content_hash(tx), ()):
+                    self._deferred.append(lambda r=receipt: r._resolve(Receipt.CONFIRMED, block))
+        else:
+            # 封装失败或链尖已变化：候选区块作废，其交易（挖矿奖励除外）退回交易池
+            self.stats["stale_blocks"] += 1
+            for tx in block.transactions[:-1]:
+                if self.chain.mempool.add(tx) is None:
+                    tx_hash = content_hash(tx)
+                    self.chain.drop_pending(tx_hash)
+                    self._reject_receipts(tx_hash, "mempool full")
+        self._prune_receipts()
+        self._maybe_start_mining()
+        self._resolve_flush_waiters()
+
+    def _reject_receipts(self, tx_hash: str, error: str) -> None:
+        """交易不会再上链：其回执以 rejected 结束并移出待确认表"""
+        for receipt in self._receipts.pop(tx_hash, ()):
+            self._deferred.append(lambda r=receipt: r._resolve(Receipt.REJECTED, error=error))
+
+    def _prune_receipts(self) -> None:
+        """
+        没有进行中的挖矿任务时，待确认的交易都应在交易池中；
+        经其他途径离开交易池（如被外部区块打包后移除）的交易不会再由本服务确认，其回执一并结束
+        """
+        if self._mining is None and len(self._receipts) > len(self.chain.mempool):
+            for tx_hash in [tx_hash for tx_hash in self._receipts if tx_hash not in self.chain.mempool]:
+                self._reject_receipts(tx_hash, "dropped")
+
+    def _resolve_flush_waiters(self) -> None:
+        if self._flush_waiters and self._mining is None and not len(self.chain.mempool):
+            last_block = self.chain.get_last_block()
+            for waiter in self._flush_waiters:
+                self._deferred.append(lambda w=waiter: w.set_result(last_block))
+            self._flush_waiters.clear()
+
+    # ---- 读操作 ----
+
+    def snapshot(self) -> LedgerSnapshot:
+        """最近发布的账本快照"""
+        return self._snapshot
+
+    def _take_snapshot(self) -> LedgerSnapshot:
+        chain = self.chain
+        last_block = chain.get_last_block()
+        balances = dict(chain.account_state)
+        return LedgerSnapshot(
+            height=last_block.index,
+            last_hash=last_block.hash,
+            stats=chain.get_chain_stats(),
+            active_nodes=chain.get_active_nodes(),
+            credit_scores={node_id: node.credit_score for node_id, node in chain.nodes.items()},
+            balances=balances,
+            # 流通量随快照计算一次，读取方不必每次对全部余额求和
+            circulation=sum(balances.values()),
+            pending_debits=dict(chain.pending_debits),
+            mining_reward=chain.get_mining_reward(),
+            pending_count=len(chain.mempool)
+        )
+
+    # ---- 写线程 ----
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.seal_interval)
+            except queue.Empty:
+                # 空闲时检查时间阈值出块
+                self._maybe_start_mining()
+                continue
+
+            # 批量取出已入队的命令，整批执行后只发布一次快照
+            batch = [item]
+            while item is not None and len(batch) < self.MAX_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            results = []
+            for command in batch:
+                if command is None:
+                    continue
+                fn, args, kwargs, future = command
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    results.append((future, fn(*args, **kwargs), None))
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    results.append((future, None, e))
+                self.stats["commands"] += 1
+            self.stats["batches"] += 1
+            self._snapshot = self._take_snapshot()
+            for notify in self._deferred:
+                notify()
+            self._deferred.clear()
+
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            if batch[-1] is None:
+                self._running = False
+                return
+
+# 全局账本服务：所有会话通过它写入共享账本
+ledger = LedgerService(blockchain, block_producer)
@@ -6,6 +6,7 @@ from typing import Dict, Any, List
 import json
 
 from blockchain import blockchain
+from ledger_service import ledger, Receipt
 from testnet import TestnetLedger
 from demand import process_demand, validate_clp
 from bidding import start_bidding, get_bid_status, bidding_system
@@ -20,7 +21,9 @@ class LogisticsApp:
         self.visualizer = LogisticsVisualizer()
         if 'initialized' not in st.session_state:
             self._init_session_state()
-            initialize_demo_data(num_demands=10)
+            # 账本从磁盘恢复时不再重复生成演示数据
+            if not blockchain.restored:
+                initialize_demo_data(num_demands=10)
         import api  # 确保 api 模块已导入
         api.global_payment_system = st.session_state.payment_system  # 修复赋值，确保 api.py 能访问
     
@@ -29,6 +32,8 @@ class LogisticsApp:
         st.session_state.mode = "pseudo"
         st.session_state.testnet = TestnetLedger()
         st.session_state.bidding_system = bidding_system
+        # 竞价各轮到期后由调度线程自动推进或关闭（重复调用无副作用）
+        bidding_system.scheduler.start()
         st.session_state.token_system = token_system
         st.session_state.payment_system = PaymentSystem()
         st.session_state.current_demand = None
@@ -36,6 +41,7 @@ class LogisticsApp:
         st.session_state.current_solutions = None
         st.session_state.selected_solution = None
         st.session_state.current_payment_id = None
+        st.session_state.receipts = []  # (操作说明, 交易回执)，出块在后台完成，页面每次刷新时轮询状态
     
     def run(self):
         st.title("跨境电商物流Demo")
@@ -61,20 +67,36 @@ class LogisticsApp:
         st.session_state.mode = "pseudo" if mode == "伪分布式模式" else "testnet"
         
         if st.session_state.mode == "pseudo":
-            stats = blockchain.get_chain_stats()
+            stats = ledger.snapshot().stats
             st.sidebar.write(f"区块数: {stats['block_count']}")
-            st.sidebar.write(f"活跃节点数: {len(blockchain.get_active_nodes())}")  # 修改为活跃节点数
+            st.sidebar.write(f"活跃节点数: {len(ledger.snapshot().active_nodes)}")  # 修改为活跃节点数
         else:
             status = st.session_state.testnet.get_network_status()
             st.sidebar.write(f"网络: {status['network']}")
             st.sidebar.write(f"区块高度: {status.get('block_number', 'N/A')}")
         
+        self._render_receipts()
+        
         token_stats = token_system.get_stats()
         st.sidebar.write("---")
         st.sidebar.write("代币系统状态")
         st.sidebar.write(f"流通量: {token_stats['circulation']:.2f}")
         st.sidebar.write(f"碳补偿总量: {token_stats['carbon_offset']:.2f}")
     
+    def _track_receipt(self, label: str, receipt: Receipt) -> None:
+        st.session_state.receipts = (st.session_state.receipts + [(label, receipt)])[-10:]
+    
+    def _render_receipts(self):
+        """展示本会话最近提交交易的上链状态"""
+        if not st.session_state.receipts:
+            return
+        st.sidebar.write("---")
+        st.sidebar.write("上链回执")
+        status_text = {"pending": "⏳ 待出块", "confirmed": "✅ 已上链", "rejected": "❌ 已拒绝"}
+        for label, receipt in reversed(st.session_state.receipts):
+            detail = f" (区块 #{receipt.block_index})" if receipt.block_index is not None else ""
+            st.sidebar.write(f"{label}: {status_text[receipt.status]}{detail}")
+    
     def _render_demand_tab(self):
         st.header("物流需求发布")
         with st.form("logistics_demand"):
@@ -113,9 +135,6 @@ class LogisticsApp:
                             delivery_time=delivery_time, clp_items=clp_data,
                             merchant_id="Merchant_1"
                         )
-                        blockchain.add_transaction({"type": "demand", "data": demand})
-                        blockchain.mine_pending_transactions("SuperNode_A")
-                        
                         # 修复：存储 current_demand
                         st.session_state.current_demand = demand
                         
@@ -140,9 +159,9 @@ class LogisticsApp:
                             payment_id = st.session_state.payment_system.create_payment(solutions[0], "Merchant_1")
                             st.session_state.payment_system.advance_payment(payment_id)
                             st.session_state.current_payment_id = payment_id
-                            blockchain.add_transaction({"type": "payment_created", "payment_id": payment_id})
-                            blockchain.mine_pending_transactions("SuperNode_A")
-                            st.success(f"需求已提交，竞价完成，支付已触发！区块数: {blockchain.get_chain_stats()['block_count']}")
+                            receipt = ledger.add_transaction({"type": "payment_created", "payment_id": payment_id})
+                            self._track_receipt(f"支付 {payment_id}", receipt)
+                            st.success("需求已提交，竞价完成，支付已触发！交易正在后台出块，可在侧边栏查看上链状态")
                         else:
                             st.error("生成解决方案失败")
                     else:
@@ -202,9 +221,9 @@ class LogisticsApp:
                 st.session_state.selected_solution = selected_solution
                 payment_id = st.session_state.payment_system.create_payment(selected_solution, "Merchant_1")
                 st.session_state.current_payment_id = payment_id
-                blockchain.add_transaction({"type": "solution_selected", "solution": selected_solution})
-                blockchain.mine_pending_transactions("SuperNode_A")
-                st.success(f"方案已确认，支付订单已创建！奖励: {blockchain.get_mining_reward():.2f} 代币")
+                receipt = ledger.add_transaction({"type": "solution_selected", "solution": selected_solution})
+                self._track_receipt(f"方案 {payment_id}", receipt)
+                st.success(f"方案已确认，支付订单已创建！出块奖励: {ledger.snapshot().mining_reward:.2f} 代币，交易待上链")
     
     def _render_payment_tab(self):
         st.header("支付管理")
@@ -244,9 +263,9 @@ class LogisticsApp:
                     token_system.compensate_carbon(carrier_id, carbon_amount)
                     
                     # 上链记录
-                    blockchain.add_transaction({"type": "payment_update", "payment_id": payment_id})
-                    blockchain.mine_pending_transactions("SuperNode_A")
-                    st.success(f"支付状态已更新！新区块生成，奖励: {blockchain.get_mining_reward():.2f} 代币")
+                    receipt = ledger.add_transaction({"type": "payment_update", "payment_id": payment_id})
+                    self._track_receipt(f"支付更新 {payment_id}", receipt)
+                    st.success("支付状态已更新！交易已提交，正在后台出块")
                     st.rerun()
                 else:
                     st.error("支付失败，请检查物流状态")
@@ -256,10 +275,10 @@ class LogisticsApp:
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("账本状态")
-            stats = blockchain.get_chain_stats()
+            stats = ledger.snapshot().stats
             st.write(f"区块数: {stats['block_count']} (+{stats['block_count'] - 1} 自启动)")
             st.write(f"交易数: {stats['transaction_count']}")
-            st.write(f"活跃节点数: {len(blockchain.get_active_nodes())}")
+            st.write(f"活跃节点数: {len(ledger.snapshot().active_nodes)}")
         with col2:
             st.subheader("代币系统")
             token_stats = token_system.get_stats()
@@ -269,8 +288,9 @@ class LogisticsApp:
         
         # 信用分展示
         st.subheader("节点信用分")
+        credit_scores = ledger.snapshot().credit_scores
         credit_data = [
-            {"节点": n, "信用分": blockchain.get_node_credit_score(n)}
+            {"节点": n, "信用分": credit_scores.get(n, 0.0)}
             for n in ["SuperNode_A", "Carrier_1", "Carrier_2", "Merchant_1"]
         ]
         st.table(credit_data)
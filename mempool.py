@@ -0,0 +1,167 @@
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from collections import OrderedDict
+import hashlib
+import uuid
+
+from codec import TxRecord, encode_transaction
+
+# 交易优先级，数值越小越先出块
+PRIORITY_PAYMENT = 0
+PRIORITY_BUSINESS = 1
+PRIORITY_TELEMETRY = 2
+
+TX_PRIORITIES = {
+    "transfer": PRIORITY_PAYMENT,
+    "token_transfer": PRIORITY_PAYMENT,
+    "token_reward": PRIORITY_PAYMENT,
+    "carbon_compensation": PRIORITY_PAYMENT,
+    "init_balance": PRIORITY_PAYMENT,
+    "burn_tokens": PRIORITY_PAYMENT,
+    "payment_created": PRIORITY_PAYMENT,
+    "payment_advanced": PRIORITY_PAYMENT,
+    "payment_delta": PRIORITY_PAYMENT,
+    "payment_stage": PRIORITY_PAYMENT,
+    "refund_requested": PRIORITY_PAYMENT,
+    "refund_processed": PRIORITY_PAYMENT,
+    "payment_update": PRIORITY_TELEMETRY,
+}
+
+# 幂等的交易类型：内容相同即同一操作（带业务ID的记录、每个账户只发放一次的初始代币），重复提交只保留一份。
+# 其他类型（转账、奖励、销毁等）内容相同的两笔是两次操作，入池前附带 nonce，不会被合并
+IDEMPOTENT_TYPES = frozenset({
+    "genesis", "init_balance", "demand", "bidding_started", "first_round_bid", "second_round_bid", "bid_batch",
+    "solutions_generated", "solution_selected", "payment_created", "payment_advanced", "payment_delta",
+    "payment_stage", "refund_requested", "refund_processed", "payment_update",
+})
+
+# Mempool.insert 的结果
+ADDED = "added"
+DUPLICATE = "duplicate"
+FULL = "full"
+
+def with_nonce(tx: Dict[str, Any]) -> Dict[str, Any]:
+    """非幂等交易未携带 nonce 时附加一个随机 nonce；调用方自带 nonce 时重试同一笔交易仍按重复处理"""
+    if tx.get("type") in IDEMPOTENT_TYPES or "nonce" in tx:
+        return tx
+    return {**tx, "nonce": uuid.uuid4().hex[:16]}
+
+def content_hash(tx: Dict[str, Any]) -> str:
+    """交易内容哈希（忽略入池时间戳），用于去重"""
+    body = {k: v for k, v in tx.items() if k != "timestamp"}
+    return hashlib.sha256(encode_transaction(body)).hexdigest()
+
+class Mempool:
+    """
+    有界、去重、按优先级出块的交易池
+
+    - 按交易内容哈希去重，同一笔交易重复提交只保留一份（非幂等交易由 nonce 区分，见 with_nonce）
+    - 按交易数量和字节数设上限，满时驱逐优先级更低的最早交易
+    - 每个优先级一个 FIFO 队列，取出一个区块的交易只与取出数量有关
+    """
+
+    def __init__(self, max_transactions: int = 10000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        levels = max(TX_PRIORITIES.values()) + 1
+        # 每个优先级：内容哈希 -> (交易, 字节数)，按入池顺序排列
+        self._buckets: List[OrderedDict] = [OrderedDict() for _ in range(levels)]
+        self._priority_of: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.stats = {"added": 0, "duplicates": 0, "evicted": 0, "rejected": 0}
+        self._evict_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._priority_of)
+
+    def __contains__(self, tx_hash: str) -> bool:
+        return tx_hash in self._priority_of
+
+    def subscribe_evictions(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """订阅驱逐通知：listener(交易内容哈希, 交易)，被驱逐的交易不会再上链"""
+        self._evict_listeners.append(listener)
+
+    @staticmethod
+    def priority(tx: Dict[str, Any]) -> int:
+        return TX_PRIORITIES.get(tx.get("type"), PRIORITY_BUSINESS)
+
+    def add(self, tx: Dict[str, Any]) -> Optional[str]:
+        """
+        添加交易（重复的交易视为已在池中）
+
+        Returns:
+            交易内容哈希；交易池已满且无法驱逐更低优先级交易时返回 None
+        """
+        return self.insert(tx)[1]
+
+    def insert(self, tx: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """添加交易，返回 (ADDED / DUPLICATE / FULL, 交易内容哈希)，交易池已满时哈希为 None"""
+        if isinstance(tx, TxRecord):
+            tx = tx.to_dict()
+        body = {k: v for k, v in tx.items() if k != "timestamp"}
+        serialized = encode_transaction(body)
+        tx_hash = hashlib.sha256(serialized).hexdigest()
+        if tx_hash in self._priority_of:
+            self.stats["duplicates"] += 1
+            return DUPLICATE, tx_hash
+
+        priority = self.priority(tx)
+        size = len(serialized)
+        while len(self) >= self.max_transactions or self.total_bytes + size > self.max_bytes:
+            if not self._evict_below(priority):
+                self.stats["rejected"] += 1
+                return FULL, None
+
+        self._buckets[priority][tx_hash] = (tx, size)
+        self._priority_of[tx_hash] = priority
+        self.total_bytes += size
+        self.stats["added"] += 1
+        return ADDED, tx_hash
+
+    def _evict_below(self, priority: int) -> bool:
+        """驱逐一笔优先级低于 priority 的最早交易"""
+        for level in range(len(self._buckets) - 1, priority, -1):
+            if self._buckets[level]:
+                tx_hash, (tx, size) = self._buckets[level].popitem(last=False)
+                del self._priority_of[tx_hash]
+                self.total_bytes -= size
+                self.stats["evicted"] += 1
+                for listener in self._evict_listeners:
+                    listener(tx_hash, tx)
+                return True
+        return False
+
+    def take(self, max_count: int, max_bytes: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按优先级取出最多一个区块容量的交易"""
+        taken = []
+        taken_bytes = 0
+        for bucket in self._buckets:
+            while bucket and len(taken) < max_count:
+                tx_hash, (tx, size) = next(iter(bucket.items()))
+                if max_bytes is not None and taken and taken_bytes + size > max_bytes:
+                    return taken
+                bucket.popitem(last=False)
+                del self._priority_of[tx_hash]
+                self.total_bytes -= size
+                taken_bytes += size
+                taken.append(tx)
+            if len(taken) >= max_count:
+                break
+        return taken
+
+    def remove(self, tx_hash: str) -> bool:
+        """移除指定交易"""
+        priority = self._priority_of.pop(tx_hash, None)
+        if priority is None:
+            return False
+        _, size = self._buckets[priority].pop(tx_hash)
+        self.total_bytes -= size
+        return True
+
+    def transactions(self) -> List[Dict[str, Any]]:
+        """按出块顺序列出池中交易"""
+        return [tx for bucket in self._buckets for tx, _ in bucket.values()]
+
+    def oldest_timestamp(self) -> Optional[float]:
+        """池中最早入池交易的时间戳"""
+        heads = [next(iter(bucket.values()))[0].get("timestamp") for bucket in self._buckets if bucket]
+        return min(heads) if heads else None
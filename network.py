@@ -0,0 +1,463 @@
+"""
+多进程伪分布式网络
+
+每个超级节点运行在独立的操作系统进程中，持有各自的 Blockchain 副本，
+通过本机 TCP 套接字广播交易和区块：新区块先广播区块头，收到的节点校验区块头后
+再按需下载区块体，并按最长有效链选择分叉。用于在单机上测量真实的区块传播延迟、
+分叉率和端到端确认吞吐。
+
+用法:
+    python network.py --duration 10 --tx-rate 50 --consensus pow --difficulty 12
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import struct
+import time
+
+from blockchain import (Blockchain, Block, verify_header_seal, verify_block_body, search_nonce_range, encode_block,
+                        decode_block, generate_keystore, public_keystore)
+from codec import encode_value, decode_value
+from mempool import content_hash
+
+FRAME_HEADER = struct.Struct(">I")
+# 每次在线程池中搜索的 nonce 数量，搜索间隙检查链头是否已被其他节点推进
+NONCE_CHUNK_SIZE = 20000
+# 单次 getheaders 最多返回的区块头数量
+MAX_HEADERS = 500
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    """消息编码：4 字节长度前缀 + 规范二进制编码"""
+    payload = encode_value(message)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """读取一条消息，连接关闭时返回 None"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        payload = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return decode_value(payload)
+
+def block_header(block: Block) -> Dict[str, Any]:
+    """区块头的网络表示"""
+    return {**block.header(), "hash": block.hash, "signature": block.signature}
+
+def header_to_block(header: Dict[str, Any]) -> Block:
+    """由区块头构造不含交易的区块，用于只校验区块头"""
+    return Block(index=header["index"], timestamp=header["timestamp"], transactions=[],
+                 previous_hash=header["previous_hash"], nonce=header["nonce"],
+                 merkle_root=header["merkle_root"], sealer=header["sealer"],
+                 hash=header["hash"], signature=header["signature"], difficulty=header["difficulty"])
+
+class Replica:
+    """单个超级节点进程内的区块链副本及其网络协议"""
+
+    def __init__(self, node_id: str, port: int, peer_ports: List[int], config: Dict[str, Any]):
+        self.node_id = node_id
+        self.port = port
+        self.peer_ports = peer_ports
+        self.config = config
+        # 各副本只持有自己的签名私钥，其他超级节点只有公钥
+        keystore = public_keystore(config["keystore"])
+        keystore[node_id] = config["keystore"][node_id]
+        self.chain = Blockchain(consensus=config["consensus"],
+                                genesis_timestamp=config["genesis_timestamp"], keystore=keystore)
+        self.chain.difficulty = config["difficulty"]
+        self.public_keys = self.chain.get_public_keys()
+        # 主链区块哈希 -> 高度
+        self.main_index: Dict[str, int] = {self.chain.chain[0].hash: 0}
+        # 已知但不在主链上的区块头与区块体（含分叉）
+        self.headers: Dict[str, Dict[str, Any]] = {}
+        self.bodies: Dict[str, Block] = {}
+        # 已见过的交易与已上主链的交易（内容哈希）
+        self.seen_txs = set()
+        self.included_txs = set()
+        self.peers: Dict[asyncio.StreamWriter, str] = {}
+        self.metrics = {"created": {}, "first_seen": {}, "reorgs": 0, "reorg_depth": 0, "stale": 0}
+
+    async def run(self, ready, results, stop_event) -> None:
+        server = await asyncio.start_server(self._handle_connection, "127.0.0.1", self.port)
+        for port in self.peer_ports:
+            await self._connect(port)
+        ready.put(self.node_id)
+        sealer = asyncio.ensure_future(self._seal_loop())
+        while not stop_event.is_set():
+            await asyncio.sleep(0.05)
+        sealer.cancel()
+        server.close()
+        results.put(self._report())
+
+    async def _connect(self, port: int) -> None:
+        """主动连接对端，对端尚未启动时重试"""
+        for _ in range(100):
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        else:
+            raise ConnectionError(f"Peer on port {port} unreachable")
+        self.peers[writer] = str(port)
+        writer.write(encode_message({"type": "hello", "node_id": self.node_id}))
+        asyncio.ensure_future(self._serve(reader, writer))
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await self._serve(reader, writer)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理单个连接上的消息"""
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                self.peers.pop(writer, None)
+                return
+            kind = message["type"]
+            if kind == "hello":
+                self.peers[writer] = message["node_id"]
+            elif kind == "submit":
+                tx = self.chain.payloads.externalize_transaction({**message["tx"], "timestamp": time.time()})
+                self._accept_transaction(tx, None)
+            elif kind == "tx":
+                if self._import_payloads(message.get("payloads", {})):
+                    self._accept_transaction(message["tx"], writer)
+            elif kind == "headers":
+                self._on_headers(message["headers"], writer)
+            elif kind == "getheaders":
+                self._on_getheaders(message["locator"], writer)
+            elif kind == "getblocks":
+                self._on_getblocks(message["hashes"], writer)
+            elif kind == "blocks":
+                if self._import_payloads(message.get("payloads", {})):
+                    self._on_blocks(message["blocks"])
+
+    def _broadcast(self, message: Dict[str, Any], exclude: Optional[asyncio.StreamWriter] = None) -> None:
+        data = encode_message(message)
+        for writer in list(self.peers):
+            if writer is not exclude:
+                writer.write(data)
+
+    def _accept_transaction(self, tx: Dict[str, Any], source: Optional[asyncio.StreamWriter]) -> None:
+        """接收交易：首次见到时入池并转发给其他对端"""
+        tx_hash = content_hash(tx)
+        if tx_hash in self.seen_txs:
+            return
+        self.seen_txs.add(tx_hash)
+        if tx_hash not in self.included_txs:
+            self.chain.mempool.add(tx)
+        self._broadcast({"type": "tx", "tx": tx, "payloads": self.chain.payloads.bundle([tx])}, exclude=source)
+
+    def _import_payloads(self, payloads: Dict[str, bytes]) -> bool:
+        """导入随消息发来的载荷，摘要不符时丢弃整条消息"""
+        try:
+            self.chain.payloads.import_bundle(payloads)
+        except ValueError:
+            return False
+        return True
+
+    def _height(self) -> int:
+        return len(self.chain.chain) - 1
+
+    def _on_headers(self, headers: List[Dict[str, Any]], source: asyncio.StreamWriter) -> None:
+        """区块头优先同步：校验区块头，链更长时再请求缺失的区块体"""
+        new_headers = []
+        for header in headers:
+            block_hash = header["hash"]
+            if block_hash in self.main_index or block_hash in self.headers:
+                continue
+            # 难度是否符合调整规则在区块体到达、追加上链时校验
+            if not verify_header_seal(header_to_block(header), self.public_keys, self.chain.consensus):
+                return
+            self.headers[block_hash] = header
+            self.metrics["first_seen"].setdefault(block_hash, time.time())
+            new_headers.append(header)
+        if not new_headers:
+            return
+
+        first_parent = headers[0]["previous_hash"]
+        if first_parent not in self.main_index and first_parent not in self.headers:
+            # 祖先未知：按定位器向对端请求缺失的区块头
+            source.write(encode_message({"type": "getheaders", "locator": self._locator()}))
+            return
+
+        tip = max(new_headers, key=lambda h: h["index"])
+        if tip["index"] <= self._height():
+            return
+        path = self._branch_path(tip["hash"])
+        if path is None:
+            return
+        missing = [h for h in path[1] if h not in self.bodies]
+        if missing:
+            source.write(encode_message({"type": "getblocks", "hashes": missing}))
+        else:
+            self._switch_to(*path)
+
+    def _locator(self) -> List[str]:
+        """区块定位器：主链上由近到远、间隔逐步加倍的区块哈希"""
+        locator, step, height = [], 1, self._height()
+        while height > 0:
+            locator.append(self.chain.chain[height].hash)
+            if len(locator) >= 10:
+                step *= 2
+            height -= step
+        locator.append(self.chain.chain[0].hash)
+        return locator
+
+    def _on_getheaders(self, locator: List[str], source: asyncio.StreamWriter) -> None:
+        start = next((self.main_index[h] for h in locator if h in self.main_index), 0)
+        blocks = self.chain.chain[start + 1:start + 1 + MAX_HEADERS]
+        source.write(encode_message({"type": "headers", "headers": [block_header(b) for b in blocks]}))
+
+    def _on_getblocks(self, hashes: List[str], source: asyncio.StreamWriter) -> None:
+        blocks = []
+        for block_hash in hashes:
+            if block_hash in self.main_index:
+                blocks.append(self.chain.chain[self.main_index[block_hash]])
+            elif block_hash in self.bodies:
+                blocks.append(self.bodies[block_hash])
+        payloads = self.chain.payloads.bundle(tx for block in blocks for tx in block.transactions)
+        source.write(encode_message({"type": "blocks", "blocks": [encode_block(block) for block in blocks],
+                                     "payloads": payloads}))
+
+    def _on_blocks(self, blocks: List[bytes]) -> None:
+        """接收区块体：核对其与已知区块头一致，然后尝试切换到最长链"""
+        for data in blocks:
+            block = decode_block(data)
+            header = self.headers.get(block.hash)
+            if header is None or block_header(block) != header:
+                continue
+            if not verify_block_body(block.transactions, block.merkle_root):
+                continue
+            self.bodies[block.hash] = block
+
+        for header in sorted(self.headers.values(), key=lambda h: h["index"], reverse=True):
+            if header["index"] <= self._height():
+                break
+            path = self._branch_path(header["hash"])
+            if path is not None and all(h in self.bodies for h in path[1]):
+                self._switch_to(*path)
+                break
+
+    def _branch_path(self, tip_hash: str) -> Optional[Tuple[int, List[str]]]:
+        """从分叉链头回溯到主链，返回 (分叉高度, 分叉上的区块哈希)；祖先未知时返回 None"""
+        path = []
+        block_hash = tip_hash
+        while block_hash not in self.main_index:
+            header = self.headers.get(block_hash)
+            if header is None:
+                return None
+            path.append(block_hash)
+            block_hash = header["previous_hash"]
+        path.reverse()
+        return self.main_index[block_hash] + 1, path
+
+    def _switch_to(self, fork_height: int, path: List[str]) -> bool:
+        """将主链延长或重组到给定分叉"""
+        branch = [self.bodies[h] for h in path]
+        if fork_height == len(self.chain.chain):
+            for block in branch:
+                if not self.chain.add_block(block):
+                    return False
+                self._on_main_chain(block)
+        else:
+            orphaned = self.chain.chain[fork_height:]
+            if not self.chain.reorganize(fork_height, branch):
+                return False
+            self.metrics["reorgs"] += 1
+            self.metrics["reorg_depth"] += len(orphaned)
+            for block in orphaned:
+                del self.main_index[block.hash]
+                self.headers[block.hash] = block_header(block)
+                self.bodies[block.hash] = block
+                for tx in block.transactions:
+                    self.included_txs.discard(content_hash(tx))
+            for block in branch:
+                self._on_main_chain(block)
+        self._broadcast({"type": "headers", "headers": [block_header(b) for b in branch]})
+        return True
+
+    def _on_main_chain(self, block: Block) -> None:
+        self.main_index[block.hash] = block.index
+        self.headers.pop(block.hash, None)
+        self.bodies.pop(block.hash, None)
+        for tx in block.transactions:
+            self.included_txs.add(content_hash(tx))
+
+    async def _seal_loop(self) -> None:
+        """按出块间隔打包本地交易池；PoW 模式下挖矿期间链头变化则放弃本次出块"""
+        loop = asyncio.get_event_loop()
+        interval = self.config["block_interval"]
+        while True:
+            await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+            if not len(self.chain.mempool):
+                continue
+            tip = self.chain.get_last_block()
+            if self.chain.consensus != "pow" and self.chain.select_sealer(tip) != self.node_id:
+                continue
+            block = self.chain.prepare_block(self.node_id)
+            if self.chain.consensus == "pow":
+                prefix, suffix = block.hash_template()
+                start, found = 0, None
+                while found is None and self.chain.get_last_block().hash == tip.hash:
+                    found = await loop.run_in_executor(None, search_nonce_range, prefix, suffix,
+                                                       block.difficulty, start, NONCE_CHUNK_SIZE)
+                    start += NONCE_CHUNK_SIZE
+                if found is not None:
+                    block.nonce, block.hash = found
+            else:
+                self.chain.sign_block(block, self.node_id)
+
+            if block.hash and self.chain.add_block(block):
+                self.metrics["created"][block.hash] = time.time()
+                self._on_main_chain(block)
+                self._broadcast({"type": "headers", "headers": [block_header(block)]})
+            else:
+                # 链头已被其他节点推进：本地候选区块作废，未上链的交易退回交易池
+                self.metrics["stale"] += 1
+                for tx in block.transactions:
+                    if tx["type"] != "mining_reward" and content_hash(tx) not in self.included_txs:
+                        self.chain.mempool.add(tx)
+
+    def _report(self) -> Dict[str, Any]:
+        chain = [{
+            "index": block.index,
+            "hash": block.hash,
+            "timestamp": block.timestamp,
+            "sealer": block.sealer,
+            "txs": [(tx["tx_id"], tx["submitted_at"]) for tx in block.transactions if "tx_id" in tx]
+        } for block in self.chain.chain]
+        return {"node_id": self.node_id, "tip": self.chain.get_last_block().hash,
+                "chain": chain, **self.metrics}
+
+def _run_replica(node_id: str, port: int, peer_ports: List[int], config: Dict[str, Any],
+                 ready, results, stop_event) -> None:
+    """副本进程入口"""
+    replica = Replica(node_id, port, peer_ports, config)
+    asyncio.new_event_loop().run_until_complete(replica.run(ready, results, stop_event))
+
+async def _inject_transactions(ports: List[int], duration: float, tx_rate: float) -> int:
+    """按固定速率向随机副本提交转账交易，返回提交总数"""
+    writers = []
+    for port in ports:
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+        writers.append(writer)
+    carriers = ["Carrier_1", "Carrier_2", "Carrier_3"]
+    submitted = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        tx = {"type": "transfer", "from": "Merchant_1", "to": random.choice(carriers),
+              "amount": round(random.uniform(1, 10), 2), "tx_id": f"tx_{submitted}",
+              "submitted_at": time.time()}
+        random.choice(writers).write(encode_message({"type": "submit", "tx": tx}))
+        submitted += 1
+        await asyncio.sleep(1.0 / tx_rate)
+    for writer in writers:
+        await writer.drain()
+        writer.close()
+    return submitted
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize(reports: List[Dict[str, Any]], submitted: int, elapsed: float) -> Dict[str, Any]:
+    """汇总各副本上报的数据：传播延迟、分叉率与确认吞吐"""
+    created = {}
+    for report in reports:
+        for block_hash, created_at in report["created"].items():
+            created[block_hash] = (report["node_id"], created_at)
+
+    latencies = []
+    for report in reports:
+        for block_hash, seen_at in report["first_seen"].items():
+            if block_hash in created and created[block_hash][0] != report["node_id"]:
+                latencies.append((seen_at - created[block_hash][1]) * 1000)
+
+    reference = reports[0]["chain"]
+    final_hashes = {block["hash"] for block in reference}
+    orphaned = [h for h in created if h not in final_hashes]
+    confirm_latencies = []
+    for block in reference:
+        sealed_at = created.get(block["hash"], (None, block["timestamp"]))[1]
+        confirm_latencies.extend((sealed_at - submitted_at) * 1000 for _, submitted_at in block["txs"])
+
+    return {
+        "replicas": len(reports),
+        "converged": len({report["tip"] for report in reports}) == 1,
+        "height": len(reference) - 1,
+        "blocks_created": len(created),
+        "fork_rate": len(orphaned) / len(created) if created else 0.0,
+        "reorgs": sum(report["reorgs"] for report in reports),
+        "stale_candidates": sum(report["stale"] for report in reports),
+        "propagation_ms": {"mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                           "p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95),
+                           "max": max(latencies, default=0.0)},
+        "submitted": submitted,
+        "confirmed": len(confirm_latencies),
+        "confirmed_tps": len(confirm_latencies) / elapsed if elapsed else 0.0,
+        "confirmation_ms": {"mean": sum(confirm_latencies) / len(confirm_latencies) if confirm_latencies else 0.0,
+                            "p95": _percentile(confirm_latencies, 0.95)}
+    }
+
+def run_network(duration: float = 10.0, tx_rate: float = 50.0, consensus: str = "pow",
+                difficulty: int = 12, block_interval: float = 1.0, base_port: int = 9400,
+                settle: float = 3.0) -> Dict[str, Any]:
+    """
+    启动每个超级节点对应的副本进程，注入交易并测量网络指标
+
+    Args:
+        duration: 注入交易的持续时间（秒）
+        tx_rate: 每秒提交的交易数
+        consensus: 副本使用的出块共识
+        difficulty: PoW 难度（前导零比特数）
+        block_interval: 各副本尝试出块的平均间隔（秒）
+        base_port: 第一个副本监听的本机端口
+        settle: 停止注入后等待网络收敛的时间（秒）
+    """
+    probe = Blockchain(consensus=consensus)
+    node_ids = sorted(node_id for node_id, node in probe.nodes.items() if node.node_type == "super_node")
+    ports = [base_port + i for i in range(len(node_ids))]
+    config = {"consensus": consensus, "difficulty": difficulty, "keystore": generate_keystore(node_ids),
+              "block_interval": block_interval, "genesis_timestamp": time.time()}
+
+    ready, results, stop_event = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+    processes = []
+    for i, node_id in enumerate(node_ids):
+        # 每个副本主动连接编号更小的副本，形成全连接网络
+        process = multiprocessing.Process(
+            target=_run_replica, name=f"replica-{node_id}", daemon=True,
+            args=(node_id, ports[i], ports[:i], config, ready, results, stop_event))
+        process.start()
+        processes.append(process)
+    for _ in processes:
+        ready.get(timeout=30)
+
+    start = time.time()
+    submitted = asyncio.new_event_loop().run_until_complete(_inject_transactions(ports, duration, tx_rate))
+    time.sleep(settle)
+    elapsed = time.time() - start
+    stop_event.set()
+    reports = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=10)
+    reports.sort(key=lambda report: report["node_id"])
+    return summarize(reports, submitted, elapsed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程伪分布式网络测量")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--tx-rate", type=float, default=50.0)
+    parser.add_argument("--consensus", choices=Blockchain.CONSENSUS_MODES, default="pow")
+    parser.add_argument("--difficulty", type=int, default=12)
+    parser.add_argument("--block-interval", type=float, default=1.0)
+    parser.add_argument("--base-port", type=int, default=9400)
+    args = parser.parse_args()
+    summary = run_network(args.duration, args.tx_rate, args.consensus, args.difficulty,
+                          args.block_interval, args.base_port)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
@@ -0,0 +1,268 @@
+from typing import Dict, Any, List, Optional, Iterable, Set
+import hashlib
+import os
+import struct
+import threading
+
+from codec import PayloadRef, TxRecord, encode_value, decode_value
+
+# 规范编码不小于该字节数的嵌套字典/列表才换成引用（引用本身编码为 33 字节）
+MIN_PAYLOAD_SIZE = 96
+
+# 可能换成引用的嵌套类型
+_NESTED = (dict, TxRecord, list, tuple)
+
+class PayloadStore:
+    """
+    内容寻址的载荷存储
+
+    交易中较大的嵌套对象（需求的货物清单、方案中的路线、支付中的方案等）按规范编码的
+    SHA-256 摘要存储一次，交易里只保留 PayloadRef：
+    - 自底向上替换：子对象先换成引用再计算父对象的摘要，未变化的子对象在不同交易间只存一份
+    - 交易的顶层字段保持内联，节点倒排索引等依赖的 ID、金额等标量仍可直接读取
+    - 区块哈希与 Merkle 叶子只覆盖引用，载荷的哈希只在首次存入时计算一次
+
+    指定 path 时载荷追加写入日志文件：记录 = [摘要 32 字节][载荷长度 u32][载荷]，
+    启动时逐条校验摘要并截断撕裂的尾部；内存中只保留 摘要 -> 文件偏移。
+
+    区块体裁剪后由 sweep 回收不再被引用的载荷：连续两次回收时都未被引用、且期间没有再次存入的载荷才删除，
+    正在封装的候选区块、尚未入池的交易等暂时不在链上的引用因此不会被误删。
+    持久化模式下被删除的记录累计超过存活记录的字节数时整体改写日志，回收的开销与存入的字节数成正比。
+    """
+
+    RECORD_HEADER = struct.Struct("<32sI")
+
+    def __init__(self, path: Optional[str] = None, min_size: int = MIN_PAYLOAD_SIZE, fsync: bool = False):
+        self.path = path
+        self.min_size = min_size
+        self.fsync = fsync
+        # 客户端线程（提交交易时）与账本写线程都会写入
+        self._lock = threading.Lock()
+        # 内存模式：摘要 -> 载荷；持久化模式：摘要 -> (载荷偏移, 长度)
+        self._blobs: Dict[str, Any] = {}
+        # 上次回收以来存入（含重复存入）的摘要，以及上次回收时已无引用的摘要
+        self._recent: Set[str] = set()
+        self._unreferenced: Set[str] = set()
+        # 日志中已删除记录的字节数
+        self._garbage_bytes = 0
+        self.stats = {"puts": 0, "deduplicated": 0, "bytes_stored": 0, "bytes_deduplicated": 0,
+                      "swept": 0, "bytes_swept": 0, "compactions": 0}
+        self._file = None
+        if path:
+            self._load()
+            self._file = open(path, "r+b")
+            self._file.seek(0, os.SEEK_END)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            open(self.path, "wb").close()
+        with open(self.path, "r+b") as f:
+            offset = 0
+            while True:
+                header = f.read(self.RECORD_HEADER.size)
+                if len(header) < self.RECORD_HEADER.size:
+                    break
+                digest, length = self.RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length or hashlib.sha256(data).digest() != digest:
+                    break
+                start = offset + self.RECORD_HEADER.size
+                self._blobs[digest.hex()] = (start, length)
+                self.stats["bytes_stored"] += length
+                offset = start + length
+            f.truncate(offset)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._blobs
+
+    # ---- 原始载荷 ----
+
+    def put_encoded(self, data: bytes) -> PayloadRef:
+        """存入已规范编码的载荷（已存在时不重复存储），返回其引用"""
+        digest = hashlib.sha256(data).digest()
+        ref = PayloadRef(digest.hex())
+        with self._lock:
+            self.stats["puts"] += 1
+            self._recent.add(ref)
+            if ref in self._blobs:
+                self.stats["deduplicated"] += 1
+                self.stats["bytes_deduplicated"] += len(data)
+                return ref
+            if self._file is None:
+                self._blobs[ref] = data
+            else:
+                offset = self._file.seek(0, os.SEEK_END)
+                self._file.write(self.RECORD_HEADER.pack(digest, len(data)) + data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self._blobs[ref] = (offset + self.RECORD_HEADER.size, len(data))
+            self.stats["bytes_stored"] += len(data)
+        return ref
+
+    def get_encoded(self, digest: str) -> bytes:
+        """读取载荷的规范编码，不存在时抛出 KeyError"""
+        with self._lock:
+            blob = self._blobs[digest]
+            if self._file is None:
+                return blob
+            offset, length = blob
+            self._file.seek(offset)
+            data = self._file.read(length)
+            self._file.seek(0, os.SEEK_END)
+            return data
+
+    def add_encoded(self, digest: str, data: bytes) -> None:
+        """导入其他节点发来的载荷，摘要不符时拒绝"""
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Payload digest mismatch: {digest}")
+        self.put_encoded(data)
+
+    # ---- 引用替换与还原 ----
+
+    def externalize(self, value: Any) -> Any:
+        """将不小于 min_size 的字典/列表（自底向上）存入载荷存储并替换为引用"""
+        if isinstance(value, (dict, TxRecord)):
+            value = {key: self.externalize(item) if isinstance(item, _NESTED) else item
+                     for key, item in value.items()}
+        elif isinstance(value, (list, tuple)):
+            # 标量元素不逐个递归（按列组织的大列表只需编码一次）
+            value = [self.externalize(item) if isinstance(item, _NESTED) else item for item in value]
+        else:
+            return value
+        encoded = encode_value(value)
+        if len(encoded) < self.min_size:
+            return value
+        return self.put_encoded(encoded)
+
+    def externalize_transaction(self, tx: Dict[str, Any]) -> Dict[str, Any]:
+        """交易的顶层字段保持内联，其中较大的嵌套对象换成引用（已换成引用的部分保持不变）"""
+        result = {}
+        for key, value in tx.items():
+            if isinstance(value, (dict, TxRecord)):
+                value = {k: self.externalize(v) if isinstance(v, _NESTED) else v for k, v in value.items()}
+            elif isinstance(value, (list, tuple)):
+                value = [self.externalize(v) if isinstance(v, _NESTED) else v for v in value]
+            result[key] = value
+        return result
+
+    def get(self, ref: str) -> Any:
+        """读取载荷（其中的子对象仍为引用）"""
+        return decode_value(self.get_encoded(ref))
+
+    def resolve(self, value: Any) -> Any:
+        """递归还原引用，返回完整对象（交易记录还原为字典）"""
+        if isinstance(value, PayloadRef):
+            return self.resolve(self.get(value))
+        if isinstance(value, (dict, TxRecord)):
+            return {key: self.resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        return value
+
+    @staticmethod
+    def refs(value: Any) -> List[PayloadRef]:
+        """值中直接出现的引用（不展开载荷内部）"""
+        found = []
+        stack = [value]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, PayloadRef):
+                found.append(item)
+            elif isinstance(item, (dict, TxRecord)):
+                stack.extend(v for _, v in item.items())
+            elif isinstance(item, list):
+                stack.extend(item)
+        return found
+
+    def missing(self, values: Iterable[Any]) -> List[PayloadRef]:
+        """values 中引用了、但本地没有的载荷"""
+        return [ref for value in values for ref in self.refs(value) if ref not in self._blobs]
+
+    def reachable(self, values: Iterable[Any]) -> Set[str]:
+        """values 引用的全部载荷摘要（含载荷内部的引用，本地没有的载荷不展开）"""
+        found: Set[str] = set()
+        pending = [ref for value in values for ref in self.refs(value)]
+        while pending:
+            ref = pending.pop()
+            if ref in found:
+                continue
+            found.add(ref)
+            if ref in self._blobs:
+                pending.extend(self.refs(self.get(ref)))
+        return found
+
+    # ---- 回收 ----
+
+    def sweep(self, live: Set[str]) -> int:
+        """
+        回收不在 live 中的载荷（须包含仍可读取的区块体与交易池引用的全部摘要，见 reachable）
+
+        Returns:
+            本次删除的载荷数
+        """
+        with self._lock:
+            dead = {digest for digest in self._blobs if digest not in live and digest not in self._recent}
+            doomed = dead & self._unreferenced
+            for digest in doomed:
+                blob = self._blobs.pop(digest)
+                length = len(blob) if self._file is None else blob[1]
+                self.stats["bytes_stored"] -= length
+                self.stats["bytes_swept"] += length
+                if self._file is not None:
+                    self._garbage_bytes += self.RECORD_HEADER.size + length
+            self.stats["swept"] += len(doomed)
+            self._unreferenced = dead - doomed
+            self._recent = set()
+            if self._file is not None and self._garbage_bytes > self.stats["bytes_stored"]:
+                self._compact()
+        return len(doomed)
+
+    def _compact(self) -> None:
+        """按原顺序只保留存活记录改写日志（调用方持有锁）"""
+        tmp_path = self.path + ".tmp"
+        blobs = {}
+        with open(tmp_path, "wb") as f:
+            for digest, (offset, length) in sorted(self._blobs.items(), key=lambda item: item[1][0]):
+                self._file.seek(offset)
+                data = self._file.read(length)
+                f.write(self.RECORD_HEADER.pack(bytes.fromhex(digest), length))
+                blobs[digest] = (f.tell(), length)
+                f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "r+b")
+        self._file.seek(0, os.SEEK_END)
+        self._blobs = blobs
+        self._garbage_bytes = 0
+        self.stats["compactions"] += 1
+
+    # ---- 节点间传输 ----
+
+    def bundle(self, values: Iterable[Any]) -> Dict[str, bytes]:
+        """收集 values 引用的全部载荷（含载荷内部的引用），用于随区块/交易一起发送"""
+        result: Dict[str, bytes] = {}
+        pending = [ref for value in values for ref in self.refs(value)]
+        while pending:
+            ref = pending.pop()
+            if ref in result:
+                continue
+            result[ref] = self.get_encoded(ref)
+            pending.extend(self.refs(decode_value(result[ref])))
+        return result
+
+    def import_bundle(self, bundle: Dict[str, bytes]) -> None:
+        for digest, data in bundle.items():
+            if digest not in self._blobs:
+                self.add_encoded(digest, data)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
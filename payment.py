@@ -1,11 +1,13 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+import copy
 import time
 from datetime import datetime
 import hashlib
 import json
 from enum import Enum
+import weakref
 from api import verify_compliance, check_logistics_status
-from blockchain import blockchain
+from ledger_service import ledger
 
 # 确保这些定义在文件顶部，且没有缩进到其他类或方法中
 class PaymentStatus(Enum):
@@ -29,9 +31,49 @@ class PaymentStage(Enum):
         """将 PaymentStage 转换为可序列化的字符串"""
         return self.value
 
+# 所有存活的支付系统实例（每个会话一个），状态快照从中导出未完成的支付
+_payment_systems = weakref.WeakSet()
+# 从状态快照恢复的未完成支付，之后创建的支付系统实例各自接管一份副本；任一实例结清或退款后移除
+_recovered_payments: Dict[str, Dict] = {}
+
+# 已结清或已退款的支付状态
+_SETTLED = (PaymentStatus.COMPLETED.value, PaymentStatus.REFUNDED.value)
+
+def export_open_payments() -> Dict[str, Dict]:
+    """导出未完成（未结清、未退款）的支付，写入账本状态快照；任一实例中已结清的支付不再导出"""
+    open_payments = {payment_id: payment for payment_id, payment in _recovered_payments.items()
+                     if payment["status"] not in _SETTLED}
+    settled = set()
+    for system in list(_payment_systems):
+        for payment_id, payment in list(system.payments.items()):
+            if payment["status"] in _SETTLED:
+                settled.add(payment_id)
+            else:
+                open_payments[payment_id] = payment
+    return json.loads(json.dumps({payment_id: payment for payment_id, payment in open_payments.items()
+                                  if payment_id not in settled}))
+
+def restore_open_payments(payments: Dict[str, Dict]) -> None:
+    """从状态快照恢复未完成的支付，每个实例得到各自的副本"""
+    payments = {payment_id: payment for payment_id, payment in payments.items() if payment["status"] not in _SETTLED}
+    _recovered_payments.update(copy.deepcopy(payments))
+    for system in list(_payment_systems):
+        for payment_id, payment in payments.items():
+            if payment_id not in system.payments:
+                system.payments[payment_id] = copy.deepcopy(payment)
+
+def payment_delta(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """对比上次上链的支付状态，返回 (变化或新增的顶层字段, 删除的字段)"""
+    changes = {key: value for key, value in current.items() if key not in previous or previous[key] != value}
+    removed = [key for key in previous if key not in current]
+    return changes, removed
+
 class PaymentSystem:
     def __init__(self):
-        self.payments: Dict[str, Dict] = {}
+        self.payments: Dict[str, Dict] = copy.deepcopy(_recovered_payments)
+        # 每笔支付最近一次上链时的状态，之后的更新只记录与它的差异
+        self._recorded: Dict[str, Dict] = {}
+        _payment_systems.add(self)
         self.stage_weights = {
             PaymentStage.WAREHOUSE: 0.3,
             PaymentStage.CUSTOMS: 0.4,
@@ -64,10 +106,25 @@ class PaymentSystem:
             "solution": solution  # 存储 solution 以便后续使用
         }
         self.payments[payment_id] = payment
-        blockchain.add_transaction({"type": "payment_created", "data": payment})
+        self._recorded[payment_id] = copy.deepcopy(payment)
+        ledger.add_transaction({"type": "payment_created", "data": payment})
         print("Debug: Payment created with ID:", payment_id)
         return payment_id
     
+    def _record_delta(self, payment_id: str, event: str) -> None:
+        """记录支付更新：只写入自上次上链以来变化的字段，未变化的方案等不再重复上链"""
+        payment = self.payments[payment_id]
+        changes, removed = payment_delta(self._recorded.get(payment_id, {}), payment)
+        tx = {"type": "payment_delta", "payment_id": payment_id, "event": event, "changes": changes}
+        if removed:
+            tx["removed"] = removed
+        ledger.add_transaction(tx)
+        self._recorded[payment_id] = copy.deepcopy(payment)
+    
+    def _settle(self, payment_id: str) -> None:
+        """支付已结清或已退款：从待接管的恢复支付中移除，之后的会话与状态快照不再把它当作未完成"""
+        _recovered_payments.pop(payment_id, None)
+    
     def _generate_payment_id(self, solution: Dict, payer_id: str) -> str:
         data = f"{solution['carrier_id']}{payer_id}{time.time()}"
         return f"pay_{hashlib.sha256(data.encode()).hexdigest()[:8]}"
@@ -126,6 +183,7 @@ class PaymentSystem:
             payment["current_stage"] = stages[current_index + 1]
         else:
             payment["status"] = PaymentStatus.COMPLETED.to_json()
+            self._settle(payment_id)
         print("Debug: Updated current_stage to:", payment["current_stage"])
         
         # 记录碳补偿（在 delivery 阶段）
@@ -139,7 +197,7 @@ class PaymentSystem:
             print(f"Debug: Error in carbon compensation block: {str(e)}")
             raise
         
-        blockchain.add_transaction({"type": "payment_advanced", "payment": payment})
+        self._record_delta(payment_id, "advanced")
         print("Debug: Payment advanced successfully:", payment_id)
         
         # 同步物流状态
@@ -192,8 +250,9 @@ class PaymentSystem:
             else:
                 payment["status"] = PaymentStatus.COMPLETED.to_json()
                 payment["completed_at"] = datetime.now().isoformat()
+                self._settle(payment_id)
             payment["updated_at"] = datetime.now().isoformat()
-            blockchain.add_transaction({
+            ledger.add_transaction({
                 "type": "payment_stage",
                 "payment_id": payment_id,
                 "stage": stage.to_json(),
@@ -261,7 +320,7 @@ class PaymentSystem:
             "status": "pending",
             "amount": sum(payment["paid_amounts"].values())
         }
-        blockchain.add_transaction({"type": "refund_requested", "payment_id": payment_id, "reason": reason})
+        ledger.add_transaction({"type": "refund_requested", "payment_id": payment_id, "reason": reason})
         print("Debug: Refund requested successfully:", payment_id)
         return True
     
@@ -276,7 +335,8 @@ class PaymentSystem:
             payment["refund_info"]["processed_at"] = datetime.now().isoformat()
             if approved:
                 payment["status"] = PaymentStatus.REFUNDED.to_json()
-            blockchain.add_transaction({"type": "refund_processed", "payment_id": payment_id, "approved": approved})
+                self._settle(payment_id)
+            ledger.add_transaction({"type": "refund_processed", "payment_id": payment_id, "approved": approved})
             print("Debug: Refund processed successfully:", payment_id)
             return True
         print("Debug: Refund not in pending state")
@@ -293,4 +353,6 @@ class PaymentSystem:
             for stage, amount in payment["paid_amounts"].items():
                 stats[stage]["count"] += 1
                 stats[stage]["total_amount"] += amount
-        return stats
\ No newline at end of file
+        return stats
+
+ledger.call(ledger.chain.register_state_provider, "open_payments", export_open_payments, restore_open_payments)
@@ -0,0 +1,208 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from bisect import bisect_right
+import json
+import os
+
+class PostingIndex:
+    """
+    节点交易倒排索引：节点ID -> [(区块索引, 交易偏移)]，按链上顺序
+
+    条目按区块分段保存（与区块日志的分段对齐），每个分段为 节点ID -> 条目列表：
+    - 内存模式（path 为 None）：全部分段常驻内存
+    - 持久化模式：每个区块的条目追加一行到 {segment}.post（[区块索引, [[节点ID, 偏移], ...]]），
+      只在裁剪时整段删除或改写；更早的分段在查询时按需读取，按 LRU 最多缓存 cache_segments 个
+
+    另外维护每个节点的条目数、最近出现的区块，以及该节点出现过的分段和各分段末尾的累计条目数
+    （条目按链上顺序编号，裁剪后编号不变，start 为最早一条仍保留的条目）；检查点保存这些表和
+    最后一个分段文件的长度，重启时不必加载任何分段。分页查询按累计条目数二分定位第 offset 条所在的分段，
+    只读取含有该节点条目的分段，读取的分段数只与页大小有关，与链长和节点最近出现的位置无关。
+    """
+
+    def __init__(self, path: Optional[str] = None, blocks_per_segment: int = 1024, cache_segments: int = 8):
+        self.path = path
+        self.blocks_per_segment = blocks_per_segment
+        self.cache_segments = cache_segments
+        self.counts: Dict[str, int] = {}
+        self.last_block: Dict[str, int] = {}
+        # 节点 -> 出现过的分段（升序）、各分段末尾的累计条目编号、最早保留的条目编号
+        self.node_segments: Dict[str, List[int]] = {}
+        self.node_ends: Dict[str, List[int]] = {}
+        self.node_start: Dict[str, int] = {}
+        self._segments: "OrderedDict[int, Dict[str, List[Tuple[int, int]]]]" = OrderedDict()
+        self._last_segment = -1
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._last_segment = max(self._segment_files(), default=-1)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.counts
+
+    def _file(self, segment: int) -> str:
+        return os.path.join(self.path, f"{segment:08d}.post")
+
+    def _segment_files(self) -> List[int]:
+        return sorted(int(name[:-5]) for name in os.listdir(self.path)
+                      if name.endswith(".post") and name[:-5].isdigit())
+
+    def _read_lines(self, segment: int) -> List[Tuple[int, List[List[Any]]]]:
+        """读取分段文件的各行，丢弃崩溃时写了一半的尾行"""
+        lines = []
+        if not os.path.exists(self._file(segment)):
+            return lines
+        with open(self._file(segment), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    block_index, entries = json.loads(line)
+                except ValueError:
+                    break
+                lines.append((block_index, entries))
+        return lines
+
+    def _write_lines(self, segment: int, lines: List[Tuple[int, List[List[Any]]]]) -> None:
+        tmp_path = self._file(segment) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._file(segment))
+
+    def _segment(self, segment: int) -> Dict[str, List[Tuple[int, int]]]:
+        postings = self._segments.get(segment)
+        if postings is not None:
+            self._segments.move_to_end(segment)
+            return postings
+        postings = {}
+        if self.path:
+            for block_index, entries in self._read_lines(segment):
+                for node_id, offset in entries:
+                    postings.setdefault(node_id, []).append((block_index, offset))
+        self._segments[segment] = postings
+        if self.path:
+            # 正在追加的分段始终保留
+            for cached in list(self._segments):
+                if len(self._segments) <= self.cache_segments:
+                    break
+                if cached != self._last_segment:
+                    del self._segments[cached]
+        return postings
+
+    def add_block(self, block_index: int, entries: List[Tuple[str, int]]) -> None:
+        """登记一个区块的条目 [(节点ID, 交易偏移)]，区块须按链上顺序追加"""
+        segment = block_index // self.blocks_per_segment
+        self._last_segment = max(self._last_segment, segment)
+        postings = self._segment(segment)
+        for node_id, offset in entries:
+            postings.setdefault(node_id, []).append((block_index, offset))
+            self.counts[node_id] = self.counts.get(node_id, 0) + 1
+            self.last_block[node_id] = block_index
+            segments = self.node_segments.setdefault(node_id, [])
+            ends = self.node_ends.setdefault(node_id, [])
+            if segments and segments[-1] == segment:
+                ends[-1] += 1
+            else:
+                segments.append(segment)
+                ends.append((ends[-1] if ends else self.node_start.setdefault(node_id, 0)) + 1)
+        if self.path and entries:
+            with open(self._file(segment), "a", encoding="utf-8") as f:
+                f.write(json.dumps([block_index, entries], ensure_ascii=False) + "\n")
+
+    def page(self, node_id: str, offset: int = 0, limit: int = 10) -> List[Tuple[int, int]]:
+        """节点的第 [offset, offset + limit) 条条目（最新在前）"""
+        segments = self.node_segments.get(node_id)
+        if not segments or limit <= 0:
+            return []
+        ends = self.node_ends[node_id]
+        # 按链上编号，本页为 [low, high]，从 high 向前读取
+        high = ends[-1] - 1 - offset
+        low = max(ends[-1] - offset - limit, self.node_start[node_id])
+        collected: List[Tuple[int, int]] = []
+        position = bisect_right(ends, high)
+        while position >= 0 and high >= low:
+            items = self._segment(segments[position]).get(node_id, ())
+            first = ends[position] - len(items)
+            for item in reversed(items[max(low - first, 0):high - first + 1]):
+                collected.append(item)
+            high = first - 1
+            position -= 1
+        return collected
+
+    def _forget(self, postings: Dict[str, List[Tuple[int, int]]]) -> None:
+        for node_id, items in postings.items():
+            remaining = self.counts.get(node_id, 0) - len(items)
+            if remaining > 0:
+                self.counts[node_id] = remaining
+                start = self.node_start[node_id] = self.node_start[node_id] + len(items)
+                # 去掉条目已全部移除的分段
+                cut = bisect_right(self.node_ends[node_id], start)
+                del self.node_segments[node_id][:cut]
+                del self.node_ends[node_id][:cut]
+            else:
+                for table in (self.counts, self.last_block, self.node_segments, self.node_ends, self.node_start):
+                    table.pop(node_id, None)
+
+    def drop_through(self, height: int) -> None:
+        """移除区块索引不大于 height 的条目（区块体已裁剪）"""
+        segments = self._segment_files() if self.path else list(self._segments)
+        for segment in segments:
+            start = segment * self.blocks_per_segment
+            if start > height:
+                continue
+            postings = self._segment(segment)
+            if start + self.blocks_per_segment - 1 <= height:
+                self._forget(postings)
+                del self._segments[segment]
+                if self.path:
+                    os.remove(self._file(segment))
+                continue
+            dropped = {}
+            for node_id in list(postings):
+                items = postings[node_id]
+                cut = sum(1 for block_index, _ in items if block_index <= height)
+                if cut:
+                    dropped[node_id] = items[:cut]
+                    del items[:cut]
+                    if not items:
+                        del postings[node_id]
+            self._forget(dropped)
+            if self.path:
+                self._write_lines(segment, [line for line in self._read_lines(segment) if line[0] > height])
+
+    def clear(self) -> None:
+        """清空索引（持久化模式同时删除分段文件），用于从链上数据重建"""
+        if self.path:
+            for segment in self._segment_files():
+                os.remove(self._file(segment))
+        self.counts = {}
+        self.last_block = {}
+        self.node_segments = {}
+        self.node_ends = {}
+        self.node_start = {}
+        self._segments.clear()
+        self._last_segment = -1
+
+    def summary(self) -> Dict[str, Any]:
+        """写入检查点的汇总：各节点的条目数、最近出现的区块与分段表，以及最后一个分段文件的长度"""
+        size = 0
+        if self.path and os.path.exists(self._file(self._last_segment)):
+            size = os.path.getsize(self._file(self._last_segment))
+        return {"counts": self.counts, "last_block": self.last_block,
+                "segments": {node_id: [segments, self.node_ends[node_id], self.node_start[node_id]]
+                             for node_id, segments in self.node_segments.items()},
+                "segment": self._last_segment, "size": size}
+
+    def restore(self, summary: Dict[str, Any]) -> None:
+        """按检查点恢复汇总，并截掉检查点之后写入的条目（对应的区块将被重放），不读取任何分段"""
+        self.counts = dict(summary["counts"])
+        self.last_block = dict(summary["last_block"])
+        self.node_segments = {node_id: list(entry[0]) for node_id, entry in summary["segments"].items()}
+        self.node_ends = {node_id: list(entry[1]) for node_id, entry in summary["segments"].items()}
+        self.node_start = {node_id: entry[2] for node_id, entry in summary["segments"].items()}
+        self._segments.clear()
+        self._last_segment = summary["segment"]
+        if self.path:
+            for segment in self._segment_files():
+                if segment > self._last_segment:
+                    os.remove(self._file(segment))
+            if os.path.exists(self._file(self._last_segment)):
+                with open(self._file(self._last_segment), "r+b") as f:
+                    f.truncate(summary["size"])
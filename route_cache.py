@@ -0,0 +1,78 @@
+from typing import Dict, Any, Callable, Hashable, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from bisect import bisect_right
+import threading
+import time
+
+# 载重等级分界（STU）：同一航线、运输方式下载重相近的报价共用一条缓存
+LOAD_CLASS_BOUNDS = (1, 2, 5, 10, 20, 50, 100)
+
+def load_class(stu: float) -> int:
+    return bisect_right(LOAD_CLASS_BOUNDS, stu)
+
+class RouteQuote(NamedTuple):
+    """一条航线/运输方式/载重等级的报价基础数据，碳足迹按单位 STU 保存，使用时乘以实际载重"""
+    distance: float
+    carbon_per_stu: float
+    created_at: float
+
+class RouteQuoteCache:
+    """
+    航线报价缓存（LRU + TTL）
+
+    键为 (起点, 终点, 运输方式, 载重等级)。命中时不再计算距离与碳足迹，同一航线在有效期内
+    报价一致（距离的中转随机与碳排放系数、天气的随机只在首次计算时取一次）。
+    超过 max_entries 时淘汰最久未使用的条目；条目创建超过 ttl 秒后视为过期，下次访问时重新计算。
+    max_entries 为 0 时不缓存。
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, RouteQuote]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, compute: Callable[[], Tuple[float, float]]) -> RouteQuote:
+        """读取报价，未命中或已过期时调用 compute() 得到 (距离, 单位 STU 碳足迹) 并缓存"""
+        now = self.clock()
+        with self._lock:
+            quote = self._entries.get(key)
+            if quote is not None:
+                if now - quote.created_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return quote
+                del self._entries[key]
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+        # 在锁外计算，慢速的外部查询不阻塞其他航线的命中
+        distance, carbon_per_stu = compute()
+        quote = RouteQuote(distance, carbon_per_stu, now)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = quote
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return quote
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """清除一条（或全部）缓存，如航线距离、排放系数更新后"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {**self._stats, "entries": len(self._entries),
+                    "hit_rate": self._stats["hits"] / lookups if lookups else 0.0}
@@ -0,0 +1,31 @@
+from auction_scheduler import AuctionScheduler
+from bidding import BiddingSystem
+
+
+def _scheduler(now):
+    fired = []
+
+    def on_due(key, phase, at):
+        fired.append((key, phase, at))
+        return [{"key": key, "phase": phase}]
+
+    return AuctionScheduler(on_due, clock=lambda: now[0]), fired
+
+
+def test_tick_uses_injected_clock():
+    now = [100.0]
+    scheduler, fired = _scheduler(now)
+    scheduler.schedule("bid_1", "second_round", 160.0)
+    scheduler.schedule("bid_2", "completed", 400.0)
+
+    assert scheduler.tick() == []
+    now[0] = 160.0
+    assert scheduler.tick() == [{"key": "bid_1", "phase": "second_round"}]
+    assert fired == [("bid_1", "second_round", 160.0)]
+    assert scheduler.next_deadline() == 400.0
+
+
+def test_bidding_system_shares_its_clock():
+    now = [0.0]
+    bidding = BiddingSystem(clock=lambda: now[0])
+    assert bidding.scheduler.clock is bidding.clock
@@ -0,0 +1,80 @@
+"""区块日志的崩溃恢复：撕裂的尾部记录、缺失的索引项、中断的分段改写"""
+import os
+
+import pytest
+
+from block_store import BlockStore
+
+def _payload(n):
+    return f"block-{n}".encode() * (n + 1)
+
+def _store(path, blocks, blocks_per_segment=4):
+    store = BlockStore(str(path), blocks_per_segment)
+    for n in range(blocks):
+        store.append(_payload(n))
+    store.close()
+    return store
+
+def _contents(path, blocks_per_segment=4):
+    store = BlockStore(str(path), blocks_per_segment)
+    try:
+        return [store.read(n) for n in range(len(store))]
+    finally:
+        store.close()
+
+def test_torn_tail_record_is_truncated(tmp_path):
+    _store(tmp_path, 6)
+    log_path = os.path.join(tmp_path, "00000001.log")
+    size = os.path.getsize(log_path)
+    with open(log_path, "ab") as f:
+        f.write(BlockStore.RECORD_HEADER.pack(100, 0) + b"partial")
+    assert _contents(tmp_path) == [_payload(n) for n in range(6)]
+    assert os.path.getsize(log_path) == size
+
+def test_index_entry_of_torn_record_is_dropped(tmp_path):
+    _store(tmp_path, 6)
+    log_path = os.path.join(tmp_path, "00000001.log")
+    with open(log_path, "r+b") as f:
+        f.truncate(os.path.getsize(log_path) - 3)
+    assert _contents(tmp_path) == [_payload(n) for n in range(5)]
+    store = BlockStore(str(tmp_path), 4)
+    assert store.append(b"next") == 5
+    assert store.read(5) == b"next"
+    store.close()
+
+def test_logged_records_missing_from_index_are_reindexed(tmp_path):
+    _store(tmp_path, 7)
+    idx_path = os.path.join(tmp_path, "00000001.idx")
+    with open(idx_path, "r+b") as f:
+        f.truncate(BlockStore.INDEX_ENTRY.size)
+    assert _contents(tmp_path) == [_payload(n) for n in range(7)]
+    assert os.path.getsize(idx_path) == 3 * BlockStore.INDEX_ENTRY.size
+
+def _interrupted_rewrite(tmp_path, monkeypatch, completed_renames):
+    """改写分段 0，在完成 completed_renames 次重命名后模拟崩溃"""
+    _store(tmp_path, 9)
+    store = BlockStore(str(tmp_path), 4)
+    real_replace = os.replace
+    calls = []
+    def crashing_replace(src, dst):
+        if len(calls) == completed_renames:
+            raise OSError("simulated crash")
+        calls.append(src)
+        real_replace(src, dst)
+    monkeypatch.setattr(os, "replace", crashing_replace)
+    with pytest.raises(OSError):
+        store.rewrite_segment(0, [b"header-%d" % n for n in range(4)])
+    monkeypatch.setattr(os, "replace", real_replace)
+    store.close()
+
+@pytest.mark.parametrize("completed_renames", [1, 2])
+def test_rewrite_with_complete_data_is_finished(tmp_path, monkeypatch, completed_renames):
+    _interrupted_rewrite(tmp_path, monkeypatch, completed_renames)
+    assert _contents(tmp_path) == [b"header-%d" % n for n in range(4)] + [_payload(n) for n in range(4, 9)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".tmp", ".compact"))]
+
+def test_unfinished_rewrite_is_discarded(tmp_path, monkeypatch):
+    _interrupted_rewrite(tmp_path, monkeypatch, 0)
+    assert os.path.exists(os.path.join(tmp_path, "00000000.log.tmp"))
+    assert _contents(tmp_path) == [_payload(n) for n in range(9)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".tmp", ".compact"))]
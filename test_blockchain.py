@@ -0,0 +1,108 @@
+"""外部区块的挖矿奖励校验：每种不合规的奖励都应使 add_block 拒绝区块"""
+import copy
+
+import pytest
+
+from blockchain import Blockchain, generate_keystore, public_keystore
+from codec import to_record
+
+def _chains():
+    source = Blockchain(difficulty=1)
+    replica = Blockchain(difficulty=1, genesis_timestamp=source.chain[0].timestamp)
+    source.add_transaction({"type": "transfer", "from": "Merchant_1", "to": "Carrier_1", "amount": 5})
+    return source, replica
+
+def _reseal(source, block, transactions, sealer=None):
+    block.transactions = [to_record(tx) for tx in transactions]
+    block.sealer = sealer or block.sealer
+    block.merkle_root = block.calculate_merkle_root()
+    return source.seal_block(block)
+
+def _reward(block, **changes):
+    return {**block.transactions[-1].to_dict(), **changes}
+
+def test_valid_reward_is_accepted():
+    source, replica = _chains()
+    block = source.seal_block(source.prepare_block("SuperNode_A"))
+    assert replica.add_block(block)
+    assert replica.get_node_balance("SuperNode_A") == 1000 + source.get_mining_reward(1)
+
+def test_block_without_reward_is_rejected():
+    source, replica = _chains()
+    block = source.prepare_block("SuperNode_A")
+    assert not replica.add_block(_reseal(source, block, block.transactions[:-1]))
+
+def test_second_reward_is_rejected():
+    source, replica = _chains()
+    block = source.prepare_block("SuperNode_A")
+    extra = _reward(block, timestamp=block.transactions[-1]["timestamp"] + 1)
+    assert not replica.add_block(_reseal(source, block, block.transactions + [extra]))
+
+def test_reward_not_last_is_rejected():
+    source, replica = _chains()
+    block = source.prepare_block("SuperNode_A")
+    assert not replica.add_block(_reseal(source, block, block.transactions[::-1]))
+
+@pytest.mark.parametrize("amount", [1e6, 0, 9.5])
+def test_wrong_reward_amount_is_rejected(amount):
+    source, replica = _chains()
+    block = source.prepare_block("SuperNode_A")
+    assert not replica.add_block(_reseal(source, block, block.transactions[:-1] + [_reward(block, amount=amount)]))
+
+def test_reward_to_other_node_is_rejected():
+    source, replica = _chains()
+    block = source.prepare_block("SuperNode_A")
+    assert not replica.add_block(_reseal(source, block, block.transactions[:-1] + [_reward(block, miner="Carrier_1")]))
+
+def test_sealer_must_be_super_node():
+    source, replica = _chains()
+    block = source.prepare_block("Carrier_1")
+    assert block.sealer == "Carrier_1"
+    assert not replica.add_block(source.seal_block(block))
+
+def test_unsigned_block_is_rejected_outside_pow():
+    keystore = generate_keystore(["SuperNode_A", "SuperNode_B", "SuperNode_C"])
+    source = Blockchain(consensus="pos", keystore=keystore)
+    replica = Blockchain(consensus="pos", keystore=public_keystore(keystore), genesis_timestamp=source.chain[0].timestamp)
+    source.add_transaction({"type": "transfer", "from": "Merchant_1", "to": "Carrier_1", "amount": 5})
+    block = source.prepare_block()
+    assert block.difficulty == 0
+    block.hash = block.calculate_hash()
+    assert not replica.add_block(block)
+    forged = copy.deepcopy(block)
+    forged.sealer = "Carrier_1"
+    forged.transactions = [to_record(tx) for tx in block.transactions[:-1]] + [_reward(block, miner="Carrier_1", amount=1e6)]
+    forged.merkle_root = forged.calculate_merkle_root()
+    forged.hash = forged.calculate_hash()
+    assert not replica.add_block(forged)
+    assert replica.add_block(source.seal_block(block))
+
+def test_pow_block_without_work_is_rejected():
+    source, replica = _chains()
+    block = source.prepare_block("SuperNode_A")
+    block.difficulty = 0
+    block.hash = block.calculate_hash()
+    assert not replica.add_block(block)
+    with pytest.raises(ValueError):
+        Blockchain(difficulty=0)
+
+def test_prune_keeps_postings_of_readable_bodies(tmp_path):
+    chain = Blockchain(difficulty=1, data_dir=str(tmp_path), snapshot_interval=5, retention_blocks=5)
+    for _ in range(30):
+        chain.add_transaction({"type": "transfer", "from": "Merchant_1", "to": "Carrier_1", "amount": 1})
+        chain.commit_block(chain.seal_block(chain.prepare_block("SuperNode_A")))
+    # 区块未写满一个分段，区块体均未裁剪，交易历史完整保留
+    assert chain.pruned_height == 0
+    assert chain.node_index.counts["Merchant_1"] == 30
+
+def test_prune_releases_payloads_of_pruned_bodies():
+    chain = Blockchain(difficulty=1, snapshot_interval=5, retention_blocks=5)
+    for i in range(40):
+        items = [{"sku": f"S{i}-{k}", "note": "x" * 40} for k in range(5)]
+        chain.add_transaction({"type": "demand", "demand_id": f"D{i}", "base_data": {"items": items}})
+        chain.commit_block(chain.seal_block(chain.prepare_block("SuperNode_A")))
+    assert chain.pruned_height > 0
+    assert len(chain.payloads) < 40
+    for block in chain.chain[chain.pruned_height + 1:]:
+        for tx in block.transactions:
+            chain.payloads.resolve(tx)
@@ -0,0 +1,62 @@
+"""规范编码：逐类型往返、整数 zigzag 编码、字典键序无关，以及只解码区块头与完整解码一致"""
+import hashlib
+
+import pytest
+
+from codec import (TX_SCHEMAS, PayloadRef, decode_block_fields, decode_transaction, decode_value,
+                   encode_block_fields, encode_header, encode_transaction, encode_value)
+
+_SAMPLES = ["Carrier_1", 12, -7, 3.25, None, True, {"origin": "Shanghai", "items": [1, 2.5, "x"]}, [0, {"k": False}]]
+
+def _transaction(tx_type, fields):
+    tx = {"type": tx_type, "timestamp": 1700000000.5}
+    for i, field in enumerate(fields):
+        tx[field] = _SAMPLES[i % len(_SAMPLES)]
+    return tx
+
+@pytest.mark.parametrize("tx_type,fields", TX_SCHEMAS)
+def test_transaction_round_trip(tx_type, fields):
+    tx = _transaction(tx_type, fields)
+    assert decode_transaction(encode_transaction(tx)).to_dict() == tx
+    # 架构之外的字段随记录一起往返
+    extended = {**tx, "nonce": "abc123"}
+    assert decode_transaction(encode_transaction(extended)).to_dict() == extended
+
+def test_unknown_transaction_type_round_trip():
+    tx = {"type": "custom_event", "payload": {"a": 1}, "timestamp": 1.0}
+    assert decode_transaction(encode_transaction(tx)).to_dict() == tx
+
+@pytest.mark.parametrize("value", [0, 1, -1, 63, -64, 64, -65, 2 ** 31, -2 ** 31, 2 ** 63, -2 ** 63 - 1, 10 ** 30,
+                                   -10 ** 30])
+def test_int_zigzag_round_trip(value):
+    decoded = decode_value(encode_value(value))
+    assert decoded == value and type(decoded) is int
+
+def test_scalar_types_round_trip():
+    value = {"f": -0.5, "t": True, "n": None, "b": b"\x00\xff", "s": "碳补偿", "r": PayloadRef("ab" * 32),
+             "l": [1, [2, [3]]]}
+    decoded = decode_value(encode_value(value))
+    assert decoded == value
+    assert decoded["t"] is True and isinstance(decoded["r"], PayloadRef)
+
+def test_dict_key_order_does_not_change_bytes():
+    first = {"b": 1, "a": {"y": [1, {"q": 1, "p": 2}], "x": 2}}
+    second = {"a": {"x": 2, "y": [1, {"p": 2, "q": 1}]}, "b": 1}
+    assert encode_value(first) == encode_value(second)
+    tx = {"type": "transfer", "from": "A", "to": "B", "amount": 5, "timestamp": 1.0}
+    assert encode_transaction(tx) == encode_transaction(dict(reversed(list(tx.items()))))
+
+def test_header_only_decode_matches_full_decode():
+    transactions = [_transaction(tx_type, fields) for tx_type, fields in TX_SCHEMAS[:5]]
+    header = encode_header(7, 1700000000.25, hashlib.sha256(b"prev").hexdigest(),
+                           hashlib.sha256(b"root").hexdigest(), "SuperNode_A", 12, 2 ** 40 + 3)
+    block_hash = hashlib.sha256(header).hexdigest()
+    data = encode_block_fields(header, block_hash, "cd" * 64, False, transactions, b"\x01\x02")
+    full = decode_block_fields(data)
+    header_only = decode_block_fields(data, with_transactions=False)
+    assert [tx.to_dict() for tx in full["transactions"]] == transactions
+    assert header_only["transactions"] == []
+    assert {k: v for k, v in full.items() if k != "transactions"} == \
+        {k: v for k, v in header_only.items() if k != "transactions"}
+    assert header_only["index"] == 7 and header_only["nonce"] == 2 ** 40 + 3
+    assert header_only["hash"] == block_hash and header_only["bloom"] == b"\x01\x02"
@@ -0,0 +1,32 @@
+"""从状态快照恢复的未完成支付：某个会话结清后不再作为未完成支付导出或被新会话接管"""
+import contextlib
+import gc
+import io
+
+import payment
+from payment import PaymentSystem, export_open_payments, restore_open_payments
+
+def _open_payment(payment_id, stage="delivery"):
+    return {"id": payment_id, "payer_id": "Merchant_1", "carrier_id": "Carrier_1", "total_amount": 100.0,
+            "stage_amounts": {}, "paid_amounts": {}, "current_stage": stage, "status": "pending",
+            "refund_info": None, "solution": {}}
+
+def test_settled_recovered_payment_is_not_exported(monkeypatch):
+    monkeypatch.setattr(payment, "check_logistics_status", lambda payment_id: {"current_stage": "delivery"})
+    monkeypatch.setattr(payment, "_recovered_payments", {})
+    restore_open_payments({"pay_1": _open_payment("pay_1"), "pay_2": _open_payment("pay_2")})
+    session_a = PaymentSystem()
+    session_b = PaymentSystem()
+    assert session_a.payments["pay_1"] is not session_b.payments["pay_1"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert session_a.advance_payment("pay_1")
+    assert session_a.payments["pay_1"]["status"] == "completed"
+    # 其他会话的副本不受影响，但已结清的支付不再导出
+    assert session_b.payments["pay_1"]["status"] == "pending"
+    assert set(export_open_payments()) == {"pay_2"}
+
+    del session_a, session_b
+    gc.collect()
+    assert set(export_open_payments()) == {"pay_2"}
+    assert "pay_1" not in PaymentSystem().payments
+    assert PaymentSystem().payments["pay_2"]["status"] == "pending"
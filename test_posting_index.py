@@ -0,0 +1,55 @@
+"""节点倒排索引：分页结果与按链上顺序逐条排列一致，且只读取含有该节点条目的分段"""
+import random
+
+import pytest
+
+from posting_index import PostingIndex
+
+def _fill(index, blocks, seed=7):
+    rng = random.Random(seed)
+    expected = {}
+    for block_index in range(blocks):
+        entries = [(f"Node_{rng.randrange(6)}", offset) for offset in range(rng.randrange(4))]
+        if block_index % 50 == 0:
+            entries.append(("Rare", len(entries)))
+        index.add_block(block_index, entries)
+        for node_id, offset in entries:
+            expected.setdefault(node_id, []).append((block_index, offset))
+    return expected
+
+def _pages_match(index, expected):
+    for node_id, items in expected.items():
+        newest_first = items[::-1]
+        assert index.counts[node_id] == len(items)
+        for offset in (0, 1, 3, len(items) - 2, len(items)):
+            for limit in (1, 5, 40):
+                assert index.page(node_id, offset, limit) == newest_first[offset:offset + limit]
+
+@pytest.mark.parametrize("stored", [False, True])
+def test_page_matches_chain_order(tmp_path, stored):
+    index = PostingIndex(str(tmp_path) if stored else None, blocks_per_segment=16, cache_segments=2)
+    expected = _fill(index, 400)
+    _pages_match(index, expected)
+
+    index.drop_through(100)
+    expected = {node_id: [item for item in items if item[0] > 100] for node_id, items in expected.items()}
+    _pages_match(index, {node_id: items for node_id, items in expected.items() if items})
+
+    if stored:
+        reopened = PostingIndex(str(tmp_path), blocks_per_segment=16, cache_segments=2)
+        reopened.restore(index.summary())
+        _pages_match(reopened, {node_id: items for node_id, items in expected.items() if items})
+
+def test_page_reads_only_segments_with_the_node(tmp_path):
+    index = PostingIndex(str(tmp_path), blocks_per_segment=10, cache_segments=1)
+    index.add_block(0, [("Old", 0)])
+    for block_index in range(1, 2000):
+        index.add_block(block_index, [("Busy", 0)])
+    reads = []
+    load = index._read_lines
+    index._read_lines = lambda segment: reads.append(segment) or load(segment)
+    assert index.page("Old") == [(0, 0)]
+    assert reads == [0]
+    reads.clear()
+    assert index.page("Busy", 1000, 10) == [(block_index, 0) for block_index in range(999, 989, -1)]
+    assert len(reads) <= 2
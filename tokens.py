@@ -1,48 +1,208 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable, Optional, Sequence
+import atexit
+import os
 import time
-from blockchain import blockchain
+import uuid
+from history_store import ColumnarHistory
+from ledger_service import LedgerService, Receipt, ledger
 
 class TokenSystem:
-    def __init__(self):
-        self.balances = {}
-        self.transactions = []
+    """
+    代币系统
+
+    余额不单独记账：账本的账户状态表由已确认区块增量维护，是余额的唯一来源，
+    这里只读取最近发布的 LedgerSnapshot（O(1)，一个区块内的多账户变动整体可见）。
+    初始发放、转账、奖励、碳补偿都只向账本提交交易，上链后计入余额；
+    转账在写线程内按可用余额（已确认余额减去待上链扣款）校验，连续转账不会透支。
+    
+    代币流水与碳补偿记录存入有界的列式历史（ColumnarHistory）：近期记录留在热尾部，
+    更早的按列溢出到 history_dir（未指定时丢弃），条数、碳减排量等统计在追加时累加。
+    指定 history_dir 时每个区块上链后、进程退出前将历史及其汇总落盘，重启后统计不会丢失。
+    """
+
+    # 账本未接受（被拒绝，或与池中已有交易重复、不会再执行一次）的回执状态
+    REFUSED = (Receipt.REJECTED, Receipt.DUPLICATE)
+
+    # 非原子批量转账时，迭代器按该笔数分段提交（与单个区块最多打包的交易数一致）
+    BATCH_CHUNK = 1000
+
+    TRANSACTION_COLUMNS = (("from", "s"), ("to", "s"), ("amount", "d"), ("type", "s"), ("timestamp", "d"))
+    CARBON_COLUMNS = (("carrier_id", "s"), ("emissions", "d"), ("compensation", "d"), ("timestamp", "d"),
+                      ("transport_type", "s"))
+
+    def __init__(self, service: Optional[LedgerService] = None, history_dir: Optional[str] = None,
+                 hot_size: int = 1000):
+        self.ledger = service or ledger
+        self.transactions = ColumnarHistory(
+            self.TRANSACTION_COLUMNS, os.path.join(history_dir, "transactions") if history_dir else None, hot_size)
         self.total_supply = 1000000
         self.carbon_price = 8
-        self.carbon_records = []
+        self.carbon_records = ColumnarHistory(
+            self.CARBON_COLUMNS, os.path.join(history_dir, "carbon") if history_dir else None, hot_size)
+        if history_dir:
+            # 每个区块上链后落盘一次，进程退出前再落盘一次
+            self.ledger.subscribe_commits(lambda block: self.flush_history())
+            atexit.register(self.flush_history)
+    
+    def flush_history(self) -> None:
+        """将代币流水与碳补偿记录（含汇总）写入 history_dir"""
+        self.transactions.flush()
+        self.carbon_records.flush()
     
     def init_balance(self, node_id: str, amount: float = 0) -> None:
-        if node_id not in self.balances:
-            self.balances[node_id] = amount
-            blockchain.add_transaction({"type": "init_balance", "node_id": node_id, "amount": amount})
+        self.ledger.call(self._init_balance, node_id, amount)
+    
+    def _init_balance(self, node_id: str, amount: float) -> None:
+        # 同一账户只发放一次：已上链的由账户状态判断，入池未上链的重复提交由交易池按内容去重
+        if node_id not in self.ledger.chain.token_accounts:
+            self.ledger.add_transaction({"type": "init_balance", "node_id": node_id, "amount": amount})
+    
+    @property
+    def balances(self) -> Dict[str, float]:
+        """已确认余额（账本快照，只读）"""
+        return self.ledger.snapshot().balances
     
     def get_balance(self, node_id: str) -> float:
         return self.balances.get(node_id, 0)
     
+    def get_available_balance(self, node_id: str) -> float:
+        """可用余额：已确认余额减去已提交、尚未上链的转出"""
+        snapshot = self.ledger.snapshot()
+        return snapshot.balances.get(node_id, 0) - snapshot.pending_debits.get(node_id, 0)
+    
+    def rebuild_balances(self) -> bool:
+        """从链上交易重建余额视图，并与全链扫描结果核对"""
+        return self.ledger.call(self._rebuild_balances)
+    
+    def _rebuild_balances(self) -> bool:
+        self.ledger.chain.rebuild_account_state()
+        return self.ledger.chain.verify_account_state()
+    
     def transfer(self, from_node: str, to_node: str, amount: float, tx_type: str = "transfer") -> bool:
-        if from_node not in self.balances or to_node not in self.balances:
-            return False
-        if self.balances[from_node] < amount:
+        """转账在账本写线程内执行，余额检查与扣减不会与其他会话交错"""
+        return self.ledger.call(self._transfer, from_node, to_node, amount, tx_type)
+    
+    def _transfer(self, from_node: str, to_node: str, amount: float, tx_type: str) -> bool:
+        if self._transfer_error(from_node, to_node, amount) is not None:
             return False
-        self.balances[from_node] -= amount
-        self.balances[to_node] += amount
-        tx = {"from": from_node, "to": to_node, "amount": amount, "type": tx_type, "timestamp": time.time()}
-        self.transactions.append(tx)
-        blockchain.add_transaction({"type": "token_transfer", "data": tx})
-        blockchain.mine_pending_transactions("SuperNode_A")
-        return True
+        receipt = self._submit_transfer({"from": from_node, "to": to_node, "amount": amount, "type": tx_type,
+                                         "timestamp": time.time()})
+        return receipt.status not in self.REFUSED
+    
+    def _transfer_error(self, from_node: str, to_node: str, amount: float, debited: float = 0.0) -> Optional[str]:
+        """转账校验（写线程内），返回拒绝原因；debited 为同一批次内该账户已通过校验的转出"""
+        chain = self.ledger.chain
+        if from_node not in chain.account_state or to_node not in chain.account_state:
+            return "unknown account"
+        if not isinstance(amount, (int, float)) or not amount > 0:  # 同时拒绝 NaN
+            return "invalid amount"
+        if chain.available_balance(from_node) - debited < amount:
+            return "insufficient balance"
+        return None
+    
+    def _submit_transfer(self, tx: Dict[str, Any], tx_type: str = "token_transfer") -> Receipt:
+        """向账本提交代币交易（写线程内，回执的拒绝状态已确定），账本接受后才记入流水"""
+        receipt = self.ledger.add_transaction({"type": tx_type, "data": tx})
+        if receipt.status not in self.REFUSED:
+            self.transactions.append(tx)
+        return receipt
+    
+    def batch_transfer(self, transfers: Iterable[Sequence], atomic: bool = True, wait: bool = False) -> Dict[str, Any]:
+        """
+        批量转账：整批在账本写线程内一次校验并入池，由出块线程封装为一个或少数几个区块，
+        不必逐笔往返写线程、逐笔等待出块
+        
+        Args:
+            transfers: (from, to, amount[, type]) 的列表或迭代器，type 默认为 "transfer"
+            atomic: True 时按可用余额整体校验（批内同一账户的转出累计扣减），全部通过才入池，
+                    任一笔失败则整批拒绝；False 时逐笔给出结果，迭代器按 BATCH_CHUNK 分段提交
+            wait: True 时封装全部待处理交易并等待上链后返回
+        
+        Returns:
+            {"batch_id", "committed": 入池笔数, "rejected": 拒绝笔数,
+             "results": [{"index", "ok", "tx_hash" 或 "error"}, ...]}（与输入顺序一致）
+        """
+        batch_id = uuid.uuid4().hex[:16]
+        if atomic:
+            results = self.ledger.call(self._batch_transfer, list(transfers), batch_id, 0, True)
+        else:
+            # 各段按入队顺序依次执行，后一段的校验能看到前一段的扣款
+            futures, chunk, offset = [], [], 0
+            for item in transfers:
+                chunk.append(item)
+                if len(chunk) >= self.BATCH_CHUNK:
+                    futures.append(self.ledger.submit(self._batch_transfer, chunk, batch_id, offset, False))
+                    offset += len(chunk)
+                    chunk = []
+            if chunk:
+                futures.append(self.ledger.submit(self._batch_transfer, chunk, batch_id, offset, False))
+            results = [result for future in futures for result in future.result()]
+        if wait:
+            self.ledger.flush()
+        committed = sum(1 for result in results if result["ok"])
+        return {"batch_id": batch_id, "committed": committed, "rejected": len(results) - committed,
+                "results": results}
+    
+    def _batch_transfer(self, transfers: List[Sequence], batch_id: str, offset: int,
+                        atomic: bool) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+        accepted: List[Dict[str, Any]] = []
+        debited: Dict[str, float] = {}
+        now = time.time()
+        for index, item in enumerate(transfers, offset):
+            try:
+                from_node, to_node, amount, *rest = item
+                error = ("malformed transfer" if len(rest) > 1
+                         else self._transfer_error(from_node, to_node, amount, debited.get(from_node, 0.0)))
+            except (TypeError, ValueError):
+                error = "malformed transfer"
+            results.append({"index": index, "ok": error is None})
+            if error is not None:
+                results[-1]["error"] = error
+                continue
+            debited[from_node] = debited.get(from_node, 0.0) + amount
+            # 批次号与序号标明每笔转账所属的批次及其在批内的位置
+            accepted.append({"from": from_node, "to": to_node, "amount": amount,
+                             "type": rest[0] if rest else "transfer", "timestamp": now,
+                             "batch_id": batch_id, "seq": index})
+        
+        mempool = self.ledger.chain.mempool
+        if atomic and len(accepted) < len(results):
+            error = "batch rejected"
+        elif atomic and len(mempool) + len(accepted) > mempool.max_transactions:
+            error = "mempool full"
+        else:
+            error = None
+        if error is not None:
+            for result in results:
+                if result["ok"]:
+                    result.update(ok=False, error=error)
+            return results
+        
+        pending = iter(result for result in results if result["ok"])
+        for tx in accepted:
+            result = next(pending)
+            receipt = self._submit_transfer(tx)
+            if receipt.status in self.REFUSED:
+                result.update(ok=False, error=receipt.error)
+            else:
+                result["tx_hash"] = receipt.tx_hash
+        return results
     
     def reward_super_node(self, node_id: str, block_count: int) -> None:
+        self.ledger.call(self._reward_super_node, node_id, block_count)
+    
+    def _reward_super_node(self, node_id: str, block_count: int) -> None:
         reward = block_count * 10
-        self.balances[node_id] = self.balances.get(node_id, 0) + reward
         tx = {"from": "system", "to": node_id, "amount": reward, "type": "super_node_reward", "timestamp": time.time()}
-        self.transactions.append(tx)
-        blockchain.add_transaction({"type": "token_reward", "data": tx})
-        blockchain.mine_pending_transactions("SuperNode_A")
+        self._submit_transfer(tx, "token_reward")
     
     def compensate_carbon(self, carrier_id: str, carbon_amount: float) -> None:
         """处理碳补偿，字段改为 emissions 以匹配可视化"""
+        self.ledger.call(self._compensate_carbon, carrier_id, carbon_amount)
+    
+    def _compensate_carbon(self, carrier_id: str, carbon_amount: float) -> None:
         compensation = carbon_amount * self.carbon_price
-        self.balances[carrier_id] = self.balances.get(carrier_id, 0) + compensation
         record = {
             "carrier_id": carrier_id,
             "emissions": carbon_amount,  # 改为 emissions
@@ -50,47 +210,49 @@ class TokenSystem:
             "timestamp": time.time(),
             "transport_type": "sea"  # 默认值
         }
-        self.carbon_records.append(record)
         tx = {"from": "system", "to": carrier_id, "amount": compensation, "type": "carbon_compensation", "timestamp": time.time()}
-        self.transactions.append(tx)
-        blockchain.add_transaction({"type": "carbon_compensation", "data": tx})
-        blockchain.mine_pending_transactions("SuperNode_A")
+        if self._submit_transfer(tx, "carbon_compensation").status not in self.REFUSED:
+            self.carbon_records.append(record)
     
     def get_flow_data(self) -> List[Dict[str, Any]]:
-        return self.transactions[-10:] if len(self.transactions) >= 10 else self.transactions
+        return self.transactions.recent(10)
     
     def get_total_supply(self) -> float:
         return self.total_supply
     
     def get_circulation(self) -> float:
-        return sum(self.balances.values())
+        return self.ledger.snapshot().circulation
     
     def update_carbon_price(self, new_price: float) -> None:
         self.carbon_price = new_price
     
     def burn_tokens(self, amount: float) -> None:
+        self.ledger.call(self._burn_tokens, amount)
+    
+    def _burn_tokens(self, amount: float) -> None:
         self.total_supply -= amount
-        blockchain.add_transaction({"type": "burn_tokens", "amount": amount})
+        self.ledger.add_transaction({"type": "burn_tokens", "amount": amount})
     
     def get_stats(self) -> Dict[str, Any]:
-        avg_balance = sum(self.balances.values()) / len(self.balances) if self.balances else 0
-        carbon_offset = sum(record["emissions"] for record in self.carbon_records)  # 更新为 emissions
+        """O(1)：余额相关统计取自快照，流水与碳补偿统计取自历史记录的累计汇总"""
+        snapshot = self.ledger.snapshot()
+        accounts = len(snapshot.balances)
         return {
             "total_supply": self.total_supply,
-            "circulation": self.get_circulation(),
+            "circulation": snapshot.circulation,
             "carbon_price": self.carbon_price,
-            "active_users": len(self.balances),
-            "total_transactions": len(self.transactions),
-            "average_balance": avg_balance,
-            "latest_transaction": self.transactions[-1] if self.transactions else None,
-            "system_reserve": self.total_supply - self.get_circulation(),
-            "carbon_offset": carbon_offset
+            "active_users": accounts,
+            "total_transactions": self.transactions.count,
+            "average_balance": snapshot.circulation / accounts if accounts else 0,
+            "latest_transaction": self.transactions.latest(),
+            "system_reserve": self.total_supply - snapshot.circulation,
+            "carbon_offset": self.carbon_records.sums["emissions"]
         }
     
     def get_carbon_data(self) -> List[Dict[str, Any]]:
-        """获取碳补偿数据，默认数据已使用 emissions"""
-        if self.carbon_records:
-            return self.carbon_records
+        """获取近期碳补偿数据（热尾部），默认数据已使用 emissions"""
+        if self.carbon_records.count:
+            return self.carbon_records.recent()
         default_data = [
             {"transport_type": "sea", "emissions": 100, "compensation": 800, "timestamp": time.time() - 86400 * i}
             for i in range(5)
@@ -103,4 +265,5 @@ class TokenSystem:
         ]
         return default_data
 
-token_system = TokenSystem()
\ No newline at end of file
+ledger_data_dir = os.getenv("LEDGER_DATA_DIR")
+token_system = TokenSystem(history_dir=os.path.join(ledger_data_dir, "history") if ledger_data_dir else None)
\ No newline at end of file